@@ -0,0 +1,151 @@
+# circuit_breaker.py
+# -*- coding: utf-8 -*-
+"""
+按端点共享的熔断器：连续失败达到阈值后进入 open 状态，冷却期内的调用立即失败（或由端点池转到其他端点），
+冷却结束后进入 half-open，放行少量探测请求，成功则恢复 closed，失败则重新 open。
+"""
+import logging
+import threading
+import time
+from typing import Callable, Optional
+from retry_policy import error_status_code, is_retryable_error
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+class CircuitOpenError(RuntimeError):
+    """端点处于熔断状态，调用未发出。"""
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"Circuit open for {name}, retry in {retry_in:.1f}s.")
+        self.name = name
+        self.retry_in = retry_in
+
+# 状态变化的回调 callback(name, old_state, new_state)，例如界面日志
+_listeners = []
+
+def add_state_listener(callback: Callable[[str, str, str], None]):
+    if callback not in _listeners:
+        _listeners.append(callback)
+
+def remove_state_listener(callback: Callable[[str, str, str], None]):
+    if callback in _listeners:
+        _listeners.remove(callback)
+
+class CircuitBreaker:
+    """
+    线程安全的熔断器。调用方在请求前调用 before_call，结束后调用 settle 计数；
+    只有“端点不可用”类的失败（超时、连接错误、5xx）会累计到 failure_threshold。
+    """
+    def __init__(self, name: str, failure_threshold: int = 3, recovery_seconds: float = 60,
+                 half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.recovery_seconds = float(recovery_seconds)
+        self.half_open_max_calls = max(1, int(half_open_max_calls))
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """当前是否可能放行请求（open 且冷却未结束时为 False），供端点池排序使用。"""
+        with self._lock:
+            return self.state != OPEN or time.monotonic() - self.opened_at >= self.recovery_seconds
+
+    def before_call(self):
+        """请求发出前调用；熔断中抛出 CircuitOpenError。"""
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self.recovery_seconds - (time.monotonic() - self.opened_at)
+                if remaining > 0:
+                    raise CircuitOpenError(self.name, remaining)
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_max_calls:
+                    raise CircuitOpenError(self.name, 0)
+                self._probes += 1
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            if self.state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                self._open()
+            elif self.state == CLOSED and self.consecutive_failures >= self.failure_threshold:
+                self._open()
+
+    def release(self):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+
+    def settle(self, status: str, error: Optional[Exception] = None):
+        """
+        按调用结果计数：超时、连接错误、5xx 等端点不可用的错误算失败；端点正常作出的响应
+        （含鉴权失败等致命错误）算成功；被取消的调用以及 429 限流（由限流器处理）只归还探测名额。
+        """
+        if status == "ok":
+            self.record_success()
+        elif error is None or error_status_code(error) == 429:
+            self.release()
+        elif is_retryable_error(error):
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def _open(self):
+        self.opened_at = time.monotonic()
+        self._transition(OPEN)
+
+    def _transition(self, new_state: str):
+        """在持锁状态下切换状态并通知监听者。"""
+        old_state, self.state = self.state, new_state
+        if new_state != HALF_OPEN:
+            self._probes = 0
+        if new_state == CLOSED:
+            self.consecutive_failures = 0
+        if old_state == new_state:
+            return
+        if new_state == OPEN:
+            logging.warning(f"Circuit for {self.name} opened after {self.consecutive_failures} consecutive failures; "
+                            f"failing fast for {self.recovery_seconds:g}s.")
+        else:
+            logging.info(f"Circuit for {self.name}: {old_state} -> {new_state}.")
+        for callback in list(_listeners):
+            try:
+                callback(self.name, old_state, new_state)
+            except Exception as e:
+                logging.debug(f"Circuit state listener failed: {e}")
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(key: tuple, name: str, enabled: bool = True, failure_threshold: int = 3,
+                        recovery_seconds: float = 60, half_open_max_calls: int = 1) -> Optional[CircuitBreaker]:
+    """
+    返回 key（端点 + 密钥）对应的共享熔断器；enabled 为 False 时返回 None。
+    配置变化时替换为新的熔断器。
+    """
+    if not enabled:
+        return None
+    settings = (max(1, int(failure_threshold)), float(recovery_seconds), max(1, int(half_open_max_calls)))
+    with _breakers_lock:
+        breaker = _breakers.get(key)
+        if breaker is None or (breaker.failure_threshold, breaker.recovery_seconds, breaker.half_open_max_calls) != settings:
+            breaker = CircuitBreaker(name, *settings)
+            _breakers[key] = breaker
+        return breaker
+
+def circuit_states() -> dict:
+    """返回 {端点名: 状态}，供界面或诊断查看。"""
+    with _breakers_lock:
+        return {breaker.name: breaker.state for breaker in _breakers.values()}
@@ -1,10 +1,17 @@
 # embedding_adapters.py
 # -*- coding: utf-8 -*-
+import hashlib
 import logging
+import threading
 import traceback
 from typing import List
-import requests
-from langchain_openai import AzureOpenAIEmbeddings, OpenAIEmbeddings
+from urllib.parse import urlsplit
+from circuit_breaker import get_circuit_breaker
+from embedding_cache import embedding_key, get_embedding_cache, get_query_cache
+from mock_llm import get_mock_backend
+from rate_limiter import estimate_tokens
+from retry_policy import is_retryable_error
+# requests 与 langchain_openai 在选中对应接口的适配器内部才导入，见 llm_adapters.py 顶部说明
 
 def ensure_openai_base_url_has_v1(url: str) -> str:
     """
@@ -19,31 +26,170 @@ def ensure_openai_base_url_has_v1(url: str) -> str:
             url = url.rstrip('/') + '/v1'
     return url
 
+# ============== 按端点共享的 HTTP 会话 ==============
+# 直接发 HTTP 请求的适配器（Ollama、LM Studio、Gemini、SiliconFlow）通过同一端点共享的 requests.Session
+# 复用 keep-alive 连接，避免每次嵌入都重新建立 TCP / TLS 连接；连接池大小、超时与重试可配置。
+DEFAULT_HTTP_SETTINGS = {
+    "pool_size": 10,
+    "connect_timeout": 10,
+    "read_timeout": 120,
+    "retries": 2,
+    "backoff_factor": 0.5,
+}
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def get_http_session(url: str, settings: dict):
+    """返回 url 所在主机（scheme://host:port）与 settings 对应的共享 Session，不存在时创建。"""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    parsed = urlsplit(url)
+    key = (parsed.scheme, parsed.netloc, settings["pool_size"], settings["retries"], settings["backoff_factor"])
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            # 嵌入请求是幂等的，POST 也可以安全重试；最终仍失败时返回原响应，交给 raise_for_status 处理
+            retry = Retry(
+                total=int(settings["retries"]),
+                backoff_factor=float(settings["backoff_factor"]),
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset({"POST"}),
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=int(settings["pool_size"]), max_retries=retry)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[key] = session
+        return session
+
+def close_http_sessions():
+    """关闭所有共享会话（例如修改了代理配置后）。"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
 class BaseEmbeddingAdapter:
     """
-    Embedding 接口统一基类
+    Embedding 接口统一基类。子类实现 _embed_documents / _embed_query；
+    公共的 embed_documents / embed_query 在外层按端点熔断。
     """
+    # 由 create_embedding_adapter 按端点注入的共享熔断器
+    circuit_breaker = None
+    # 批量接口每个请求的最大条数与估算 token 数，可由 embedding_configs.<接口>.batch 覆盖
+    batch_max_items = 32
+    batch_max_tokens = 8000
+    # 连接池与超时设置，可由 embedding_configs.<接口>.http 覆盖
+    http_settings = DEFAULT_HTTP_SETTINGS
+    # 批量导入调度器（embedding_scheduler.py）的并发与延迟目标，可由 embedding_configs.<接口>.bulk 覆盖
+    bulk_settings = {}
+    # 模型指纹 {"identity", "interface", "base_url", "model"}，由 create_embedding_adapter 设置
+    fingerprint = None
+
+    def _post(self, url: str, **kwargs):
+        """经共享会话发出 POST，带连接/读取超时。"""
+        settings = self.http_settings
+        session = get_http_session(url, settings)
+        kwargs.setdefault("timeout", (float(settings["connect_timeout"]), float(settings["read_timeout"])))
+        return session.post(url, **kwargs)
+
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        raise NotImplementedError
+        return self._guarded(self._embed_documents, texts, empty=not texts)
 
     def embed_query(self, query: str) -> List[float]:
+        return self._guarded(self._embed_query, query, empty=not query)
+
+    def _guarded(self, func, arg, empty: bool):
+        """
+        熔断中直接抛出 CircuitOpenError（上层的 call_with_retry 视为不可重试，立即返回兜底值）。
+        各适配器出错时多以空向量代替异常，因此对非空输入返回空结果也按失败计入熔断器。
+        """
+        breaker = self.circuit_breaker
+        if breaker is None:
+            return func(arg)
+        breaker.before_call()
+        status, failure = "cancelled", None
+        try:
+            result = func(arg)
+            status = "ok" if empty or _has_vectors(result) else "error"
+            return result
+        except Exception as e:
+            status, failure = "error", e
+            raise
+        finally:
+            if status == "error" and failure is None:
+                breaker.record_failure()
+            else:
+                breaker.settle(status, failure)
+
+    def _embed_documents(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    def _embed_query(self, query: str) -> List[float]:
         raise NotImplementedError
 
+    def _embed_in_batches(self, texts: List[str], embed_batch, embed_single) -> List[List[float]]:
+        """
+        按 batch_max_items / batch_max_tokens 把 texts 分批交给 embed_batch（失败时抛出异常），结果与输入一一对应。
+        某批因请求本身被拒（4xx，例如其中一条超长）失败时逐条调用 embed_single 定位出错的条目；
+        因超时、连接错误、5xx 失败时不再逐条重试，该批全部记为空向量。
+        """
+        results = [[] for _ in texts]
+        for start, batch in _split_batches(texts, self.batch_max_items, self.batch_max_tokens):
+            try:
+                vectors = embed_batch(batch)
+                if len(vectors) != len(batch):
+                    raise ValueError(f"Expected {len(batch)} embeddings, got {len(vectors)}.")
+            except Exception as e:
+                if is_retryable_error(e):
+                    logging.error(f"{type(self).__name__} batch of {len(batch)} failed: {e}")
+                    continue
+                logging.warning(f"{type(self).__name__} batch of {len(batch)} rejected ({e}), embedding items one by one.")
+                vectors = [embed_single(text) for text in batch]
+            results[start:start + len(batch)] = vectors
+        return results
+
+def _split_batches(texts: List[str], max_items: int, max_tokens: int):
+    """依次产出 (起始下标, 批次)；单条超过 token 上限时独占一批。"""
+    max_items = max(1, int(max_items))
+    start, batch, tokens = 0, [], 0
+    for index, text in enumerate(texts):
+        cost = estimate_tokens(text)
+        if batch and (len(batch) >= max_items or tokens + cost > max_tokens):
+            yield start, batch
+            start, batch, tokens = index, [], 0
+        batch.append(text)
+        tokens += cost
+    if batch:
+        yield start, batch
+
+def _has_vectors(result) -> bool:
+    """结果中至少有一个非空向量（embed_query 返回单个向量，embed_documents 返回向量列表）。"""
+    if not result:
+        return False
+    if isinstance(result[0], (list, tuple)):
+        return any(len(vector) > 0 for vector in result)
+    return True
+
 class OpenAIEmbeddingAdapter(BaseEmbeddingAdapter):
     """
     基于 OpenAIEmbeddings（或兼容接口）的适配器
     """
     def __init__(self, api_key: str, base_url: str, model_name: str):
+        from langchain_openai import OpenAIEmbeddings
         self._embedding = OpenAIEmbeddings(
             openai_api_key=api_key,
             openai_api_base=ensure_openai_base_url_has_v1(base_url),
             model=model_name
         )
 
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+    def _embed_documents(self, texts: List[str]) -> List[List[float]]:
         return self._embedding.embed_documents(texts)
 
-    def embed_query(self, query: str) -> List[float]:
+    def _embed_query(self, query: str) -> List[float]:
         return self._embedding.embed_query(query)
 
 class AzureOpenAIEmbeddingAdapter(BaseEmbeddingAdapter):
@@ -51,6 +197,7 @@ class AzureOpenAIEmbeddingAdapter(BaseEmbeddingAdapter):
     基于 AzureOpenAIEmbeddings（或兼容接口）的适配器
     """
     def __init__(self, api_key: str, base_url: str, model_name: str):
+        from langchain_openai import AzureOpenAIEmbeddings
         import re
         match = re.match(r'https://(.+?)/openai/deployments/(.+?)/embeddings\?api-version=(.+)', base_url)
         if match:
@@ -67,49 +214,67 @@ class AzureOpenAIEmbeddingAdapter(BaseEmbeddingAdapter):
             api_version=self.api_version,
         )
 
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+    def _embed_documents(self, texts: List[str]) -> List[List[float]]:
         return self._embedding.embed_documents(texts)
 
-    def embed_query(self, query: str) -> List[float]:
+    def _embed_query(self, query: str) -> List[float]:
         return self._embedding.embed_query(query)
 
 class OllamaEmbeddingAdapter(BaseEmbeddingAdapter):
     """
-    其接口路径为 /api/embeddings
+    批量嵌入使用 /api/embed，单条（及旧版 Ollama）使用 /api/embeddings
     """
+    batch_max_items = 64
+
     def __init__(self, model_name: str, base_url: str):
         self.model_name = model_name
         self.base_url = base_url.rstrip("/")
+        self._batch_supported = True
 
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        embeddings = []
-        for text in texts:
-            vec = self._embed_single(text)
-            embeddings.append(vec)
-        return embeddings
+    def _embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not self._batch_supported:
+            return [self._embed_single(text) for text in texts]
+        return self._embed_in_batches(texts, self._embed_batch, self._embed_single)
 
-    def embed_query(self, query: str) -> List[float]:
+    def _embed_query(self, query: str) -> List[float]:
         return self._embed_single(query)
 
+    def _server_root(self) -> str:
+        """去掉 base_url 中的 /api... 或 /v1... 后缀，得到 Ollama 服务根地址。"""
+        url = self.base_url.rstrip("/")
+        if "/api" in url:
+            return url[:url.index("/api")]
+        if "/v1" in url:
+            return url[:url.index("/v1")]
+        return url
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """调用 /api/embed（Ollama 0.3.4+），一次请求嵌入多条文本。"""
+        response = self._post(f"{self._server_root()}/api/embed", json={"model": self.model_name, "input": texts})
+        if response.status_code == 404:
+            # 旧版 Ollama 没有批量接口，之后改为逐条调用 /api/embeddings
+            self._batch_supported = False
+        response.raise_for_status()
+        result = response.json()
+        if "embeddings" not in result:
+            raise ValueError("No 'embeddings' field in Ollama response.")
+        return result["embeddings"]
+
     def _embed_single(self, text: str) -> List[float]:
         """
         调用 Ollama 本地服务 /api/embeddings 接口，获取文本 embedding
         """
+        import requests
         url = self.base_url.rstrip("/")
         if "/api/embeddings" not in url:
-            if "/api" in url:
-                url = f"{url}/embeddings"
-            else:
-                if "/v1" in url:
-                    url = url[:url.index("/v1")]
-                url = f"{url}/api/embeddings"
+            url = f"{self._server_root()}/api/embeddings"
 
         data = {
             "model": self.model_name,
             "prompt": text
         }
         try:
-            response = requests.post(url, json=data)
+            response = self._post(url, json=data)
             response.raise_for_status()
             result = response.json()
             if "embedding" not in result:
@@ -134,13 +299,14 @@ class MLStudioEmbeddingAdapter(BaseEmbeddingAdapter):
         }
         self.model_name = model_name
 
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+    def _embed_documents(self, texts: List[str]) -> List[List[float]]:
+        import requests
         try:
             payload = {
                 "input": texts,
                 "model": self.model_name
             }
-            response = requests.post(self.url, json=payload, headers=self.headers)
+            response = self._post(self.url, json=payload, headers=self.headers)
             response.raise_for_status()
             result = response.json()
             if "data" not in result:
@@ -154,13 +320,14 @@ class MLStudioEmbeddingAdapter(BaseEmbeddingAdapter):
             logging.error(f"Error parsing LM Studio API response: {str(e)}")
             return [[]] * len(texts)
 
-    def embed_query(self, query: str) -> List[float]:
+    def _embed_query(self, query: str) -> List[float]:
+        import requests
         try:
             payload = {
                 "input": query,
                 "model": self.model_name
             }
-            response = requests.post(self.url, json=payload, headers=self.headers)
+            response = self._post(self.url, json=payload, headers=self.headers)
             response.raise_for_status()
             result = response.json()
             if "data" not in result or not result["data"]:
@@ -179,7 +346,10 @@ class GeminiEmbeddingAdapter(BaseEmbeddingAdapter):
     基于 Google Generative AI (Gemini) 接口的 Embedding 适配器
     使用直接 POST 请求方式，URL 示例：
     https://generativelanguage.googleapis.com/v1beta/models/text-embedding-004:embedContent?key=YOUR_API_KEY
+    批量嵌入使用同一路径下的 :batchEmbedContents
     """
+    batch_max_items = 100
+
     def __init__(self, api_key: str, model_name: str, base_url: str):
         """
         :param api_key: 传入的 Google API Key
@@ -190,20 +360,30 @@ class GeminiEmbeddingAdapter(BaseEmbeddingAdapter):
         self.model_name = model_name
         self.base_url = base_url.rstrip("/")
 
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        embeddings = []
-        for text in texts:
-            vec = self._embed_single(text)
-            embeddings.append(vec)
-        return embeddings
+    def _embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed_in_batches(texts, self._embed_batch, self._embed_single)
 
-    def embed_query(self, query: str) -> List[float]:
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """调用 batchEmbedContents，一次请求嵌入多条文本（每批最多 100 条）。"""
+        url = f"{self.base_url}/{self.model_name}:batchEmbedContents?key={self.api_key}"
+        payload = {
+            "requests": [
+                {"model": f"models/{self.model_name}", "content": {"parts": [{"text": text}]}}
+                for text in texts
+            ]
+        }
+        response = self._post(url, json=payload)
+        response.raise_for_status()
+        return [item.get("values", []) for item in response.json().get("embeddings", [])]
+
+    def _embed_query(self, query: str) -> List[float]:
         return self._embed_single(query)
 
     def _embed_single(self, text: str) -> List[float]:
         """
         直接调用 Google Generative Language API (Gemini) 接口，获取文本 embedding
         """
+        import requests
         url = f"{self.base_url}/{self.model_name}:embedContent?key={self.api_key}"
         payload = {
             "model": self.model_name,
@@ -215,8 +395,7 @@ class GeminiEmbeddingAdapter(BaseEmbeddingAdapter):
         }
 
         try:
-            response = requests.post(url, json=payload)
-            print(response.text)
+            response = self._post(url, json=payload)
             response.raise_for_status()
             result = response.json()
             embedding_data = result.get("embedding", {})
@@ -248,32 +427,27 @@ class SiliconFlowEmbeddingAdapter(BaseEmbeddingAdapter):
             "Content-Type": "application/json"
         }
 
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        embeddings = []
-        for text in texts:
-            try:
-                self.payload["input"] = text
-                response = requests.post(self.url, json=self.payload, headers=self.headers)
-                response.raise_for_status()
-                result = response.json()
-                if not result or "data" not in result or not result["data"]:
-                    logging.error(f"Invalid response format from SiliconFlow API: {result}")
-                    embeddings.append([])
-                    continue
-                emb = result["data"][0].get("embedding", [])
-                embeddings.append(emb)
-            except requests.exceptions.RequestException as e:
-                logging.error(f"SiliconFlow API request failed: {str(e)}")
-                embeddings.append([])
-            except (KeyError, IndexError, ValueError, TypeError) as e:
-                logging.error(f"Error parsing SiliconFlow API response: {str(e)}")
-                embeddings.append([])
-        return embeddings
+    def _embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed_in_batches(texts, self._embed_batch, self._embed_query)
 
-    def embed_query(self, query: str) -> List[float]:
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """input 传入列表，一次请求嵌入多条文本；按返回的 index 对应回输入顺序，缺失的条目为空向量。"""
+        response = self._post(self.url, json=dict(self.payload, input=texts), headers=self.headers)
+        response.raise_for_status()
+        result = response.json()
+        if not result or "data" not in result:
+            raise ValueError(f"Invalid response format from SiliconFlow API: {result}")
+        vectors = [[] for _ in texts]
+        for position, item in enumerate(result["data"]):
+            index = item.get("index", position)
+            if 0 <= index < len(texts):
+                vectors[index] = item.get("embedding", [])
+        return vectors
+
+    def _embed_query(self, query: str) -> List[float]:
+        import requests
         try:
-            self.payload["input"] = query
-            response = requests.post(self.url, json=self.payload, headers=self.headers)
+            response = self._post(self.url, json=dict(self.payload, input=query), headers=self.headers)
             response.raise_for_status()
             result = response.json()
             if not result or "data" not in result or not result["data"]:
@@ -287,6 +461,121 @@ class SiliconFlowEmbeddingAdapter(BaseEmbeddingAdapter):
             logging.error(f"Error parsing SiliconFlow API response: {str(e)}")
             return []
 
+class MockEmbeddingAdapter(BaseEmbeddingAdapter):
+    """
+    离线模拟的 embedding（见 mock_llm.py）：按字符二元组哈希生成确定性向量，不访问网络。
+    """
+    def __init__(self, model_name: str):
+        self.model_name = model_name or "mock-embedding"
+
+    def _embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return get_mock_backend().embed(texts)
+
+    def _embed_query(self, query: str) -> List[float]:
+        return get_mock_backend().embed([query])[0]
+
+class LocalEmbeddingAdapter(BaseEmbeddingAdapter):
+    """
+    本地 CPU 推理（见 local_embedding.py），不访问网络。推理本身已按 batch_size 分批并使用多线程，
+    批量导入时调度器每次交给它较大的块；开启多进程时并发数与进程数一致。
+    """
+    batch_max_items = 512
+    batch_max_tokens = 200000
+
+    def __init__(self, model_name: str, settings: dict = None):
+        from local_embedding import LocalEncoder
+        self.encoder = LocalEncoder(model_name, settings)
+        self.model_name = self.encoder.model_name
+        self.bulk_settings = {"max_concurrency": max(1, self.encoder.processes)}
+
+    def _embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encoder.encode(texts)
+
+    def _embed_query(self, query: str) -> List[float]:
+        return self.encoder.encode([query])[0]
+
+class CachedEmbeddingAdapter(BaseEmbeddingAdapter):
+    """
+    包装任意 embedding 适配器：先查磁盘缓存（键为 接口 + 模型 + 文本），只把未命中的文本交给内层适配器；
+    检索用的查询向量另外先查进程内 LRU。cache / query_cache 均可为 None。其余属性透传给内层适配器。
+    """
+    def __init__(self, inner: BaseEmbeddingAdapter, cache, namespace: str, query_cache=None):
+        self.inner = inner
+        self.cache = cache
+        self.namespace = namespace
+        self.query_cache = query_cache
+
+    def __getattr__(self, name):
+        # 只有在本对象上找不到的属性才会走到这里
+        if name == "inner":
+            raise AttributeError(name)
+        return getattr(self.inner, name)
+
+    # 基类上的同名类属性会挡住 __getattr__，批量设置需显式取内层适配器的值
+    @property
+    def batch_max_items(self):
+        return self.inner.batch_max_items
+
+    @property
+    def batch_max_tokens(self):
+        return self.inner.batch_max_tokens
+
+    @property
+    def bulk_settings(self):
+        return self.inner.bulk_settings
+
+    def _embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.cache is None:
+            return self.inner.embed_documents(texts)
+        keys = [embedding_key(self.namespace, text) for text in texts]
+        found = self.cache.get_many(keys)
+        hits = sum(1 for key in keys if key in found)
+        missing = list(dict.fromkeys(key for key in keys if key not in found))
+        if missing:
+            text_by_key = dict(zip(keys, texts))
+            vectors = self.inner.embed_documents([text_by_key[key] for key in missing])
+            fresh = dict(zip(missing, vectors))
+            self.cache.put_many(fresh)
+            found.update(fresh)
+        if len(texts) > 1:
+            logging.info(f"Embedding cache: {hits}/{len(texts)} texts served from cache.")
+        return [found.get(key, []) for key in keys]
+
+    def _embed_query(self, query: str) -> List[float]:
+        if self.query_cache is not None:
+            vector = self.query_cache.get(self.namespace, query)
+            if vector is not None:
+                return vector
+        if self.cache is None:
+            vector = self.inner.embed_query(query)
+        else:
+            key = embedding_key(self.namespace, query)
+            found = self.cache.get_many([key])
+            vector = found[key] if key in found else self.inner.embed_query(query)
+            if key not in found:
+                self.cache.put_many({key: vector})
+        if self.query_cache is not None:
+            self.query_cache.put(self.namespace, query, vector)
+        return vector
+
+# ============== 各接口的附加设置 ==============
+# 来自 config.json 中 embedding_configs 的每个接口条目，键为小写接口名
+_interface_settings = {}
+
+def configure_embedding_adapters(embedding_configs: dict):
+    """
+    载入 config.json 的 embedding_configs，供 create_embedding_adapter 读取各接口的附加设置，例如：
+    "circuit_breaker": {"failure_threshold": 3, "recovery_seconds": 60, "half_open_max_calls": 1}，false 关闭熔断
+    "batch": {"max_items": 32, "max_tokens": 8000}  批量嵌入每个请求的条数与估算 token 上限
+    "http": {"pool_size": 10, "connect_timeout": 10, "read_timeout": 120, "retries": 2, "backoff_factor": 0.5}
+    "bulk": {"max_concurrency": 4, "target_latency": 10, "max_retries": 3}  导入知识库等批量嵌入的并发上限与目标单批耗时
+    "local": {"backend": "onnx", "batch_size": 64, "threads": 0, "processes": 0}  仅 Local 接口：本地推理后端与 CPU 并行度
+    """
+    _interface_settings.clear()
+    for name, conf in (embedding_configs or {}).items():
+        if isinstance(conf, dict):
+            _interface_settings[name.strip().lower()] = conf
+
 def create_embedding_adapter(
     interface_format: str,
     api_key: str,
@@ -294,9 +583,42 @@ def create_embedding_adapter(
     model_name: str
 ) -> BaseEmbeddingAdapter:
     """
-    工厂函数：根据 interface_format 返回不同的 embedding 适配器实例
+    工厂函数：根据 interface_format 返回不同的 embedding 适配器实例，
+    并挂上按端点 + 密钥共享的熔断器（embedding_configs.<接口>.circuit_breaker 为 false 时不挂）；
+    开启 embedding_cache 时外层再包一层磁盘缓存与查询向量 LRU。
     """
     fmt = interface_format.strip().lower()
+    settings = _interface_settings.get(fmt, {})
+    adapter = _build_embedding_adapter(fmt, interface_format, api_key, base_url, model_name, settings)
+    batch = settings.get("batch") or {}
+    if "max_items" in batch:
+        adapter.batch_max_items = int(batch["max_items"])
+    if "max_tokens" in batch:
+        adapter.batch_max_tokens = int(batch["max_tokens"])
+    if settings.get("http"):
+        adapter.http_settings = dict(DEFAULT_HTTP_SETTINGS, **settings["http"])
+    if settings.get("bulk"):
+        adapter.bulk_settings = dict(settings["bulk"])
+    breaker = settings.get("circuit_breaker", {})
+    if breaker is not False and fmt not in ("mock", "local"):
+        key = ("embedding", fmt, base_url, hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16])
+        adapter.circuit_breaker = get_circuit_breaker(key, f"Embedding {interface_format} {base_url or model_name}", **(breaker or {}))
+    identity = f"{fmt}|{getattr(adapter, 'model_name', model_name)}"
+    if fmt != "mock":
+        cache, query_cache = get_embedding_cache(), get_query_cache()
+        if cache is not None or query_cache is not None:
+            adapter = CachedEmbeddingAdapter(adapter, cache, identity, query_cache)
+    # 向量库据此记录是哪个模型生成了向量（见 vectorstore_utils 的模型指纹），并在需要时重建旧模型的适配器
+    adapter.fingerprint = {"identity": identity, "interface": interface_format, "base_url": base_url, "model": model_name}
+    return adapter
+
+def recreate_embedding_adapter(fingerprint: dict) -> BaseEmbeddingAdapter:
+    """按向量库记录的模型指纹重建适配器；API Key 取自 embedding_configs 中该接口的配置。"""
+    interface_format = fingerprint["interface"]
+    conf = _interface_settings.get(interface_format.strip().lower(), {})
+    return create_embedding_adapter(interface_format, conf.get("api_key", ""), fingerprint.get("base_url", ""), fingerprint["model"])
+
+def _build_embedding_adapter(fmt, interface_format, api_key, base_url, model_name, settings) -> BaseEmbeddingAdapter:
     if fmt == "openai":
         return OpenAIEmbeddingAdapter(api_key, base_url, model_name)
     elif fmt == "azure openai":
@@ -309,5 +631,9 @@ def create_embedding_adapter(
         return GeminiEmbeddingAdapter(api_key, model_name, base_url)
     elif fmt == "siliconflow":
         return SiliconFlowEmbeddingAdapter(api_key, base_url, model_name)
+    elif fmt == "mock":
+        return MockEmbeddingAdapter(model_name)
+    elif fmt == "local":
+        return LocalEmbeddingAdapter(model_name, settings.get("local"))
     else:
         raise ValueError(f"Unknown embedding interface_format: {interface_format}")
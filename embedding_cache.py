@@ -0,0 +1,245 @@
+# embedding_cache.py
+# -*- coding: utf-8 -*-
+"""
+按内容寻址的 Embedding 磁盘缓存：键为 hash(接口, 模型, 文本)，向量以 float32 BLOB 存入 SQLite。
+重新定稿章节、清空后重新导入知识库、重建向量库时，未变化的文本不再调用 embedding 接口。
+带条目数 / 总大小两种 LRU 上限与命中统计。
+另有进程内的查询向量 LRU（QueryEmbeddingLRU），让检索时反复出现的人物、地点等关键词查询不必再走网络。
+"""
+import array
+import hashlib
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+# 进程级缓存设置，由 configure_embedding_cache 根据 config.json 的 "embedding_cache" 段落更新
+_settings = {
+    "enabled": False,
+    "path": os.path.join("cache", "embedding_cache.sqlite3"),
+    "max_entries": 200000,
+    "max_size_mb": 1024,
+    "query_cache_size": 1024,
+}
+_caches = {}
+_caches_lock = threading.Lock()
+_query_cache = None
+
+def configure_embedding_cache(enabled: bool = False, path: Optional[str] = None, max_entries: int = 200000,
+                              max_size_mb: float = 1024, query_cache_size: int = 1024):
+    """更新缓存设置；已打开的缓存实例会同步新的淘汰阈值。query_cache_size 为 0 时关闭查询向量 LRU。"""
+    _settings.update(
+        enabled=bool(enabled),
+        path=path or _settings["path"],
+        max_entries=int(max_entries),
+        max_size_mb=float(max_size_mb),
+        query_cache_size=int(query_cache_size)
+    )
+    with _caches_lock:
+        for cache in _caches.values():
+            cache.max_entries = _settings["max_entries"]
+            cache.max_bytes = int(_settings["max_size_mb"] * 1024 * 1024)
+        if _query_cache is not None:
+            _query_cache.resize(_settings["query_cache_size"])
+
+def get_query_cache():
+    """返回进程内共享的查询向量 LRU；query_cache_size 为 0 时返回 None。"""
+    global _query_cache
+    if _settings["query_cache_size"] <= 0:
+        return None
+    with _caches_lock:
+        if _query_cache is None:
+            _query_cache = QueryEmbeddingLRU(_settings["query_cache_size"])
+        return _query_cache
+
+def _app_dir() -> str:
+    """程序所在目录：打包版本为 exe 所在目录，源码运行时为本文件所在目录。"""
+    if getattr(sys, "frozen", False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
+
+def get_embedding_cache():
+    """
+    返回共享的缓存实例；未开启或无法打开时返回 None。
+    相对路径按程序所在目录解析，不随启动时的工作目录变化。
+    """
+    if not _settings["enabled"]:
+        return None
+    db_path = os.path.abspath(os.path.join(_app_dir(), _settings["path"]))
+    with _caches_lock:
+        cache = _caches.get(db_path)
+        if cache is None:
+            try:
+                cache = EmbeddingCache(db_path, max_entries=_settings["max_entries"], max_size_mb=_settings["max_size_mb"])
+            except Exception as e:
+                logging.warning(f"Failed to open embedding cache {db_path}: {e}")
+                return None
+            _caches[db_path] = cache
+        return cache
+
+def embedding_key(namespace: str, text: str) -> str:
+    """namespace 为 "接口|模型"，与文本一起取 sha256。"""
+    return hashlib.sha256(f"{namespace}\x00{text}".encode("utf-8")).hexdigest()
+
+def _pack(vector: List[float]) -> bytes:
+    return array.array("f", vector).tobytes()
+
+def _unpack(blob: bytes) -> List[float]:
+    values = array.array("f")
+    values.frombytes(blob)
+    return values.tolist()
+
+def normalize_query(text: str) -> str:
+    """查询文本的归一化：去掉首尾空白并把连续空白折叠为一个空格。"""
+    return " ".join(text.split())
+
+class QueryEmbeddingLRU:
+    """线程安全的 (命名空间, 归一化查询) → 向量 LRU，带命中统计。"""
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max(1, int(max_entries))
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, query: str) -> Optional[List[float]]:
+        key = (namespace, normalize_query(query))
+        with self._lock:
+            vector = self._items.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, namespace: str, query: str, vector: List[float]):
+        if not vector:
+            return
+        key = (namespace, normalize_query(query))
+        with self._lock:
+            self._items[key] = vector
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def resize(self, max_entries: int):
+        with self._lock:
+            self.max_entries = max(1, int(max_entries))
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._items),
+            }
+
+class EmbeddingCache:
+    """
+    基于 SQLite 的 文本→向量 缓存。按最近访问时间淘汰；为减少写放大，
+    访问时间与淘汰检查在批量读写时一次完成，而不是逐条提交。
+    """
+    def __init__(self, db_path: str, max_entries: int = 200000, max_size_mb: float = 1024):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_accessed ON embeddings(accessed_at)")
+        self._conn.commit()
+        self._evict()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """返回 {key: 向量}，只包含命中的键。"""
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        now = time.time()
+        with self._lock:
+            # SQLite 单条语句的参数个数有限（旧版本为 999），分段查询
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = _unpack(blob)
+            if found:
+                self._conn.executemany("UPDATE embeddings SET accessed_at = ? WHERE key = ?", [(now, key) for key in found])
+                self._conn.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        """写入 {key: 向量}；空向量（嵌入失败）不缓存。"""
+        rows = []
+        now = time.time()
+        for key, vector in items.items():
+            if vector:
+                blob = _pack(vector)
+                rows.append((key, blob, len(blob), now))
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, size, accessed_at) VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+        self._evict()
+
+    def stats(self) -> dict:
+        """命中统计与当前占用。"""
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embeddings").fetchone()
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": entries,
+                "size_mb": size / 1024 / 1024,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+
+    def _evict(self):
+        """按条目数、总大小依次淘汰，均按最近访问时间从旧到新删除。"""
+        with self._lock:
+            if self.max_entries > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    "SELECT key FROM embeddings ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+            if self.max_bytes > 0:
+                total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+                if total > self.max_bytes:
+                    rows = self._conn.execute("SELECT key, size FROM embeddings ORDER BY accessed_at ASC").fetchall()
+                    stale = []
+                    for key, size in rows:
+                        if total <= self.max_bytes:
+                            break
+                        stale.append((key,))
+                        total -= size
+                    self._conn.executemany("DELETE FROM embeddings WHERE key = ?", stale)
+            self._conn.commit()
@@ -0,0 +1,160 @@
+# embedding_scheduler.py
+# -*- coding: utf-8 -*-
+"""
+批量导入用的 embedding 调度器：把大量分段切成按条数 / 估算 token 限定的批次，在有界线程池中并发嵌入，
+并按观测到的延迟与限流/失败信号自适应调整批大小与并发度（加性增、乘性减），结果按输入顺序交给写入方。
+"""
+import contextvars
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, List, Optional
+from rate_limiter import estimate_tokens
+from retry_policy import RetryPolicy, error_status_code, is_retryable_error
+
+# 可由 embedding_configs.<接口>.bulk 覆盖
+DEFAULT_BULK_SETTINGS = {
+    "max_concurrency": 4,
+    "target_latency": 10,
+    "max_retries": 3,
+}
+
+class _Batch:
+    """一个批次：vectors 与 texts 一一对应，空向量表示尚未成功。"""
+    def __init__(self, start: int, texts: List[str]):
+        self.start = start
+        self.texts = texts
+        self.vectors = [[] for _ in texts]
+        self.attempts = 0
+        self.error = None
+
+    def missing(self) -> List[int]:
+        return [i for i, vector in enumerate(self.vectors) if not vector]
+
+class EmbeddingScheduler:
+    """
+    用法：EmbeddingScheduler(adapter).run(texts, on_batch)，on_batch(start, texts, vectors) 在调用线程中
+    按 start 递增的顺序被调用，嵌入失败的条目对应空向量；on_batch 返回 False 时停止调度，
+    等在途批次结束后返回，之后的结果不再交付。
+
+    自适应规则：批次耗时低于 target_latency 的一半时逐步放大批次、每完成一轮（与当前并发数相同的批次）
+    并发度加一；耗时超过 target_latency 时批次减半；批次抛出 429 / 可重试错误，或返回了空向量
+    （各适配器多把限流、超时记为空向量）时并发度与批次同时减半，并按退避时间只重试缺失的条目。
+    """
+    def __init__(self, adapter, max_concurrency: Optional[int] = None, target_latency: Optional[float] = None,
+                 max_retries: Optional[int] = None, max_items: Optional[int] = None, max_tokens: Optional[int] = None):
+        settings = dict(DEFAULT_BULK_SETTINGS, **(getattr(adapter, "bulk_settings", None) or {}))
+        self.adapter = adapter
+        self.max_concurrency = max(1, int(max_concurrency or settings["max_concurrency"]))
+        self.target_latency = float(target_latency or settings["target_latency"])
+        self.policy = RetryPolicy(max_retries=int(max_retries or settings["max_retries"]), base_delay=2.0)
+        self.max_items = max(1, int(max_items or getattr(adapter, "batch_max_items", 32)))
+        self.max_tokens = max(1, int(max_tokens or getattr(adapter, "batch_max_tokens", 8000)))
+        # 从保守的起点开始，按观测结果增长
+        self.concurrency = min(2, self.max_concurrency)
+        self.batch_items = max(1, self.max_items // 2)
+        self._streak = 0
+
+    def run(self, texts: List[str], on_batch: Callable[[int, List[str], List[List[float]]], None]) -> dict:
+        """嵌入全部 texts 并按顺序回调 on_batch，返回统计信息。"""
+        started = time.monotonic()
+        stats = {"segments": len(texts), "batches": 0, "retries": 0, "failed": 0}
+        retry_queue = []
+        finished = {}
+        position = 0
+        next_start = 0
+        running = {}
+        stopped = False
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            while running or (not stopped and (position < len(texts) or retry_queue)):
+                while not stopped and len(running) < self.concurrency and (retry_queue or position < len(texts)):
+                    if retry_queue:
+                        batch, delay = retry_queue.pop(0)
+                    else:
+                        batch = _Batch(position, self._take(texts, position))
+                        position += len(batch.texts)
+                        delay = 0
+                    future = executor.submit(contextvars.copy_context().run, self._embed, batch, delay)
+                    running[future] = batch
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch = running.pop(future)
+                    latency = future.result()
+                    stats["batches"] += 1
+                    if batch.missing():
+                        self._on_congestion(batch)
+                        delay = self.policy.next_delay(batch.attempts, started, batch.error)
+                        if delay is not None:
+                            stats["retries"] += 1
+                            retry_queue.append((batch, delay))
+                            continue
+                        logging.warning(f"Embedding {len(batch.missing())}/{len(batch.texts)} segments starting at "
+                                        f"{batch.start} failed after {batch.attempts} attempts: {batch.error}")
+                        stats["failed"] += len(batch.missing())
+                    else:
+                        self._on_success(latency)
+                    finished[batch.start] = batch
+                # 写入方按输入顺序接收结果
+                while not stopped and next_start in finished:
+                    batch = finished.pop(next_start)
+                    if on_batch(batch.start, batch.texts, batch.vectors) is False:
+                        stopped = True
+                        stats["stopped_at"] = batch.start
+                    next_start += len(batch.texts)
+        stats.update(seconds=time.monotonic() - started, concurrency=self.concurrency, batch_items=self.batch_items)
+        if stopped:
+            logging.info(f"Embedding stopped by the writer at segment {stats['stopped_at']}.")
+        logging.info(f"Embedded {stats['segments']} segments in {stats['seconds']:.1f}s "
+                     f"({stats['batches']} batches, {stats['retries']} retries, {stats['failed']} failed, "
+                     f"final concurrency {self.concurrency}, batch size {self.batch_items}).")
+        return stats
+
+    def _take(self, texts: List[str], start: int) -> List[str]:
+        """从 start 起取一批：不超过当前批大小与 token 上限，单条超限时独占一批。"""
+        batch, tokens = [], 0
+        for text in texts[start:start + self.batch_items]:
+            cost = estimate_tokens(text)
+            if batch and tokens + cost > self.max_tokens:
+                break
+            batch.append(text)
+            tokens += cost
+        return batch
+
+    def _embed(self, batch: _Batch, delay: float) -> float:
+        """在工作线程中嵌入批次中缺失的条目，返回请求耗时（不含退避等待）。"""
+        if delay > 0:
+            time.sleep(delay)
+        missing = batch.missing()
+        batch.attempts += 1
+        started = time.monotonic()
+        try:
+            vectors = self.adapter.embed_documents([batch.texts[i] for i in missing])
+            for i, vector in zip(missing, vectors or []):
+                batch.vectors[i] = vector or []
+            batch.error = None
+        except Exception as e:
+            batch.error = e
+        return time.monotonic() - started
+
+    def _on_success(self, latency: float):
+        if latency > self.target_latency:
+            self.batch_items = max(1, self.batch_items // 2)
+            self._streak = 0
+            return
+        if latency < self.target_latency / 2:
+            self.batch_items = min(self.max_items, self.batch_items * 2)
+        self._streak += 1
+        if self._streak >= self.concurrency and self.concurrency < self.max_concurrency:
+            self.concurrency += 1
+            self._streak = 0
+
+    def _on_congestion(self, batch: _Batch):
+        error = batch.error
+        if error is not None and error_status_code(error) != 429 and not is_retryable_error(error):
+            # 致命错误（鉴权失败、熔断中等）与负载无关，不调整
+            return
+        self.concurrency = max(1, self.concurrency // 2)
+        self.batch_items = max(1, self.batch_items // 2)
+        self._streak = 0
+        logging.info(f"Embedding throttled or failed, backing off to concurrency {self.concurrency}, "
+                     f"batch size {self.batch_items}.")
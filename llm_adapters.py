@@ -1,14 +1,21 @@
 # llm_adapters.py
 # -*- coding: utf-8 -*-
+import asyncio
+import contextvars
+import hashlib
 import logging
-from typing import Optional
-from langchain_openai import ChatOpenAI, AzureChatOpenAI
-import google.generativeai as genai
-from azure.ai.inference import ChatCompletionsClient
-from azure.core.credentials import AzureKeyCredential
-from azure.ai.inference.models import SystemMessage, UserMessage
-from openai import OpenAI
-import requests
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Iterator, Optional
+from rate_limiter import estimate_tokens, get_rate_limiter, retry_after_seconds
+from retry_policy import is_retryable_error
+from circuit_breaker import CircuitOpenError, get_circuit_breaker
+from usage_ledger import begin_call, end_call, record_call, report_usage
+from mock_llm import get_mock_backend
+# 各服务商 SDK（langchain_openai、openai、azure、google）在选中对应接口的适配器内部才导入，
+# 界面启动与命令行工具不必为用不到的 SDK 付出加载时间
 
 
 def check_base_url(url: str) -> str:
@@ -30,18 +37,367 @@ def check_base_url(url: str) -> str:
             url = url.rstrip('/') + '/v1'
     return url
 
+# ============== 进程级客户端池 ==============
+# 同一 (接口格式, base_url, 模型, api_key 摘要, 超时) 共享一个底层 SDK 客户端，
+# 让 HTTP 连接池在各个生成阶段、各章之间保持复用；temperature / max_tokens 在每次调用时传入。
+_client_pool = {}
+_client_pool_lock = threading.Lock()
+
+def api_key_digest(api_key: str) -> str:
+    """返回 api_key 的短摘要，用作池键，避免明文密钥驻留在键里。"""
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+def get_pooled_client(key: tuple, factory: Callable[[], object]):
+    """
+    按 key 取出已缓存的 SDK 客户端；不存在时调用 factory 创建并缓存。
+    """
+    with _client_pool_lock:
+        client = _client_pool.get(key)
+        if client is None:
+            client = factory()
+            _client_pool[key] = client
+            logging.debug(f"Created pooled LLM client for {key[0]} / {key[2]}")
+        return client
+
+def clear_client_pool():
+    """清空客户端池（例如修改了代理或证书配置后）。"""
+    with _client_pool_lock:
+        _client_pool.clear()
+
+# ============== 在途请求合并（single-flight） ==============
+# 键与响应缓存相同（cache_key）：同一请求仍在途时，后来者挂到先发起的请求上共享结果，
+# 不再重复调用；与持久化缓存是否开启无关。
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+class FlightAbandoned(RuntimeError):
+    """先发起的请求被调用方中途取消（例如关闭了流），跟随者需自行重新请求。"""
+
+class _Flight:
+    """一次在途请求：领头的调用把分片依次追加到 chunks，跟随者按下标读取。"""
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.abandoned = False
+        self.condition = threading.Condition()
+
+    def publish(self, chunk: str):
+        with self.condition:
+            self.chunks.append(chunk)
+            self.condition.notify_all()
+
+    def finish(self, error: Optional[BaseException] = None, abandoned: bool = False):
+        with self.condition:
+            self.done = True
+            self.error = error
+            self.abandoned = abandoned
+            self.condition.notify_all()
+
+    def follow(self) -> Iterator[str]:
+        """依次产出领头请求的分片，直到它结束；领头请求失败时抛出同一异常。"""
+        index = 0
+        while True:
+            with self.condition:
+                while index >= len(self.chunks) and not self.done:
+                    self.condition.wait()
+                if index < len(self.chunks):
+                    chunk = self.chunks[index]
+                    index += 1
+                elif self.error is not None:
+                    raise self.error
+                elif self.abandoned:
+                    raise FlightAbandoned("The shared in-flight request was cancelled.")
+                else:
+                    return
+            yield chunk
+
+    def text(self) -> str:
+        return "".join(self.follow())
+
+def _join_flight(key: str) -> tuple:
+    """返回 (flight, 是否领头)：key 已有在途请求时挂上去，否则登记一个新的。"""
+    with _inflight_lock:
+        flight = _inflight.get(key)
+        if flight is not None:
+            return flight, False
+        flight = _Flight()
+        _inflight[key] = flight
+        return flight, True
+
+def _end_flight(key: str, flight: _Flight, error: Optional[BaseException] = None, abandoned: bool = False):
+    with _inflight_lock:
+        if _inflight.get(key) is flight:
+            del _inflight[key]
+    flight.finish(error, abandoned)
+
 class BaseLLMAdapter:
     """
     统一的 LLM 接口基类，为不同后端（OpenAI、Ollama、ML Studio、Gemini等）提供一致的方法签名。
+    子类实现 _invoke / _invoke_stream / _ainvoke；公共的 invoke / invoke_stream / ainvoke
+    在其外层统一处理限流、用量台账等横切逻辑。子类拿到响应（或流式分片）后调用 report_usage 上报用量。
+    开启 single_flight 时，与在途请求相同的调用直接共享其结果。
     """
+    interface_format = ""
+    # 为 True 时，调用异常仅记录日志并返回空结果（部分后端的既有行为）
+    swallow_errors = False
+    error_label = "LLM API 调用失败"
+    # 由 create_llm_adapter 按端点注入的共享限流器与熔断器
+    rate_limiter = None
+    circuit_breaker = None
+    # 由 create_llm_adapter 对交给调用方的适配器开启（池内成员不开启，避免与外层重复登记）
+    single_flight = False
+
     def invoke(self, prompt: str) -> str:
-        raise NotImplementedError("Subclasses must implement .invoke(prompt) method.")
+        if not self.single_flight:
+            return self._call(prompt)
+        key = self.cache_key(prompt)
+        flight, leader = _join_flight(key)
+        if not leader:
+            logging.info(f"{self.interface_format}: identical request in flight, waiting for its result.")
+            try:
+                return flight.text()
+            except FlightAbandoned:
+                return self.invoke(prompt)
+        try:
+            result = self._call(prompt)
+        except Exception as e:
+            _end_flight(key, flight, error=e)
+            raise
+        except BaseException:
+            _end_flight(key, flight, abandoned=True)
+            raise
+        flight.publish(result)
+        _end_flight(key, flight)
+        return result
+
+    def invoke_stream(self, prompt: str) -> Iterator[str]:
+        """流式调用，逐段产出增量文本。"""
+        if not self.single_flight:
+            yield from self._call_stream(prompt)
+            return
+        key = self.cache_key(prompt)
+        flight, leader = _join_flight(key)
+        if not leader:
+            logging.info(f"{self.interface_format}: identical request in flight, following its stream.")
+            received = False
+            try:
+                for chunk in flight.follow():
+                    received = True
+                    yield chunk
+                return
+            except FlightAbandoned:
+                # 已经输出了部分内容时不能无缝接续，交给上层重试
+                if received:
+                    raise
+            yield from self.invoke_stream(prompt)
+            return
+        try:
+            for chunk in self._call_stream(prompt):
+                flight.publish(chunk)
+                yield chunk
+        except Exception as e:
+            _end_flight(key, flight, error=e)
+            raise
+        except BaseException:
+            # 包括调用方提前关闭生成器（GeneratorExit）
+            _end_flight(key, flight, abandoned=True)
+            raise
+        _end_flight(key, flight)
+
+    async def ainvoke(self, prompt: str) -> str:
+        """异步调用，使多个请求可以在同一事件循环中并发等待。"""
+        if not self.single_flight:
+            return await self._acall(prompt)
+        key = self.cache_key(prompt)
+        flight, leader = _join_flight(key)
+        if not leader:
+            logging.info(f"{self.interface_format}: identical request in flight, waiting for its result.")
+            try:
+                return await asyncio.to_thread(flight.text)
+            except FlightAbandoned:
+                return await self.ainvoke(prompt)
+        try:
+            result = await self._acall(prompt)
+        except Exception as e:
+            _end_flight(key, flight, error=e)
+            raise
+        except BaseException:
+            _end_flight(key, flight, abandoned=True)
+            raise
+        flight.publish(result)
+        _end_flight(key, flight)
+        return result
+
+    def _admit(self, prompt: str):
+        """请求发出前依次通过熔断器与限流器；限流等待被中断时归还已占用的探测名额。"""
+        breaker = self.circuit_breaker
+        if breaker:
+            breaker.before_call()
+        limiter = self.rate_limiter
+        if limiter:
+            try:
+                limiter.acquire(estimate_tokens(prompt))
+            except BaseException:
+                if breaker:
+                    breaker.settle("cancelled")
+                raise
+        return breaker, limiter
+
+    async def _aadmit(self, prompt: str):
+        """_admit 的异步版本。"""
+        breaker = self.circuit_breaker
+        if breaker:
+            breaker.before_call()
+        limiter = self.rate_limiter
+        if limiter:
+            try:
+                await limiter.aacquire(estimate_tokens(prompt))
+            except BaseException:
+                if breaker:
+                    breaker.settle("cancelled")
+                raise
+        return breaker, limiter
+
+    def _call(self, prompt: str) -> str:
+        breaker, limiter = self._admit(prompt)
+        usage, token = begin_call()
+        started = time.monotonic()
+        result = ""
+        status, error_text = "cancelled", ""
+        failure = None
+        try:
+            result = self._invoke(prompt)
+            status = "ok"
+            return result
+        except Exception as e:
+            status, error_text, failure = "error", str(e), e
+            return self._handle_error(e)
+        finally:
+            end_call(token)
+            if breaker:
+                breaker.settle(status, failure)
+            elapsed = time.monotonic() - started
+            record_call(self, usage, estimate_tokens(prompt), estimate_tokens(result or ""), elapsed, elapsed, False, status, error_text)
+            if limiter:
+                limiter.release(estimate_tokens(result or ""))
+
+    def _call_stream(self, prompt: str) -> Iterator[str]:
+        breaker, limiter = self._admit(prompt)
+        usage, token = begin_call()
+        started = time.monotonic()
+        first_byte = None
+        produced = 0
+        status, error_text = "cancelled", ""
+        failure = None
+        try:
+            for chunk in self._invoke_stream(prompt):
+                if first_byte is None:
+                    first_byte = time.monotonic() - started
+                produced += len(chunk)
+                yield chunk
+            status = "ok"
+        except Exception as e:
+            status, error_text, failure = "error", str(e), e
+            # 流式调用可能已交出部分内容，吞掉错误会让上层把半截结果当作成功，因此总是抛出
+            self._handle_error(e)
+            raise
+        finally:
+            end_call(token)
+            if breaker:
+                breaker.settle(status, failure)
+            record_call(self, usage, estimate_tokens(prompt), produced // 3, time.monotonic() - started, first_byte, True, status, error_text)
+            if limiter:
+                limiter.release(produced // 3)
+
+    async def _acall(self, prompt: str) -> str:
+        breaker, limiter = await self._aadmit(prompt)
+        usage, token = begin_call()
+        started = time.monotonic()
+        result = ""
+        status, error_text = "cancelled", ""
+        failure = None
+        try:
+            result = await self._ainvoke(prompt)
+            status = "ok"
+            return result
+        except Exception as e:
+            status, error_text, failure = "error", str(e), e
+            return self._handle_error(e)
+        finally:
+            end_call(token)
+            if breaker:
+                breaker.settle(status, failure)
+            elapsed = time.monotonic() - started
+            record_call(self, usage, estimate_tokens(prompt), estimate_tokens(result or ""), elapsed, elapsed, False, status, error_text)
+            if limiter:
+                limiter.release(estimate_tokens(result or ""))
+
+    def _invoke(self, prompt: str) -> str:
+        raise NotImplementedError("Subclasses must implement ._invoke(prompt) method.")
+
+    def _invoke_stream(self, prompt: str) -> Iterator[str]:
+        """子类使用各自 SDK 的原生流式接口覆盖；默认实现退化为一次性返回完整结果。"""
+        result = self._invoke(prompt)
+        if result:
+            yield result
+
+    async def _ainvoke(self, prompt: str) -> str:
+        """子类基于各 SDK 自带的异步客户端覆盖；默认实现把同步调用放到线程池中执行。"""
+        return await asyncio.to_thread(self._invoke, prompt)
+
+    def _handle_error(self, error: Exception) -> str:
+        """
+        服务端要求退避（429/503 + Retry-After）时暂停该端点；
+        致命错误（鉴权、模型不存在、上下文超长等）总是抛出以便上层立即失败，其余按 swallow_errors 决定吞掉还是抛出。
+        """
+        wait = retry_after_seconds(error)
+        if wait is not None and self.rate_limiter:
+            logging.warning(f"{self.interface_format} endpoint asked to retry after {wait:.1f}s.")
+            self.rate_limiter.block_for(wait)
+        if self.swallow_errors and is_retryable_error(error):
+            logging.error(f"{self.error_label}: {error}")
+            return ""
+        raise error
+
+    def endpoint_key(self) -> tuple:
+        """端点身份（接口、地址、密钥摘要），限流、健康统计等按它共享状态。"""
+        return (self.interface_format, getattr(self, "base_url", ""), api_key_digest(self.api_key))
+
+    def pool_key(self) -> tuple:
+        """底层客户端的池键；不包含 temperature / max_tokens，它们按次传入。"""
+        return (
+            self.interface_format,
+            getattr(self, "client_base_url", getattr(self, "base_url", "")),
+            self.model_name,
+            api_key_digest(self.api_key),
+            self.timeout,
+        )
+
+    def cache_key(self, prompt: str) -> str:
+        """
+        请求的内容键：相同接口、地址、模型、temperature、max_tokens 与提示词得到相同的键。
+        供响应缓存等按“同一请求”去重的场景使用。
+        """
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        identity = "|".join(str(part) for part in (
+            self.interface_format,
+            getattr(self, "base_url", ""),
+            self.model_name,
+            self.temperature,
+            self.max_tokens,
+            prompt_hash,
+        ))
+        return hashlib.sha256(identity.encode("utf-8")).hexdigest()
 
 class DeepSeekAdapter(BaseLLMAdapter):
     """
     适配官方/OpenAI兼容接口（使用 langchain.ChatOpenAI）
     """
+    interface_format = "deepseek"
+
     def __init__(self, api_key: str, base_url: str, model_name: str, max_tokens: int, temperature: float = 0.7, timeout: Optional[int] = 600):
+        from langchain_openai import ChatOpenAI
         self.base_url = check_base_url(base_url)
         self.api_key = api_key
         self.model_name = model_name
@@ -49,27 +405,46 @@ class DeepSeekAdapter(BaseLLMAdapter):
         self.temperature = temperature
         self.timeout = timeout
 
-        self._client = ChatOpenAI(
+        self._client = get_pooled_client(self.pool_key(), lambda: ChatOpenAI(
             model=self.model_name,
             api_key=self.api_key,
             base_url=self.base_url,
             max_tokens=self.max_tokens,
             temperature=self.temperature,
-            timeout=self.timeout
-        )
+            timeout=self.timeout,
+            stream_usage=True  # 流式响应的最后一个分片附带用量，供用量台账使用
+        ))
 
-    def invoke(self, prompt: str) -> str:
-        response = self._client.invoke(prompt)
+    def _invoke(self, prompt: str) -> str:
+        response = self._client.invoke(prompt, temperature=self.temperature, max_tokens=self.max_tokens)
+        if not response:
+            logging.warning("No response from DeepSeekAdapter.")
+            return ""
+        report_usage(response)
+        return response.content
+
+    async def _ainvoke(self, prompt: str) -> str:
+        response = await self._client.ainvoke(prompt, temperature=self.temperature, max_tokens=self.max_tokens)
         if not response:
             logging.warning("No response from DeepSeekAdapter.")
             return ""
+        report_usage(response)
         return response.content
 
+    def _invoke_stream(self, prompt: str) -> Iterator[str]:
+        for chunk in self._client.stream(prompt, temperature=self.temperature, max_tokens=self.max_tokens):
+            report_usage(chunk)
+            if chunk.content:
+                yield chunk.content
+
 class OpenAIAdapter(BaseLLMAdapter):
     """
     适配官方/OpenAI兼容接口（使用 langchain.ChatOpenAI）
     """
+    interface_format = "openai"
+
     def __init__(self, api_key: str, base_url: str, model_name: str, max_tokens: int, temperature: float = 0.7, timeout: Optional[int] = 600):
+        from langchain_openai import ChatOpenAI
         self.base_url = check_base_url(base_url)
         self.api_key = api_key
         self.model_name = model_name
@@ -77,60 +452,112 @@ class OpenAIAdapter(BaseLLMAdapter):
         self.temperature = temperature
         self.timeout = timeout
 
-        self._client = ChatOpenAI(
+        self._client = get_pooled_client(self.pool_key(), lambda: ChatOpenAI(
             model=self.model_name,
             api_key=self.api_key,
             base_url=self.base_url,
             max_tokens=self.max_tokens,
             temperature=self.temperature,
-            timeout=self.timeout
-        )
+            timeout=self.timeout,
+            stream_usage=True  # 流式响应的最后一个分片附带用量，供用量台账使用
+        ))
 
-    def invoke(self, prompt: str) -> str:
-        response = self._client.invoke(prompt)
+    def _invoke(self, prompt: str) -> str:
+        response = self._client.invoke(prompt, temperature=self.temperature, max_tokens=self.max_tokens)
         if not response:
             logging.warning("No response from OpenAIAdapter.")
             return ""
+        report_usage(response)
         return response.content
 
+    async def _ainvoke(self, prompt: str) -> str:
+        response = await self._client.ainvoke(prompt, temperature=self.temperature, max_tokens=self.max_tokens)
+        if not response:
+            logging.warning("No response from OpenAIAdapter.")
+            return ""
+        report_usage(response)
+        return response.content
+
+    def _invoke_stream(self, prompt: str) -> Iterator[str]:
+        for chunk in self._client.stream(prompt, temperature=self.temperature, max_tokens=self.max_tokens):
+            report_usage(chunk)
+            if chunk.content:
+                yield chunk.content
+
 class GeminiAdapter(BaseLLMAdapter):
     """
     适配 Google Gemini (Google Generative AI) 接口
     """
+    interface_format = "gemini"
+    swallow_errors = True
+    error_label = "Gemini API 调用失败"
+
     def __init__(self, api_key: str, model_name: str, max_tokens: int, temperature: float = 0.7, timeout: Optional[int] = 600):
+        import google.generativeai as genai
         self.api_key = api_key
         self.model_name = model_name
         self.max_tokens = max_tokens
         self.temperature = temperature
         self.timeout = timeout
 
-        self._client = genai.Client(api_key=self.api_key)
+        self._client = get_pooled_client(self.pool_key(), lambda: genai.Client(api_key=self.api_key))
 
-    def invoke(self, prompt: str) -> str:
-        try:
-            response = self._client.models.generate_content(
-                model = self.model_name,
-                contents = prompt,
-                config = genai.types.GenerateContentConfig(
-                    max_output_tokens=self.max_tokens,
-                    temperature=self.temperature,
-                ),
-                timeout=self.timeout  # 添加超时参数
-            )
-            if response and response.text:
-                return response.text
-            else:
-                logging.warning("No text response from Gemini API.")
-                return ""
-        except Exception as e:
-            logging.error(f"Gemini API 调用失败: {e}")
+    def _invoke(self, prompt: str) -> str:
+        import google.generativeai as genai
+        response = self._client.models.generate_content(
+            model = self.model_name,
+            contents = prompt,
+            config = genai.types.GenerateContentConfig(
+                max_output_tokens=self.max_tokens,
+                temperature=self.temperature,
+            ),
+            timeout=self.timeout  # 添加超时参数
+        )
+        if response and response.text:
+            report_usage(response)
+            return response.text
+        else:
+            logging.warning("No text response from Gemini API.")
             return ""
 
+    async def _ainvoke(self, prompt: str) -> str:
+        import google.generativeai as genai
+        response = await self._client.aio.models.generate_content(
+            model=self.model_name,
+            contents=prompt,
+            config=genai.types.GenerateContentConfig(
+                max_output_tokens=self.max_tokens,
+                temperature=self.temperature,
+            )
+        )
+        if response and response.text:
+            report_usage(response)
+            return response.text
+        logging.warning("No text response from Gemini API.")
+        return ""
+
+    def _invoke_stream(self, prompt: str) -> Iterator[str]:
+        import google.generativeai as genai
+        for chunk in self._client.models.generate_content_stream(
+            model=self.model_name,
+            contents=prompt,
+            config=genai.types.GenerateContentConfig(
+                max_output_tokens=self.max_tokens,
+                temperature=self.temperature,
+            )
+        ):
+            report_usage(chunk)
+            if chunk and chunk.text:
+                yield chunk.text
+
 class AzureOpenAIAdapter(BaseLLMAdapter):
     """
     适配 Azure OpenAI 接口（使用 langchain.ChatOpenAI）
     """
+    interface_format = "azure openai"
+
     def __init__(self, api_key: str, base_url: str, model_name: str, max_tokens: int, temperature: float = 0.7, timeout: Optional[int] = 600):
+        from langchain_openai import AzureChatOpenAI
         import re
         match = re.match(r'https://(.+?)/openai/deployments/(.+?)/chat/completions\?api-version=(.+)', base_url)
         if match:
@@ -140,34 +567,54 @@ class AzureOpenAIAdapter(BaseLLMAdapter):
         else:
             raise ValueError("Invalid Azure OpenAI base_url format")
         
+        self.base_url = base_url
         self.api_key = api_key
         self.model_name = self.azure_deployment
         self.max_tokens = max_tokens
         self.temperature = temperature
         self.timeout = timeout
 
-        self._client = AzureChatOpenAI(
+        self._client = get_pooled_client(self.pool_key(), lambda: AzureChatOpenAI(
             azure_endpoint=self.azure_endpoint,
             azure_deployment=self.azure_deployment,
             api_version=self.api_version,
             api_key=self.api_key,
             max_tokens=self.max_tokens,
             temperature=self.temperature,
-            timeout=self.timeout
-        )
+            timeout=self.timeout,
+            stream_usage=True  # 流式响应的最后一个分片附带用量，供用量台账使用
+        ))
 
-    def invoke(self, prompt: str) -> str:
-        response = self._client.invoke(prompt)
+    def _invoke(self, prompt: str) -> str:
+        response = self._client.invoke(prompt, temperature=self.temperature, max_tokens=self.max_tokens)
+        if not response:
+            logging.warning("No response from AzureOpenAIAdapter.")
+            return ""
+        report_usage(response)
+        return response.content
+
+    async def _ainvoke(self, prompt: str) -> str:
+        response = await self._client.ainvoke(prompt, temperature=self.temperature, max_tokens=self.max_tokens)
         if not response:
             logging.warning("No response from AzureOpenAIAdapter.")
             return ""
+        report_usage(response)
         return response.content
 
+    def _invoke_stream(self, prompt: str) -> Iterator[str]:
+        for chunk in self._client.stream(prompt, temperature=self.temperature, max_tokens=self.max_tokens):
+            report_usage(chunk)
+            if chunk.content:
+                yield chunk.content
+
 class OllamaAdapter(BaseLLMAdapter):
     """
     Ollama 同样有一个 OpenAI-like /v1/chat 接口，可直接使用 ChatOpenAI。
     """
+    interface_format = "ollama"
+
     def __init__(self, api_key: str, base_url: str, model_name: str, max_tokens: int, temperature: float = 0.7, timeout: Optional[int] = 600):
+        from langchain_openai import ChatOpenAI
         self.base_url = check_base_url(base_url)
         self.api_key = api_key
         self.model_name = model_name
@@ -178,24 +625,44 @@ class OllamaAdapter(BaseLLMAdapter):
         if self.api_key == '':
             self.api_key= 'ollama'
 
-        self._client = ChatOpenAI(
+        self._client = get_pooled_client(self.pool_key(), lambda: ChatOpenAI(
             model=self.model_name,
             api_key=self.api_key,
             base_url=self.base_url,
             max_tokens=self.max_tokens,
             temperature=self.temperature,
             timeout=self.timeout
-        )
+        ))
 
-    def invoke(self, prompt: str) -> str:
-        response = self._client.invoke(prompt)
+    def _invoke(self, prompt: str) -> str:
+        response = self._client.invoke(prompt, temperature=self.temperature, max_tokens=self.max_tokens)
+        if not response:
+            logging.warning("No response from OllamaAdapter.")
+            return ""
+        report_usage(response)
+        return response.content
+
+    async def _ainvoke(self, prompt: str) -> str:
+        response = await self._client.ainvoke(prompt, temperature=self.temperature, max_tokens=self.max_tokens)
         if not response:
             logging.warning("No response from OllamaAdapter.")
             return ""
+        report_usage(response)
         return response.content
 
+    def _invoke_stream(self, prompt: str) -> Iterator[str]:
+        for chunk in self._client.stream(prompt, temperature=self.temperature, max_tokens=self.max_tokens):
+            report_usage(chunk)
+            if chunk.content:
+                yield chunk.content
+
 class MLStudioAdapter(BaseLLMAdapter):
+    interface_format = "ml studio"
+    swallow_errors = True
+    error_label = "ML Studio API 调用超时或失败"
+
     def __init__(self, api_key: str, base_url: str, model_name: str, max_tokens: int, temperature: float = 0.7, timeout: Optional[int] = 600):
+        from langchain_openai import ChatOpenAI
         self.base_url = check_base_url(base_url)
         self.api_key = api_key
         self.model_name = model_name
@@ -203,32 +670,49 @@ class MLStudioAdapter(BaseLLMAdapter):
         self.temperature = temperature
         self.timeout = timeout
 
-        self._client = ChatOpenAI(
+        self._client = get_pooled_client(self.pool_key(), lambda: ChatOpenAI(
             model=self.model_name,
             api_key=self.api_key,
             base_url=self.base_url,
             max_tokens=self.max_tokens,
             temperature=self.temperature,
             timeout=self.timeout
-        )
+        ))
 
-    def invoke(self, prompt: str) -> str:
-        try:
-            response = self._client.invoke(prompt)
-            if not response:
-                logging.warning("No response from MLStudioAdapter.")
-                return ""
-            return response.content
-        except Exception as e:
-            logging.error(f"ML Studio API 调用超时或失败: {e}")
+    def _invoke(self, prompt: str) -> str:
+        response = self._client.invoke(prompt, temperature=self.temperature, max_tokens=self.max_tokens)
+        if not response:
+            logging.warning("No response from MLStudioAdapter.")
             return ""
+        report_usage(response)
+        return response.content
+
+    async def _ainvoke(self, prompt: str) -> str:
+        response = await self._client.ainvoke(prompt, temperature=self.temperature, max_tokens=self.max_tokens)
+        if not response:
+            logging.warning("No response from MLStudioAdapter.")
+            return ""
+        report_usage(response)
+        return response.content
+
+    def _invoke_stream(self, prompt: str) -> Iterator[str]:
+        for chunk in self._client.stream(prompt, temperature=self.temperature, max_tokens=self.max_tokens):
+            report_usage(chunk)
+            if chunk.content:
+                yield chunk.content
 
 class AzureAIAdapter(BaseLLMAdapter):
     """
     适配 Azure AI Inference 接口，用于访问Azure AI服务部署的模型
     使用 azure-ai-inference 库进行API调用
     """
+    interface_format = "azure ai"
+    swallow_errors = True
+    error_label = "Azure AI Inference API 调用失败"
+
     def __init__(self, api_key: str, base_url: str, model_name: str, max_tokens: int, temperature: float = 0.7, timeout: Optional[int] = 600):
+        from azure.ai.inference import ChatCompletionsClient
+        from azure.core.credentials import AzureKeyCredential
         import re
         # 匹配形如 https://xxx.services.ai.azure.com/models/chat/completions?api-version=xxx 的URL
         match = re.match(r'https://(.+?)\.services\.ai\.azure\.com(?:/models)?(?:/chat/completions)?(?:\?api-version=(.+))?', base_url)
@@ -247,96 +731,652 @@ class AzureAIAdapter(BaseLLMAdapter):
         self.temperature = temperature
         self.timeout = timeout
 
-        self._client = ChatCompletionsClient(
+        self._client = get_pooled_client(self.pool_key(), lambda: ChatCompletionsClient(
             endpoint=self.endpoint,
             credential=AzureKeyCredential(self.api_key),
             model=self.model_name,
             temperature=self.temperature,
             max_tokens=self.max_tokens,
             timeout=self.timeout
-        )
+        ))
 
-    def invoke(self, prompt: str) -> str:
-        try:
-            response = self._client.complete(
-                messages=[
-                    SystemMessage("You are a helpful assistant."),
-                    UserMessage(prompt)
-                ]
-            )
-            if response and response.choices:
-                return response.choices[0].message.content
-            else:
-                logging.warning("No response from AzureAIAdapter.")
-                return ""
-        except Exception as e:
-            logging.error(f"Azure AI Inference API 调用失败: {e}")
+    def _invoke(self, prompt: str) -> str:
+        from azure.ai.inference.models import SystemMessage, UserMessage
+        response = self._client.complete(
+            messages=[
+                SystemMessage("You are a helpful assistant."),
+                UserMessage(prompt)
+            ],
+            temperature=self.temperature,
+            max_tokens=self.max_tokens
+        )
+        if response and response.choices:
+            report_usage(response)
+            return response.choices[0].message.content
+        else:
+            logging.warning("No response from AzureAIAdapter.")
             return ""
 
+    async def _ainvoke(self, prompt: str) -> str:
+        from azure.ai.inference.aio import ChatCompletionsClient as AsyncChatCompletionsClient
+        from azure.core.credentials import AzureKeyCredential
+        from azure.ai.inference.models import SystemMessage, UserMessage
+        async_client = get_pooled_client(self.pool_key() + ("async",), lambda: AsyncChatCompletionsClient(
+            endpoint=self.endpoint,
+            credential=AzureKeyCredential(self.api_key),
+            model=self.model_name,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            timeout=self.timeout
+        ))
+        response = await async_client.complete(
+            messages=[
+                SystemMessage("You are a helpful assistant."),
+                UserMessage(prompt)
+            ],
+            temperature=self.temperature,
+            max_tokens=self.max_tokens
+        )
+        if response and response.choices:
+            report_usage(response)
+            return response.choices[0].message.content
+        logging.warning("No response from AzureAIAdapter.")
+        return ""
+
+    def _invoke_stream(self, prompt: str) -> Iterator[str]:
+        from azure.ai.inference.models import SystemMessage, UserMessage
+        response = self._client.complete(
+            messages=[
+                SystemMessage("You are a helpful assistant."),
+                UserMessage(prompt)
+            ],
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            stream=True
+        )
+        for update in response:
+            report_usage(update)
+            if update.choices and update.choices[0].delta.content:
+                yield update.choices[0].delta.content
+
 # 火山引擎实现
 class VolcanoEngineAIAdapter(BaseLLMAdapter):
+    interface_format = "火山引擎"
+    swallow_errors = True
+    error_label = "火山引擎API调用超时或失败"
+
     def __init__(self, api_key: str, base_url: str, model_name: str, max_tokens: int, temperature: float = 0.7, timeout: Optional[int] = 600):
+        from openai import OpenAI
         self.base_url = check_base_url(base_url)
+        # 同步与异步客户端都沿用原始地址（不补 /v1），两者请求的端点一致
+        self.client_base_url = base_url
         self.api_key = api_key
         self.model_name = model_name
         self.max_tokens = max_tokens
         self.temperature = temperature
         self.timeout = timeout
 
-        self._client = OpenAI(
-            base_url=base_url,
+        self._client = get_pooled_client(self.pool_key(), lambda: OpenAI(
+            base_url=self.client_base_url,
             api_key=api_key,
             timeout=timeout  # 添加超时配置
+        ))
+    def _invoke(self, prompt: str) -> str:
+        response = self._client.chat.completions.create(
+            model=self.model_name,
+            messages=[
+                {"role": "system", "content": "你是DeepSeek，是一个 AI 人工智能助手"},
+                {"role": "user", "content": prompt},
+            ],
+            timeout=self.timeout  # 添加超时参数
         )
-    def invoke(self, prompt: str) -> str:
-        try:
-            response = self._client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": "你是DeepSeek，是一个 AI 人工智能助手"},
-                    {"role": "user", "content": prompt},
-                ],
-                timeout=self.timeout  # 添加超时参数
-            )
-            if not response:
-                logging.warning("No response from DeepSeekAdapter.")
-                return ""
-            return response.choices[0].message.content
-        except Exception as e:
-            logging.error(f"火山引擎API调用超时或失败: {e}")
+        if not response:
+            logging.warning("No response from DeepSeekAdapter.")
             return ""
+        report_usage(response)
+        return response.choices[0].message.content
+
+    async def _ainvoke(self, prompt: str) -> str:
+        from openai import AsyncOpenAI
+        async_client = get_pooled_client(self.pool_key() + ("async",), lambda: AsyncOpenAI(
+            base_url=self.client_base_url,
+            api_key=self.api_key,
+            timeout=self.timeout
+        ))
+        response = await async_client.chat.completions.create(
+            model=self.model_name,
+            messages=[
+                {"role": "system", "content": "你是DeepSeek，是一个 AI 人工智能助手"},
+                {"role": "user", "content": prompt},
+            ],
+            timeout=self.timeout
+        )
+        if not response:
+            logging.warning("No response from VolcanoEngineAIAdapter.")
+            return ""
+        report_usage(response)
+        return response.choices[0].message.content
+
+    def _invoke_stream(self, prompt: str) -> Iterator[str]:
+        response = self._client.chat.completions.create(
+            model=self.model_name,
+            messages=[
+                {"role": "system", "content": "你是DeepSeek，是一个 AI 人工智能助手"},
+                {"role": "user", "content": prompt},
+            ],
+            timeout=self.timeout,
+            stream=True
+        )
+        for chunk in response:
+            report_usage(chunk)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
 
 class SiliconFlowAdapter(BaseLLMAdapter):
+    interface_format = "硅基流动"
+    swallow_errors = True
+    error_label = "硅基流动API调用超时或失败"
+
     def __init__(self, api_key: str, base_url: str, model_name: str, max_tokens: int, temperature: float = 0.7, timeout: Optional[int] = 600):
+        from openai import OpenAI
         self.base_url = check_base_url(base_url)
+        # 同步与异步客户端都沿用原始地址（不补 /v1），两者请求的端点一致
+        self.client_base_url = base_url
         self.api_key = api_key
         self.model_name = model_name
         self.max_tokens = max_tokens
         self.temperature = temperature
         self.timeout = timeout
 
-        self._client = OpenAI(
-            base_url=base_url,
+        self._client = get_pooled_client(self.pool_key(), lambda: OpenAI(
+            base_url=self.client_base_url,
             api_key=api_key,
             timeout=timeout  # 添加超时配置
+        ))
+    def _invoke(self, prompt: str) -> str:
+        response = self._client.chat.completions.create(
+            model=self.model_name,
+            messages=[
+                {"role": "system", "content": "你是DeepSeek，是一个 AI 人工智能助手"},
+                {"role": "user", "content": prompt},
+            ],
+            timeout=self.timeout  # 添加超时参数
         )
-    def invoke(self, prompt: str) -> str:
-        try:
-            response = self._client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": "你是DeepSeek，是一个 AI 人工智能助手"},
-                    {"role": "user", "content": prompt},
-                ],
-                timeout=self.timeout  # 添加超时参数
-            )
-            if not response:
-                logging.warning("No response from DeepSeekAdapter.")
-                return ""
-            return response.choices[0].message.content
-        except Exception as e:
-            logging.error(f"硅基流动API调用超时或失败: {e}")
+        if not response:
+            logging.warning("No response from DeepSeekAdapter.")
+            return ""
+        report_usage(response)
+        return response.choices[0].message.content
+
+    async def _ainvoke(self, prompt: str) -> str:
+        from openai import AsyncOpenAI
+        async_client = get_pooled_client(self.pool_key() + ("async",), lambda: AsyncOpenAI(
+            base_url=self.client_base_url,
+            api_key=self.api_key,
+            timeout=self.timeout
+        ))
+        response = await async_client.chat.completions.create(
+            model=self.model_name,
+            messages=[
+                {"role": "system", "content": "你是DeepSeek，是一个 AI 人工智能助手"},
+                {"role": "user", "content": prompt},
+            ],
+            timeout=self.timeout
+        )
+        if not response:
+            logging.warning("No response from SiliconFlowAdapter.")
             return ""
+        report_usage(response)
+        return response.choices[0].message.content
+
+    def _invoke_stream(self, prompt: str) -> Iterator[str]:
+        response = self._client.chat.completions.create(
+            model=self.model_name,
+            messages=[
+                {"role": "system", "content": "你是DeepSeek，是一个 AI 人工智能助手"},
+                {"role": "user", "content": prompt},
+            ],
+            timeout=self.timeout,
+            stream=True
+        )
+        for chunk in response:
+            report_usage(chunk)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+class MockLLMAdapter(BaseLLMAdapter):
+    """
+    离线模拟接口（见 mock_llm.py）：不访问网络，按提示词返回确定性的、格式与真实输出一致的文本，
+    延迟分布与错误注入由进程内的 MockBackend 决定，用于无网络环境下的全流程基准与压测。
+    """
+    interface_format = "mock"
+
+    def __init__(self, api_key: str, base_url: str, model_name: str, max_tokens: int, temperature: float = 0.7, timeout: Optional[int] = 600):
+        self.base_url = base_url or "mock://local"
+        self.api_key = api_key
+        self.model_name = model_name or "mock-model"
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.timeout = timeout
+
+    def _invoke(self, prompt: str) -> str:
+        backend = get_mock_backend()
+        text = backend.complete(prompt, self.max_tokens)
+        report_usage({"usage": backend.usage(prompt, text)})
+        return text
+
+    async def _ainvoke(self, prompt: str) -> str:
+        backend = get_mock_backend()
+        text = await backend.acomplete(prompt, self.max_tokens)
+        report_usage({"usage": backend.usage(prompt, text)})
+        return text
+
+    def _invoke_stream(self, prompt: str) -> Iterator[str]:
+        backend = get_mock_backend()
+        parts = []
+        for chunk in backend.stream(prompt, self.max_tokens):
+            parts.append(chunk)
+            yield chunk
+        report_usage({"usage": backend.usage(prompt, "".join(parts))})
+
+# ============== 多端点池（故障转移 / 负载均衡） ==============
+class EndpointStats:
+    """
+    单个端点的进程级健康与延迟统计：在途请求数、EWMA 延迟、最近延迟样本（完整耗时与首字节耗时）、
+    连续失败次数与摘除截止时间。
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.outstanding = 0
+        self.ewma_latency = None
+        self.latencies = deque(maxlen=200)
+        self.first_byte_latencies = deque(maxlen=200)
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+
+    def begin(self):
+        with self.lock:
+            self.outstanding += 1
+
+    def success(self, latency: float, first_byte: Optional[float] = None):
+        with self.lock:
+            self.outstanding = max(0, self.outstanding - 1)
+            self.consecutive_failures = 0
+            self.latencies.append(latency)
+            if first_byte is not None:
+                self.first_byte_latencies.append(first_byte)
+            self.ewma_latency = latency if self.ewma_latency is None else 0.8 * self.ewma_latency + 0.2 * latency
+
+    def failure(self, eject_after: int, cooldown: float) -> bool:
+        """记录一次失败；连续失败达到 eject_after 次时摘除 cooldown 秒，返回是否被摘除。"""
+        with self.lock:
+            self.outstanding = max(0, self.outstanding - 1)
+            self.consecutive_failures += 1
+            if eject_after and self.consecutive_failures >= eject_after:
+                self.ejected_until = time.monotonic() + cooldown
+                self.consecutive_failures = 0
+                return True
+            return False
+
+    def cancelled(self):
+        with self.lock:
+            self.outstanding = max(0, self.outstanding - 1)
+
+    def available(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+    def latency_percentile(self, q: float, first_byte: bool = False) -> Optional[float]:
+        """最近样本的 q 分位延迟（q 取 0~1；first_byte 为 True 时取首字节耗时），样本不足时返回 None。"""
+        with self.lock:
+            samples = sorted(self.first_byte_latencies if first_byte else self.latencies)
+        if len(samples) < 5:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+_endpoint_stats = {}
+_endpoint_stats_lock = threading.Lock()
+
+def get_endpoint_stats(key: tuple) -> EndpointStats:
+    with _endpoint_stats_lock:
+        stats = _endpoint_stats.get(key)
+        if stats is None:
+            stats = EndpointStats()
+            _endpoint_stats[key] = stats
+        return stats
+
+# 平滑加权轮询的当前权重，按池（成员端点集合）共享
+_round_robin_weights = {}
+_round_robin_lock = threading.Lock()
+
+class PooledLLMAdapter(BaseLLMAdapter):
+    """
+    把同一接口下的多个 base_url / api_key 组合成一个适配器：
+    按加权轮询或最少在途请求选择端点，失败时转移到下一个端点，
+    连续失败的端点会被摘除一段冷却时间。对外的身份（缓存键等）与首个端点一致。
+    配置了 hedge 时，超过端点延迟分位数仍未返回的请求会向下一个端点发出对冲请求，先完成者胜出。
+    """
+    def __init__(self, members: list, strategy: str = "least_outstanding",
+                 eject_after_failures: int = 3, eject_seconds: float = 60, hedge: Optional[dict] = None):
+        primary = members[0][0]
+        self.interface_format = primary.interface_format
+        self.base_url = getattr(primary, "base_url", "")
+        self.api_key = primary.api_key
+        self.model_name = primary.model_name
+        self.max_tokens = primary.max_tokens
+        self.temperature = primary.temperature
+        self.timeout = primary.timeout
+        self.swallow_errors = primary.swallow_errors
+        self.error_label = primary.error_label
+        self.strategy = strategy
+        self.eject_after_failures = eject_after_failures
+        self.eject_seconds = eject_seconds
+        # {"mode": "stream" | "all", "percentile": 0.95, "min_delay": 2, "default_delay": 30, "max_hedges": 1}
+        self.hedge = hedge if hedge and hedge.get("enabled", True) else None
+        self.members = []
+        for adapter, weight in members:
+            # 由池统一决定是否吞掉异常，成员的异常需要上抛才能触发故障转移
+            adapter.swallow_errors = False
+            self.members.append((adapter, max(1, int(weight or 1)), get_endpoint_stats(adapter.endpoint_key())))
+        self._group_key = tuple(adapter.endpoint_key() for adapter, _, _ in self.members)
+
+    def _ordered_members(self) -> list:
+        """返回本次调用的尝试顺序：首选端点在前，被摘除的端点排在最后兜底。"""
+        healthy = [m for m in self.members if self._available(m)]
+        ejected = [m for m in self.members if not self._available(m)]
+        if not healthy:
+            return ejected
+        if self.strategy == "weighted_round_robin":
+            first = self._pick_weighted(healthy)
+        else:
+            first = min(healthy, key=lambda m: (m[2].outstanding, m[2].consecutive_failures, m[2].ewma_latency or 0.0))
+        rest = sorted((m for m in healthy if m is not first), key=lambda m: m[2].outstanding)
+        return [first] + rest + ejected
+
+    def _pick_weighted(self, healthy: list):
+        """平滑加权轮询（与 nginx 相同的算法）。"""
+        with _round_robin_lock:
+            current = _round_robin_weights.setdefault(self._group_key, {})
+            total = 0
+            best = None
+            for member in healthy:
+                key = member[0].endpoint_key()
+                current[key] = current.get(key, 0) + member[1]
+                total += member[1]
+                if best is None or current[key] > current[best[0].endpoint_key()]:
+                    best = member
+            current[best[0].endpoint_key()] -= total
+            return best
+
+    @staticmethod
+    def _available(member) -> bool:
+        """端点未被摘除，且其熔断器不处于 open 冷却期。"""
+        breaker = member[0].circuit_breaker
+        return member[2].available() and (breaker is None or breaker.available())
+
+    def _on_failure(self, adapter, stats: EndpointStats, error: Exception) -> bool:
+        """记录一次端点失败，返回是否值得转到下一个端点继续尝试。"""
+        if isinstance(error, CircuitOpenError):
+            # 熔断中的端点没有真正发出请求，不计入失败统计，直接转到下一个端点
+            stats.cancelled()
+            return True
+        if stats.failure(self.eject_after_failures, self.eject_seconds):
+            logging.warning(f"Endpoint {getattr(adapter, 'base_url', '')} ejected for {self.eject_seconds}s after repeated failures.")
+        logging.warning(f"Endpoint {getattr(adapter, 'base_url', '')} failed: {error}")
+        return is_retryable_error(error)
+
+    def _hedging(self, streaming: bool) -> bool:
+        """mode 为 "stream"（默认）时只对流式调用（交互式章节草稿）对冲，"all" 时对所有调用对冲。"""
+        if not self.hedge:
+            return False
+        return streaming or self.hedge.get("mode", "stream") == "all"
+
+    def _hedge_delay(self, stats: EndpointStats, first_byte: bool) -> float:
+        """请求发出后多久仍未返回就发出对冲请求：取该端点观测延迟的分位数，样本不足时用 default_delay。"""
+        observed = stats.latency_percentile(float(self.hedge.get("percentile", 0.95)), first_byte=first_byte)
+        if observed is None:
+            return float(self.hedge.get("default_delay", 30))
+        return max(float(self.hedge.get("min_delay", 2)), observed)
+
+    def _hedged_stream(self, prompt: str, until_first_chunk: bool) -> Iterator[str]:
+        """
+        同步对冲：每个请求在独立线程中以流式方式执行，事件经队列回到调用线程。
+        until_first_chunk 为 True 时，最先产出首个分片的请求胜出并继续向外输出；
+        否则最先完整返回的请求胜出，一次性输出其全文。
+        落败的请求在收到下一个分片时关闭流（断开连接）并丢弃结果；尚未收到任何字节的请求
+        无法从外部打断，会在后台线程中等到超时后自行结束。
+        """
+        candidates = self._ordered_members()
+        max_hedges = int(self.hedge.get("max_hedges", 1))
+        events = queue.Queue()
+        attempts = []
+        running = set()
+        hedges = 0
+        winner = None
+        last_error = None
+
+        def run(index, adapter, cancel):
+            stream = adapter.invoke_stream(prompt)
+            try:
+                for chunk in stream:
+                    if cancel.is_set():
+                        return
+                    events.put(("chunk", index, chunk))
+                events.put(("done", index, None))
+            except Exception as e:
+                events.put(("error", index, e))
+            finally:
+                stream.close()
+
+        def launch():
+            adapter, _, stats = candidates[len(attempts) % len(candidates)]
+            adapter.temperature, adapter.max_tokens = self.temperature, self.max_tokens
+            attempt = {"adapter": adapter, "stats": stats, "cancel": threading.Event(),
+                       "started": time.monotonic(), "first_byte": None, "parts": []}
+            attempts.append(attempt)
+            running.add(len(attempts) - 1)
+            stats.begin()
+            # 复制当前上下文，让对冲线程中的调用也记入同一项目、同一阶段的用量台账
+            context = contextvars.copy_context()
+            threading.Thread(target=context.run, args=(run, len(attempts) - 1, adapter, attempt["cancel"]), daemon=True).start()
+            return time.monotonic() + self._hedge_delay(stats, until_first_chunk)
+
+        def cancel_others(keep):
+            for index in list(running):
+                if index != keep:
+                    attempts[index]["cancel"].set()
+                    attempts[index]["stats"].cancelled()
+                    running.discard(index)
+
+        hedge_at = launch()
+        try:
+            while running:
+                timeout = None
+                if winner is None and hedges < max_hedges:
+                    timeout = max(0.0, hedge_at - time.monotonic())
+                try:
+                    kind, index, payload = events.get(timeout=timeout)
+                except queue.Empty:
+                    hedges += 1
+                    logging.info(f"Hedging request: no response from {getattr(attempts[-1]['adapter'], 'base_url', '')} in time, sending a duplicate.")
+                    hedge_at = launch()
+                    continue
+                if index not in running:
+                    continue
+                attempt = attempts[index]
+                if kind == "chunk":
+                    if attempt["first_byte"] is None:
+                        attempt["first_byte"] = time.monotonic() - attempt["started"]
+                    if until_first_chunk:
+                        if winner is None:
+                            winner = index
+                            cancel_others(index)
+                        yield payload
+                    else:
+                        attempt["parts"].append(payload)
+                elif kind == "done":
+                    if winner is None:
+                        winner = index
+                        cancel_others(index)
+                    running.discard(index)
+                    attempt["stats"].success(time.monotonic() - attempt["started"], attempt["first_byte"])
+                    if not until_first_chunk:
+                        yield "".join(attempt["parts"])
+                    return
+                else:
+                    running.discard(index)
+                    failover = self._on_failure(attempt["adapter"], attempt["stats"], payload)
+                    last_error = payload
+                    # 已经向外输出了部分内容，或属于致命错误时不再转移
+                    if winner == index or not failover:
+                        break
+                    if not running and len(attempts) < len(candidates):
+                        hedge_at = launch()
+        finally:
+            cancel_others(None)
+        raise last_error
+
+    async def _hedged_ainvoke(self, prompt: str) -> str:
+        """异步对冲：落败的请求直接取消其任务，底层连接随之关闭。"""
+        candidates = self._ordered_members()
+        max_hedges = int(self.hedge.get("max_hedges", 1))
+        tasks = {}
+        hedges = 0
+        last_error = None
+
+        def launch():
+            adapter, _, stats = candidates[len(tasks) % len(candidates)]
+            adapter.temperature, adapter.max_tokens = self.temperature, self.max_tokens
+            stats.begin()
+            task = asyncio.ensure_future(adapter.ainvoke(prompt))
+            tasks[task] = (adapter, stats, time.monotonic())
+            return time.monotonic() + self._hedge_delay(stats, False)
+
+        hedge_at = launch()
+        pending = set(tasks)
+        try:
+            while pending:
+                timeout = max(0.0, hedge_at - time.monotonic()) if hedges < max_hedges else None
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedges += 1
+                    logging.info("Hedging async request: no response in time, sending a duplicate.")
+                    hedge_at = launch()
+                    pending = {task for task in tasks if not task.done()}
+                    continue
+                for task in done:
+                    adapter, stats, started = tasks[task]
+                    error = task.exception()
+                    if error is None:
+                        stats.success(time.monotonic() - started)
+                        return task.result()
+                    last_error = error
+                    if not self._on_failure(adapter, stats, error):
+                        return self._handle_error(error)
+                if not pending and len(tasks) < len(candidates):
+                    hedge_at = launch()
+                    pending = {task for task in tasks if not task.done()}
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                    tasks[task][1].cancelled()
+        return self._handle_error(last_error)
+
+    def _call(self, prompt: str) -> str:
+        if self._hedging(streaming=False):
+            try:
+                return "".join(self._hedged_stream(prompt, until_first_chunk=False))
+            except Exception as e:
+                return self._handle_error(e)
+        last_error = None
+        for adapter, _, stats in self._ordered_members():
+            adapter.temperature, adapter.max_tokens = self.temperature, self.max_tokens
+            stats.begin()
+            started = time.monotonic()
+            try:
+                result = adapter.invoke(prompt)
+            except Exception as e:
+                last_error = e
+                if not self._on_failure(adapter, stats, e):
+                    break
+                continue
+            stats.success(time.monotonic() - started)
+            return result
+        return self._handle_error(last_error)
+
+    def _call_stream(self, prompt: str) -> Iterator[str]:
+        if self._hedging(streaming=True):
+            try:
+                yield from self._hedged_stream(prompt, until_first_chunk=True)
+            except Exception as e:
+                # 与 BaseLLMAdapter._call_stream 相同，流式路径不吞错误
+                self._handle_error(e)
+                raise
+            return
+        last_error = None
+        for adapter, _, stats in self._ordered_members():
+            adapter.temperature, adapter.max_tokens = self.temperature, self.max_tokens
+            stats.begin()
+            started = time.monotonic()
+            first_byte = None
+            produced = False
+            try:
+                for chunk in adapter.invoke_stream(prompt):
+                    if not produced:
+                        first_byte = time.monotonic() - started
+                    produced = True
+                    yield chunk
+            except Exception as e:
+                last_error = e
+                # 已经输出了部分内容时不能再换端点重来，交给上层重试
+                if not self._on_failure(adapter, stats, e) or produced:
+                    break
+                continue
+            stats.success(time.monotonic() - started, first_byte)
+            return
+        self._handle_error(last_error)
+        raise last_error
+
+    async def _acall(self, prompt: str) -> str:
+        if self._hedging(streaming=False):
+            return await self._hedged_ainvoke(prompt)
+        last_error = None
+        for adapter, _, stats in self._ordered_members():
+            adapter.temperature, adapter.max_tokens = self.temperature, self.max_tokens
+            stats.begin()
+            started = time.monotonic()
+            try:
+                result = await adapter.ainvoke(prompt)
+            except asyncio.CancelledError:
+                stats.cancelled()
+                raise
+            except Exception as e:
+                last_error = e
+                if not self._on_failure(adapter, stats, e):
+                    break
+                continue
+            stats.success(time.monotonic() - started)
+            return result
+        return self._handle_error(last_error)
+
+# ============== 各接口的附加设置 ==============
+# 来自 config.json 中 llm_configs 的每个接口条目（如 "rate_limit"），键为小写接口名
+_interface_settings = {}
+
+def configure_llm_adapters(llm_configs: dict):
+    """
+    载入 config.json 的 llm_configs，供 create_llm_adapter 读取各接口的附加设置，例如：
+    "rate_limit": {"requests_per_minute": 60, "tokens_per_minute": 100000, "max_concurrency": 4}
+    "endpoints": [{"base_url": "...", "api_key": "...", "weight": 2}, ...]
+    "pool": {"strategy": "least_outstanding" | "weighted_round_robin", "eject_after_failures": 3, "eject_seconds": 60}
+    "hedge": {"mode": "stream" | "all", "percentile": 0.95, "min_delay": 2, "default_delay": 30, "max_hedges": 1}
+    "single_flight": false  关闭在途相同请求的合并（默认开启）
+    "circuit_breaker": {"failure_threshold": 3, "recovery_seconds": 60, "half_open_max_calls": 1}，false 关闭熔断
+    """
+    _interface_settings.clear()
+    for name, conf in (llm_configs or {}).items():
+        if isinstance(conf, dict):
+            _interface_settings[name.strip().lower()] = conf
 
 def create_llm_adapter(
     interface_format: str,
@@ -349,8 +1389,62 @@ def create_llm_adapter(
 ) -> BaseLLMAdapter:
     """
     工厂函数：根据 interface_format 返回不同的适配器实例。
+    适配器本身很轻量，底层 SDK 客户端（及其连接池）由进程级客户端池复用，
+    因此各阶段以不同 temperature / max_tokens 创建适配器不会重新建立连接。
+    若该接口在 config.json 中配置了 rate_limit，则挂上按端点 + 密钥共享的限流器；
+    若配置了额外的 endpoints，则返回在这些端点间负载均衡、故障转移的 PooledLLMAdapter；
+    若配置了 hedge，即使只有一个端点也返回 PooledLLMAdapter，对冲请求发往同一端点。
+    返回的适配器默认开启 single_flight：相同请求（按 cache_key）在途时共享结果。
     """
     fmt = interface_format.strip().lower()
+    settings = _interface_settings.get(fmt, {})
+    adapter = _build_endpoint_group(fmt, settings, interface_format, base_url, model_name, api_key, temperature, max_tokens, timeout)
+    adapter.single_flight = bool(settings.get("single_flight", True))
+    return adapter
+
+def _build_endpoint_group(fmt, settings, interface_format, base_url, model_name, api_key, temperature, max_tokens, timeout) -> BaseLLMAdapter:
+    """按 endpoints / hedge 配置返回单端点适配器或 PooledLLMAdapter。"""
+    primary = _build_governed_adapter(fmt, interface_format, base_url, model_name, api_key, temperature, max_tokens, timeout)
+    endpoints = settings.get("endpoints") or []
+    hedge = settings.get("hedge")
+    if not endpoints and not hedge:
+        return primary
+
+    members = [(primary, settings.get("weight", 1))]
+    seen = {primary.endpoint_key()}
+    for endpoint in endpoints:
+        adapter = _build_governed_adapter(
+            fmt,
+            interface_format,
+            endpoint.get("base_url", base_url),
+            endpoint.get("model_name", model_name),
+            endpoint.get("api_key", api_key),
+            temperature,
+            max_tokens,
+            timeout
+        )
+        if adapter.endpoint_key() in seen:
+            continue
+        seen.add(adapter.endpoint_key())
+        members.append((adapter, endpoint.get("weight", 1)))
+    if len(members) == 1 and not hedge:
+        return primary
+    return PooledLLMAdapter(members, hedge=hedge, **settings.get("pool", {}))
+
+def _build_governed_adapter(fmt, interface_format, base_url, model_name, api_key, temperature, max_tokens, timeout) -> BaseLLMAdapter:
+    """创建单端点适配器，并按配置挂上该端点的限流器与熔断器（熔断默认开启）。"""
+    adapter = _build_llm_adapter(fmt, interface_format, base_url, model_name, api_key, temperature, max_tokens, timeout)
+    settings = _interface_settings.get(fmt, {})
+    rate_limit = settings.get("rate_limit")
+    if rate_limit:
+        adapter.rate_limiter = get_rate_limiter(adapter.endpoint_key(), **rate_limit)
+    breaker = settings.get("circuit_breaker", {})
+    if breaker is not False:
+        name = f"LLM {interface_format} {getattr(adapter, 'base_url', '') or adapter.model_name}"
+        adapter.circuit_breaker = get_circuit_breaker(("llm",) + adapter.endpoint_key(), name, **(breaker or {}))
+    return adapter
+
+def _build_llm_adapter(fmt, interface_format, base_url, model_name, api_key, temperature, max_tokens, timeout) -> BaseLLMAdapter:
     if fmt == "deepseek":
         return DeepSeekAdapter(api_key, base_url, model_name, max_tokens, temperature, timeout)
     elif fmt == "openai":
@@ -372,5 +1466,7 @@ def create_llm_adapter(
         return VolcanoEngineAIAdapter(api_key, base_url, model_name, max_tokens, temperature, timeout)
     elif fmt == "硅基流动":
         return SiliconFlowAdapter(api_key, base_url, model_name, max_tokens, temperature, timeout)
+    elif fmt == "mock":
+        return MockLLMAdapter(api_key, base_url, model_name, max_tokens, temperature, timeout)
     else:
         raise ValueError(f"Unknown interface_format: {interface_format}")
@@ -0,0 +1,106 @@
+# llm_logging.py
+# -*- coding: utf-8 -*-
+"""
+LLM 提示词 / 返回内容的日志：控制台只输出分级、截断、可抽样的单行摘要；
+开启 debug_payloads 后，完整内容经后台线程写入按大小轮转的文件，不阻塞生成调用。
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import datetime
+from usage_ledger import current_usage_context
+
+logger = logging.getLogger("llm")
+_payload_logger = logging.getLogger("llm.payload")
+_payload_logger.propagate = False
+
+# 由 configure_llm_logging 根据 config.json 的 "llm_logging" 段落更新
+_settings = {
+    "preview_chars": 300,
+    "sample_rate": 1.0,
+    "debug_payloads": False,
+}
+_console_handler = None
+_payload_listener = None
+
+def configure_llm_logging(level: str = "INFO", preview_chars: int = 300, sample_rate: float = 1.0,
+                          debug_payloads: bool = False, payload_file: str = "logs/llm_payloads.log",
+                          max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5):
+    """
+    :param level: "llm" 日志器的级别；DEBUG 时额外输出提示词与返回内容的截断预览
+    :param preview_chars: 预览保留的最大字符数（首尾各一半）
+    :param sample_rate: 输出预览的抽样比例（0~1），摘要行不受影响
+    :param debug_payloads: 为 True 时把完整的提示词与返回内容写入 payload_file（按 max_bytes 轮转，保留 backup_count 份）
+    """
+    global _console_handler, _payload_listener
+    _settings.update(
+        preview_chars=max(0, int(preview_chars)),
+        sample_rate=min(1.0, max(0.0, float(sample_rate))),
+        debug_payloads=bool(debug_payloads)
+    )
+    logger.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+    # 应用本身未配置根日志器，这里给 "llm" 挂一个控制台输出，替代原先的 print
+    if _console_handler is None and not logger.handlers:
+        _console_handler = logging.StreamHandler()
+        _console_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s"))
+        logger.addHandler(_console_handler)
+        logger.propagate = False
+
+    if _payload_listener is not None:
+        _payload_listener.stop()
+        _payload_listener = None
+        for handler in list(_payload_logger.handlers):
+            _payload_logger.removeHandler(handler)
+    if _settings["debug_payloads"]:
+        directory = os.path.dirname(payload_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            payload_file, maxBytes=int(max_bytes), backupCount=int(backup_count), encoding="utf-8"
+        )
+        file_handler.setFormatter(logging.Formatter("%(message)s"))
+        payload_queue = queue.SimpleQueue()
+        _payload_logger.addHandler(logging.handlers.QueueHandler(payload_queue))
+        _payload_logger.setLevel(logging.DEBUG)
+        _payload_listener = logging.handlers.QueueListener(payload_queue, file_handler)
+        _payload_listener.start()
+
+@atexit.register
+def _stop_payload_listener():
+    """退出前把队列中尚未落盘的完整内容写完。"""
+    if _payload_listener is not None:
+        _payload_listener.stop()
+
+def preview(text: str, limit: int = None) -> str:
+    """截断到 limit 个字符（保留首尾），并把换行压成单行。"""
+    text = text or ""
+    limit = _settings["preview_chars"] if limit is None else limit
+    if len(text) > limit:
+        head = limit // 2
+        text = f"{text[:head]} …[{len(text) - limit} chars]… {text[len(text) - (limit - head):]}" if limit else ""
+    return text.replace("\r", " ").replace("\n", "⏎")
+
+def log_llm_exchange(source: str, prompt: str, response: str = None, **fields):
+    """
+    记录一次提示词/返回：INFO 级别输出一行 key=value 摘要（来源、阶段、长度等），
+    DEBUG 级别按抽样比例追加截断预览；开启 debug_payloads 时完整内容异步写入轮转文件。
+    """
+    context = current_usage_context()
+    summary = {"source": source, "stage": context.get("stage", ""), "prompt_chars": len(prompt or "")}
+    if response is not None:
+        summary["response_chars"] = len(response)
+    summary.update(fields)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(" ".join(f"{key}={value}" for key, value in summary.items()))
+    if logger.isEnabledFor(logging.DEBUG) and random.random() < _settings["sample_rate"]:
+        logger.debug(f"source={source} prompt_preview=\"{preview(prompt)}\"")
+        if response is not None:
+            logger.debug(f"source={source} response_preview=\"{preview(response)}\"")
+    if _settings["debug_payloads"]:
+        record = dict(summary, time=datetime.datetime.now().isoformat(timespec="seconds"),
+                      project=context.get("project", ""), prompt=prompt, response=response)
+        _payload_logger.debug(json.dumps(record, ensure_ascii=False))
@@ -0,0 +1,122 @@
+# local_embedding.py
+# -*- coding: utf-8 -*-
+"""
+本地 CPU 推理的 embedding 后端，离线部署时无需任何 HTTP 服务：
+- "onnx"：chromadb 自带的 all-MiniLM-L6-v2 ONNX 模型（main.spec 已打包），只依赖 onnxruntime，不支持其他模型名；
+- "sentence_transformers"：任意 sentence-transformers 模型（名称或本地路径），依赖 torch。
+模型在每个进程中只加载一次；可设置推理批大小、算子内线程数（仅 sentence_transformers），以及可选的多进程池。
+"""
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+DEFAULT_LOCAL_SETTINGS = {
+    "backend": "onnx",
+    "batch_size": 64,
+    "threads": 0,
+    "processes": 0,
+}
+ONNX_MODEL_NAME = "all-MiniLM-L6-v2"
+
+# 本进程已加载的模型，键为 (后端, 模型名, 线程数)
+_models = {}
+_models_lock = threading.Lock()
+# 共享的进程池，键为 (后端, 模型名, 线程数, 进程数)
+_pools = {}
+_pools_lock = threading.Lock()
+
+class _OnnxMiniLM:
+    """chromadb 自带的 ONNXMiniLM_L6_V2，只使用其公开的调用接口；推理线程数由 onnxruntime 自行决定。"""
+    def __init__(self):
+        from chromadb.utils.embedding_functions.onnx_mini_lm_l6_v2 import ONNXMiniLM_L6_V2
+        self._function = ONNXMiniLM_L6_V2()
+        # 首次调用时加载（必要时下载）模型，放在加载阶段而不是第一次嵌入时
+        self._function(["warmup"])
+
+    def encode(self, texts: List[str], batch_size: int) -> List[List[float]]:
+        vectors = []
+        for start in range(0, len(texts), batch_size):
+            vectors.extend([float(x) for x in vector] for vector in self._function(texts[start:start + batch_size]))
+        return vectors
+
+class _SentenceTransformer:
+    def __init__(self, model_name: str, threads: int):
+        import torch
+        from sentence_transformers import SentenceTransformer
+        if threads > 0:
+            torch.set_num_threads(threads)
+        self._model = SentenceTransformer(model_name, device="cpu")
+
+    def encode(self, texts: List[str], batch_size: int) -> List[List[float]]:
+        vectors = self._model.encode(texts, batch_size=batch_size, normalize_embeddings=True, show_progress_bar=False)
+        return vectors.tolist()
+
+def load_local_model(backend: str, model_name: str, threads: int = 0):
+    """返回本进程中共享的模型实例，不存在时加载。"""
+    key = (backend, model_name, int(threads))
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            logging.info(f"Loading local embedding model {model_name} ({backend}, threads={threads or 'auto'})...")
+            if backend == "onnx":
+                model = _OnnxMiniLM()
+            elif backend == "sentence_transformers":
+                model = _SentenceTransformer(model_name, int(threads))
+            else:
+                raise ValueError(f"Unknown local embedding backend: {backend}")
+            _models[key] = model
+        return model
+
+def _init_worker(backend: str, model_name: str, threads: int):
+    """进程池中每个子进程启动时加载一次模型。"""
+    load_local_model(backend, model_name, threads)
+
+def _encode_in_worker(backend: str, model_name: str, threads: int, texts: List[str], batch_size: int):
+    return load_local_model(backend, model_name, threads).encode(texts, batch_size)
+
+def _get_pool(backend: str, model_name: str, threads: int, processes: int) -> ProcessPoolExecutor:
+    key = (backend, model_name, threads, processes)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                       initargs=(backend, model_name, threads))
+            _pools[key] = pool
+        return pool
+
+def shutdown_local_pools():
+    """关闭所有本地推理进程池（退出程序或修改配置时）。"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _pools.clear()
+
+class LocalEncoder:
+    """
+    按 settings 在本进程或进程池中编码文本。processes 大于 0 时把输入按 batch_size 切块分给子进程，
+    适合大批量导入；单条查询始终在本进程中完成，避免进程间传输的开销。
+    """
+    def __init__(self, model_name: str, settings: dict):
+        settings = dict(DEFAULT_LOCAL_SETTINGS, **(settings or {}))
+        self.backend = str(settings["backend"]).strip().lower().replace("-", "_")
+        if self.backend == "onnx" and model_name and model_name != ONNX_MODEL_NAME:
+            raise ValueError(f"The onnx local backend only provides {ONNX_MODEL_NAME}, got {model_name}; "
+                             f"use the sentence_transformers backend for other models.")
+        self.model_name = ONNX_MODEL_NAME if self.backend == "onnx" else (model_name or "paraphrase-MiniLM-L6-v2")
+        self.batch_size = max(1, int(settings["batch_size"]))
+        self.threads = max(0, int(settings["threads"]))
+        self.processes = max(0, int(settings["processes"]))
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        if self.processes > 0 and len(texts) > self.batch_size:
+            pool = _get_pool(self.backend, self.model_name, self.threads, self.processes)
+            chunks = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+            futures = [
+                pool.submit(_encode_in_worker, self.backend, self.model_name, self.threads, chunk, self.batch_size)
+                for chunk in chunks
+            ]
+            return [vector for future in futures for vector in future.result()]
+        return load_local_model(self.backend, self.model_name, self.threads).encode(texts, self.batch_size)
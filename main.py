@@ -1,9 +1,12 @@
 # main.py
 # -*- coding: utf-8 -*-
+import multiprocessing
 import customtkinter as ctk
 from ui import NovelGeneratorGUI
 
 def main():
+    # 打包后的程序在 Windows 上启动本地 embedding 进程池时，子进程需要由此识别并转入工作进程，而不是再打开一个界面
+    multiprocessing.freeze_support()
     app = ctk.CTk()
     gui = NovelGeneratorGUI(app)
     app.mainloop()
@@ -0,0 +1,491 @@
+# mock_llm.py
+# -*- coding: utf-8 -*-
+"""
+离线模拟的 LLM / Embedding 服务，用于在无网络的机器上对 架构 → 目录 → 草稿 → 定稿 全流程做基准测试与压测。
+
+- MockBackend：按提示词返回确定性的、格式与真实输出一致的文本（章节目录、角色状态树、摘要、正文等），
+  并按可配置的延迟分布等待、按比例注入错误；同一提示词总是得到同一段文本。
+- 进程内：接口格式选 "Mock" 即使用 llm_adapters.MockLLMAdapter / embedding_adapters.MockEmbeddingAdapter。
+- HTTP：python mock_llm.py serve 启动 OpenAI 兼容服务（/v1/chat/completions、/v1/embeddings、/v1/models），
+  真实适配器把 base_url 指向它即可走完整的 SDK 与网络路径。
+- 基准：python mock_llm.py bench 在临时目录中跑完整流程并按阶段输出耗时与用量。
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, List, Optional
+from rate_limiter import estimate_tokens
+
+_NAMES = ["林澈", "苏瑶", "顾衡", "沈青禾", "白夜", "陆行舟", "温岚", "韩烈"]
+_PLACES = ["雾港", "旧城区地下水道", "钟楼", "北境哨站", "灯塔", "废弃观测站", "集市深处的当铺"]
+_ITEMS = ["铜制罗盘", "半张星图", "黑曜石吊坠", "生锈的钥匙", "密封的信笺", "断裂的长剑"]
+_SENTENCES = [
+    "{name}在{place}停下脚步，空气里弥漫着潮湿的铁锈味。",
+    "远处传来低沉的钟声，{name}下意识握紧了怀里的{item}。",
+    "没有人注意到，{place}的墙上多了一道新鲜的划痕。",
+    "{name}想起三年前的那个雨夜，心里的疑问再次浮了上来。",
+    "风从破窗灌进来，把桌上的{item}吹得微微颤动。",
+    "{name}压低声音说：“我们没有太多时间了。”",
+    "灯火忽明忽暗，{place}里每一个影子都像在窃听。",
+    "{name}终于明白，{item}并不只是一件普通的旧物。",
+    "人群散去后，{place}只剩下一串通往黑暗的脚印。",
+    "那一刻，{name}意识到真正的敌人一直站在身边。",
+]
+_ROLES = ["推进", "转折", "揭示", "铺垫", "高潮", "缓冲"]
+_SUSPENSE = ["紧凑", "渐进", "爆发", "舒缓"]
+
+class MockServiceError(Exception):
+    """注入的服务端错误，带 status_code / response.headers，可被 retry_policy 与限流器识别。"""
+    def __init__(self, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(f"Mock service error {status_code}")
+        self.status_code = status_code
+        headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+        self.response = type("MockResponse", (), {"status_code": status_code, "headers": headers})()
+
+class MockBackend:
+    """
+    :param latency: 延迟分布 "fixed" | "uniform" | "exponential" | "lognormal"
+    :param latency_mean: 分布的均值（lognormal 为中位数），秒
+    :param latency_sigma: lognormal 的形状参数，越大长尾越重
+    :param latency_max: 单次延迟上限，秒
+    :param first_byte_fraction: 流式响应中首字节耗时占总延迟的比例
+    :param chunk_chars: 流式响应每个分片的字符数
+    :param error_rate: 注入错误的概率（0~1）
+    :param error_status: 注入错误的 HTTP 状态码，429 / 503 时附带 Retry-After
+    :param seed: 延迟与错误注入的随机种子；文本内容只由提示词决定
+    :param dimensions: 模拟 embedding 的维度
+    :param embedding_latency: 每批 embedding 请求的固定延迟，秒
+    """
+    def __init__(self, latency: str = "lognormal", latency_mean: float = 0.5, latency_sigma: float = 0.5,
+                 latency_max: float = 30.0, first_byte_fraction: float = 0.2, chunk_chars: int = 16,
+                 error_rate: float = 0.0, error_status: int = 503, seed: Optional[int] = None,
+                 dimensions: int = 256, embedding_latency: float = 0.0):
+        self.latency = latency
+        self.latency_mean = float(latency_mean)
+        self.latency_sigma = float(latency_sigma)
+        self.latency_max = float(latency_max)
+        self.first_byte_fraction = min(1.0, max(0.0, float(first_byte_fraction)))
+        self.chunk_chars = max(1, int(chunk_chars))
+        self.error_rate = float(error_rate)
+        self.error_status = int(error_status)
+        self.dimensions = int(dimensions)
+        self.embedding_latency = float(embedding_latency)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    # ---------- 延迟与错误 ----------
+    def sample_latency(self) -> float:
+        with self._lock:
+            if self.latency == "fixed":
+                value = self.latency_mean
+            elif self.latency == "uniform":
+                value = self._rng.uniform(0, 2 * self.latency_mean)
+            elif self.latency == "exponential":
+                value = self._rng.expovariate(1.0 / self.latency_mean) if self.latency_mean > 0 else 0.0
+            else:
+                value = self._rng.lognormvariate(math.log(max(self.latency_mean, 1e-6)), self.latency_sigma)
+        return min(self.latency_max, max(0.0, value))
+
+    def sample_error(self) -> Optional[MockServiceError]:
+        with self._lock:
+            failed = self._rng.random() < self.error_rate
+        if not failed:
+            return None
+        retry_after = 1.0 if self.error_status in (429, 503) else None
+        return MockServiceError(self.error_status, retry_after)
+
+    # ---------- 对外接口 ----------
+    def complete(self, prompt: str, max_tokens: Optional[int] = None) -> str:
+        error = self.sample_error()
+        time.sleep(self.sample_latency())
+        if error:
+            raise error
+        return canned_response(prompt, max_tokens)
+
+    async def acomplete(self, prompt: str, max_tokens: Optional[int] = None) -> str:
+        error = self.sample_error()
+        await asyncio.sleep(self.sample_latency())
+        if error:
+            raise error
+        return canned_response(prompt, max_tokens)
+
+    def stream(self, prompt: str, max_tokens: Optional[int] = None) -> Iterator[str]:
+        """首字节前等待 first_byte_fraction × 延迟，其余时间均摊到各分片之间。"""
+        error = self.sample_error()
+        latency = self.sample_latency()
+        time.sleep(latency * self.first_byte_fraction)
+        if error:
+            raise error
+        text = canned_response(prompt, max_tokens)
+        chunks = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)] or [""]
+        gap = latency * (1 - self.first_byte_fraction) / len(chunks)
+        for index, chunk in enumerate(chunks):
+            if index and gap:
+                time.sleep(gap)
+            yield chunk
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        if self.embedding_latency:
+            time.sleep(self.embedding_latency)
+        error = self.sample_error()
+        if error:
+            raise error
+        return [mock_embedding(text, self.dimensions) for text in texts]
+
+    def usage(self, prompt: str, completion: str) -> dict:
+        """OpenAI 格式的用量，供台账与 HTTP 响应使用。"""
+        prompt_tokens = estimate_tokens(prompt)
+        completion_tokens = estimate_tokens(completion)
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def configure_mock_backend(**behavior):
+    """按 config.json 的 "mock_backend" 段落（MockBackend 的参数）重建进程内模拟后端。"""
+    set_mock_backend(MockBackend(**behavior))
+
+def set_mock_backend(backend: MockBackend):
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+def get_mock_backend() -> MockBackend:
+    """供 "Mock" 接口的 LLM 与 Embedding 适配器共用的进程内后端。"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = MockBackend()
+        return _backend
+
+# ============== 确定性的模拟内容 ==============
+def mock_embedding(text: str, dimensions: int = 256) -> List[float]:
+    """字符二元组哈希到固定维度后归一化：相同文本得到相同向量，字面相近的文本向量也相近。"""
+    vector = [0.0] * dimensions
+    text = text or ""
+    for i in range(max(1, len(text) - 1)):
+        bucket = zlib.crc32(text[i:i + 2].encode("utf-8")) % dimensions
+        vector[bucket] += 1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+def _rng_for(prompt: str) -> random.Random:
+    return random.Random(int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16], 16))
+
+def _sentence(rng: random.Random) -> str:
+    return rng.choice(_SENTENCES).format(name=rng.choice(_NAMES), place=rng.choice(_PLACES), item=rng.choice(_ITEMS))
+
+def _paragraphs(rng: random.Random, target_chars: int) -> str:
+    paragraphs, total = [], 0
+    while total < target_chars:
+        paragraph = "".join(_sentence(rng) for _ in range(rng.randint(3, 6)))
+        paragraphs.append(paragraph)
+        total += len(paragraph)
+    return "\n\n".join(paragraphs)
+
+def _blueprint(rng: random.Random, start: int, end: int) -> str:
+    blocks = []
+    for number in range(start, end + 1):
+        stars = rng.randint(1, 5)
+        blocks.append("\n".join([
+            f"第{number}章 - {rng.choice(_PLACES)}的{rng.choice(['秘密', '回声', '裂痕', '约定', '余烬'])}",
+            f"本章定位：{rng.choice(_NAMES)}",
+            f"核心作用：{rng.choice(_ROLES)}",
+            f"悬念密度：{rng.choice(_SUSPENSE)}",
+            f"伏笔操作：埋设({rng.choice(_ITEMS)})→强化({rng.choice(_PLACES)}的传闻)",
+            f"认知颠覆：{'★' * stars}{'☆' * (5 - stars)}",
+            f"本章简述：{_sentence(rng)}",
+        ]))
+    return "\n\n".join(blocks)
+
+def _character_state(rng: random.Random) -> str:
+    blocks = []
+    for name in rng.sample(_NAMES, 3):
+        others = [n for n in _NAMES if n != name]
+        blocks.append("\n".join([
+            f"{name}：",
+            "├──物品:",
+            f"│  ├──{rng.choice(_ITEMS)}：{_sentence(rng)}",
+            f"│  └──{rng.choice(_ITEMS)}：{_sentence(rng)}",
+            "├──能力",
+            f"│  ├──技能1：{_sentence(rng)}",
+            f"│  └──技能2：{_sentence(rng)}",
+            "├──状态",
+            f"│  ├──身体状态: {_sentence(rng)}",
+            f"│  └──心理状态: {_sentence(rng)}",
+            "├──主要角色间关系网",
+            f"│  ├──{rng.choice(others)}：{_sentence(rng)}",
+            f"│  └──{rng.choice(others)}：{_sentence(rng)}",
+            "├──触发或加深的事件",
+            f"│  ├──{rng.choice(_PLACES)}异变：{_sentence(rng)}",
+            f"│  └──{rng.choice(_ITEMS)}失窃：{_sentence(rng)}",
+        ]))
+    return "\n\n".join(blocks)
+
+def canned_response(prompt: str, max_tokens: Optional[int] = None) -> str:
+    """按提示词中的特征语句判断所处阶段，返回格式与真实模型输出一致的确定性文本。"""
+    rng = _rng_for(prompt)
+    if "Please reply 'OK'" in prompt:
+        return "OK"
+    if "当前章节摘要" in prompt and "请按如下格式输出" in prompt:
+        return f"当前章节摘要: {_paragraphs(rng, 300)}"
+    if "知识库检索关键词" in prompt:
+        return "\n".join(f"{rng.choice(_PLACES)}·{rng.choice(_ITEMS)}" for _ in range(rng.randint(3, 5)))
+    if "对知识库内容进行三级过滤" in prompt:
+        return f"[情节燃料]→可用于时间压力类悬念\n❗ {_sentence(rng)}\n· {_sentence(rng)}"
+    if "节奏分布" in prompt:
+        match = re.search(r"请设计第(\d+)章到第(\d+)", prompt)
+        if match:
+            return _blueprint(rng, int(match.group(1)), int(match.group(2)))
+        match = re.search(r"设计(\d+)章的节奏分布", prompt)
+        return _blueprint(rng, 1, int(match.group(1)) if match else 3)
+    if "角色状态文档" in prompt or "请更新主要角色状态" in prompt or "分析出所有角色" in prompt:
+        return _character_state(rng)
+    if "更新前文摘要" in prompt:
+        return _paragraphs(rng, 600)
+    match = re.search(r"完成第\s*(\d+)\s*章的正文，字数要求(\d+)字", prompt)
+    if match:
+        target = int(match.group(2))
+        if max_tokens:
+            target = min(target, max_tokens)
+        return _paragraphs(rng, target)
+    if "雪花写作法" in prompt:
+        return f"当{rng.choice(_NAMES)}在{rng.choice(_PLACES)}发现{rng.choice(_ITEMS)}，必须揭开三年前的真相，否则整座城市将被吞没；与此同时，一个更古老的契约正在苏醒。"
+    if "请检查下面的小说设定与最新章节" in prompt:
+        return "无明显冲突"
+    return _paragraphs(rng, 800)
+
+# ============== OpenAI 兼容的 HTTP 服务 ==============
+class _MockHandler(BaseHTTPRequestHandler):
+    backend: MockBackend = None
+    protocol_version = "HTTP/1.1"
+    # 响应头与响应体分两次写出，keep-alive 连接上若不关闭 Nagle 会与客户端的延迟确认叠加出约 40ms 的等待
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, headers: Optional[dict] = None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, error: MockServiceError):
+        headers = dict(error.response.headers)
+        self._send_json(error.status_code, {"error": {"message": str(error), "type": "mock_error", "code": error.status_code}}, headers)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock-model", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "invalid json"}})
+            return
+        path = self.path.split("?")[0].rstrip("/")
+        if path.endswith("/chat/completions"):
+            self._chat(body)
+        elif path.endswith("/embeddings"):
+            self._embeddings(body)
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def _chat(self, body: dict):
+        prompt = ""
+        for message in body.get("messages", []):
+            if message.get("role") == "user":
+                content = message.get("content", "")
+                if isinstance(content, list):
+                    content = "".join(part.get("text", "") for part in content if isinstance(part, dict))
+                prompt = content
+        model = body.get("model", "mock-model")
+        max_tokens = body.get("max_tokens") or body.get("max_completion_tokens")
+        created = int(time.time())
+        if not body.get("stream"):
+            try:
+                text = self.backend.complete(prompt, max_tokens)
+            except MockServiceError as e:
+                self._send_error(e)
+                return
+            self._send_json(200, {
+                "id": f"chatcmpl-mock-{created}", "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": self.backend.usage(prompt, text),
+            })
+            return
+
+        stream = self.backend.stream(prompt, max_tokens)
+        try:
+            first = next(stream)
+        except MockServiceError as e:
+            self._send_error(e)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        parts = []
+
+        def send(payload: dict):
+            self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        def chunk(delta: dict, finish_reason=None) -> dict:
+            return {"id": f"chatcmpl-mock-{created}", "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+        try:
+            parts.append(first)
+            send(chunk({"role": "assistant", "content": first}))
+            for piece in stream:
+                parts.append(piece)
+                send(chunk({"content": piece}))
+            send(chunk({}, "stop"))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                send({"id": f"chatcmpl-mock-{created}", "object": "chat.completion.chunk", "created": created, "model": model,
+                      "choices": [], "usage": self.backend.usage(prompt, "".join(parts))})
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前断开（例如对冲请求中落败的一方）
+            stream.close()
+
+    def _embeddings(self, body: dict):
+        inputs = body.get("input", "")
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        try:
+            vectors = self.backend.embed([str(text) for text in inputs])
+        except MockServiceError as e:
+            self._send_error(e)
+            return
+        tokens = sum(estimate_tokens(str(text)) for text in inputs)
+        self._send_json(200, {
+            "object": "list", "model": body.get("model", "mock-embedding"),
+            "data": [{"object": "embedding", "index": i, "embedding": vector} for i, vector in enumerate(vectors)],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+def start_mock_server(backend: MockBackend = None, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """在后台线程启动 OpenAI 兼容的模拟服务，返回 server；base_url 为 http://host:server.server_port/v1。"""
+    handler = type("MockHandler", (_MockHandler,), {"backend": backend or MockBackend()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# ============== 全流程基准 ==============
+def run_pipeline_benchmark(filepath: str, chapters: int = 3, word_number: int = 3000,
+                           interface_format: str = "Mock", base_url: str = "", model_name: str = "mock-model",
+                           embedding_interface_format: str = "Mock", embedding_url: str = "",
+                           embedding_model_name: str = "mock-embedding", max_tokens: int = 4096) -> dict:
+    """
+    依次执行 架构 → 目录 → 每章草稿 → 每章定稿，返回各阶段耗时（秒）。
+    用量台账写在 filepath/llm_usage.jsonl，可用 usage_ledger.summarize_usage 按阶段汇总。
+    """
+    from novel_generator import Novel_architecture_generate, Chapter_blueprint_generate, generate_chapter_draft, finalize_chapter
+
+    timings = {}
+    common = dict(api_key="mock", base_url=base_url, temperature=0.7, max_tokens=max_tokens, timeout=600)
+
+    started = time.perf_counter()
+    Novel_architecture_generate(interface_format=interface_format, llm_model=model_name, topic="雾港疑案",
+                                genre="悬疑", number_of_chapters=chapters, word_number=word_number,
+                                filepath=filepath, **common)
+    timings["architecture"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    Chapter_blueprint_generate(interface_format=interface_format, llm_model=model_name, filepath=filepath,
+                               number_of_chapters=chapters, **common)
+    timings["blueprint"] = time.perf_counter() - started
+
+    embedding = dict(embedding_api_key="mock", embedding_url=embedding_url,
+                     embedding_interface_format=embedding_interface_format, embedding_model_name=embedding_model_name)
+    for number in range(1, chapters + 1):
+        started = time.perf_counter()
+        generate_chapter_draft(model_name=model_name, filepath=filepath, novel_number=number, word_number=word_number,
+                               user_guidance="", characters_involved="", key_items="", scene_location="",
+                               time_constraint="", interface_format=interface_format, **embedding, **common)
+        timings[f"draft_{number}"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        finalize_chapter(novel_number=number, word_number=word_number, model_name=model_name, filepath=filepath,
+                         interface_format=interface_format, **embedding, **common)
+        timings[f"finalize_{number}"] = time.perf_counter() - started
+    return timings
+
+def _backend_from_args(args) -> MockBackend:
+    return MockBackend(latency=args.latency, latency_mean=args.latency_mean, latency_sigma=args.latency_sigma,
+                       error_rate=args.error_rate, error_status=args.error_status, seed=args.seed)
+
+def main():
+    parser = argparse.ArgumentParser(description="离线模拟的 LLM / Embedding 服务与全流程基准")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("serve", "bench"):
+        p = sub.add_parser(name)
+        p.add_argument("--latency", default="lognormal", choices=["fixed", "uniform", "exponential", "lognormal"])
+        p.add_argument("--latency-mean", type=float, default=0.5)
+        p.add_argument("--latency-sigma", type=float, default=0.5)
+        p.add_argument("--error-rate", type=float, default=0.0)
+        p.add_argument("--error-status", type=int, default=503)
+        p.add_argument("--seed", type=int, default=None)
+    sub.choices["serve"].add_argument("--host", default="127.0.0.1")
+    sub.choices["serve"].add_argument("--port", type=int, default=8765)
+    bench = sub.choices["bench"]
+    bench.add_argument("--chapters", type=int, default=3)
+    bench.add_argument("--word-number", type=int, default=3000)
+    bench.add_argument("--workdir", default=None, help="项目目录，默认使用临时目录")
+    bench.add_argument("--via-http", action="store_true", help="启动本地 HTTP 服务并通过 OpenAI 接口访问，覆盖真实 SDK 路径")
+    args = parser.parse_args()
+
+    backend = _backend_from_args(args)
+    if args.command == "serve":
+        handler = type("MockHandler", (_MockHandler,), {"backend": backend})
+        server = ThreadingHTTPServer((args.host, args.port), handler)
+        print(f"Mock OpenAI-compatible server listening on http://{args.host}:{args.port}/v1")
+        server.serve_forever()
+        return
+
+    import tempfile
+    from usage_ledger import summarize_usage
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="novel_bench_")
+    options = {}
+    if args.via_http:
+        server = start_mock_server(backend)
+        url = f"http://127.0.0.1:{server.server_port}/v1"
+        options = dict(interface_format="OpenAI", base_url=url, embedding_interface_format="OpenAI", embedding_url=url)
+    else:
+        set_mock_backend(backend)
+    timings = run_pipeline_benchmark(workdir, chapters=args.chapters, word_number=args.word_number, **options)
+
+    print(f"项目目录: {workdir}")
+    for stage, seconds in timings.items():
+        print(f"{stage:<20}{seconds:>10.2f}s")
+    print(f"{'total':<20}{sum(timings.values()):>10.2f}s")
+    print()
+    for stage, item in sorted(summarize_usage(workdir).items()):
+        print(f"{stage:<40}{item['calls']:>6} calls{item['prompt_tokens']:>10} prompt{item['completion_tokens']:>10} completion")
+
+if __name__ == "__main__":
+    main()
@@ -95,7 +95,7 @@ def Novel_architecture_generate(
             word_number=word_number,
             user_guidance=user_guidance  # 修复：添加内容指导
         )
-        core_seed_result = invoke_with_cleaning(llm_adapter, prompt_core)
+        core_seed_result = invoke_with_cleaning(llm_adapter, prompt_core, filepath=filepath, stage="architecture/core_seed")
         if not core_seed_result.strip():
             logging.warning("core_seed_prompt generation failed and returned empty.")
             save_partial_architecture_data(filepath, partial_data)
@@ -111,7 +111,7 @@ def Novel_architecture_generate(
             core_seed=partial_data["core_seed_result"].strip(),
             user_guidance=user_guidance
         )
-        character_dynamics_result = invoke_with_cleaning(llm_adapter, prompt_character)
+        character_dynamics_result = invoke_with_cleaning(llm_adapter, prompt_character, filepath=filepath, stage="architecture/character_dynamics")
         if not character_dynamics_result.strip():
             logging.warning("character_dynamics_prompt generation failed.")
             save_partial_architecture_data(filepath, partial_data)
@@ -126,7 +126,7 @@ def Novel_architecture_generate(
         prompt_char_state_init = create_character_state_prompt.format(
             character_dynamics=partial_data["character_dynamics_result"].strip()
         )
-        character_state_init = invoke_with_cleaning(llm_adapter, prompt_char_state_init)
+        character_state_init = invoke_with_cleaning(llm_adapter, prompt_char_state_init, filepath=filepath, stage="architecture/character_state")
         if not character_state_init.strip():
             logging.warning("create_character_state_prompt generation failed.")
             save_partial_architecture_data(filepath, partial_data)
@@ -144,7 +144,7 @@ def Novel_architecture_generate(
             core_seed=partial_data["core_seed_result"].strip(),
             user_guidance=user_guidance  # 修复：添加用户指导
         )
-        world_building_result = invoke_with_cleaning(llm_adapter, prompt_world)
+        world_building_result = invoke_with_cleaning(llm_adapter, prompt_world, filepath=filepath, stage="architecture/world_building")
         if not world_building_result.strip():
             logging.warning("world_building_prompt generation failed.")
             save_partial_architecture_data(filepath, partial_data)
@@ -162,7 +162,7 @@ def Novel_architecture_generate(
             world_building=partial_data["world_building_result"].strip(),
             user_guidance=user_guidance  # 修复：添加用户指导
         )
-        plot_arch_result = invoke_with_cleaning(llm_adapter, prompt_plot)
+        plot_arch_result = invoke_with_cleaning(llm_adapter, prompt_plot, filepath=filepath, stage="architecture/plot")
         if not plot_arch_result.strip():
             logging.warning("plot_architecture_prompt generation failed.")
             save_partial_architecture_data(filepath, partial_data)
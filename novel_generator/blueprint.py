@@ -111,7 +111,7 @@ def Chapter_blueprint_generate(
                 user_guidance=user_guidance  # 新增参数
             )
             logging.info(f"Generating chapters [{current_start}..{current_end}] in a chunk...")
-            chunk_result = invoke_with_cleaning(llm_adapter, chunk_prompt)
+            chunk_result = invoke_with_cleaning(llm_adapter, chunk_prompt, filepath=filepath, stage="blueprint/chunk")
             if not chunk_result.strip():
                 logging.warning(f"Chunk generation for chapters [{current_start}..{current_end}] is empty.")
                 clear_file_content(filename_dir)
@@ -131,7 +131,7 @@ def Chapter_blueprint_generate(
             number_of_chapters=number_of_chapters,
             user_guidance=user_guidance  # 新增参数
         )
-        blueprint_text = invoke_with_cleaning(llm_adapter, prompt)
+        blueprint_text = invoke_with_cleaning(llm_adapter, prompt, filepath=filepath, stage="blueprint")
         if not blueprint_text.strip():
             logging.warning("Chapter blueprint generation result is empty.")
             return
@@ -156,7 +156,7 @@ def Chapter_blueprint_generate(
             user_guidance=user_guidance  # 新增参数
         )
         logging.info(f"Generating chapters [{current_start}..{current_end}] in a chunk...")
-        chunk_result = invoke_with_cleaning(llm_adapter, chunk_prompt)
+        chunk_result = invoke_with_cleaning(llm_adapter, chunk_prompt, filepath=filepath, stage="blueprint/chunk")
         if not chunk_result.strip():
             logging.warning(f"Chunk generation for chapters [{current_start}..{current_end}] is empty.")
             clear_file_content(filename_dir)
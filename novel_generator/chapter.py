@@ -16,11 +16,12 @@ from prompt_definitions import (
     knowledge_search_prompt
 )
 from chapter_directory_parser import get_chapter_info_from_blueprint
-from novel_generator.common import invoke_with_cleaning
+from novel_generator.common import invoke_with_cleaning, stream_with_cleaning
 from utils import read_file, clear_file_content, save_string_to_txt
 from novel_generator.vectorstore_utils import (
     get_relevant_context_from_vector_store,
-    load_vector_store  # 添加导入
+    load_vector_store,  # 添加导入
+    vector_store_size
 )
 
 def get_last_n_chapters_text(chapters_dir: str, current_chapter_num: int, n: int = 3) -> list:
@@ -49,7 +50,8 @@ def summarize_recent_chapters(
     novel_number: int,            # 新增参数
     chapter_info: dict,           # 新增参数
     next_chapter_info: dict,      # 新增参数
-    timeout: int = 600
+    timeout: int = 600,
+    filepath: str = None
 ) -> str:  # 修改返回值类型为 str，不再是 tuple
     """
     根据前三章内容生成当前章节的精准摘要。
@@ -99,7 +101,7 @@ def summarize_recent_chapters(
             next_chapter_plot_twist_level=next_chapter_info.get("plot_twist_level", "★☆☆☆☆")
         )
         
-        response_text = invoke_with_cleaning(llm_adapter, prompt)
+        response_text = invoke_with_cleaning(llm_adapter, prompt, filepath=filepath, use_cache=True, stage="chapter_prompt/summarize_recent")
         summary = extract_summary_from_response(response_text)
         
         if not summary:
@@ -262,7 +264,7 @@ def get_filtered_knowledge_context(
             retrieved_texts="\n\n".join(formatted_texts) if formatted_texts else "（无检索结果）"
         )
         
-        filtered_content = invoke_with_cleaning(llm_adapter, prompt)
+        filtered_content = invoke_with_cleaning(llm_adapter, prompt, filepath=filepath, use_cache=True, stage="chapter_prompt/knowledge_filter")
         return filtered_content if filtered_content else "（知识内容过滤失败）"
         
     except Exception as e:
@@ -369,7 +371,8 @@ def build_chapter_prompt(
             novel_number=novel_number,
             chapter_info=chapter_info,
             next_chapter_info=next_chapter_info,
-            timeout=timeout
+            timeout=timeout,
+            filepath=filepath
         )
         logging.info("Summary generated successfully")
     except Exception as e:
@@ -410,7 +413,7 @@ def build_chapter_prompt(
             time_constraint=time_constraint
         )
         
-        search_response = invoke_with_cleaning(llm_adapter, search_prompt)
+        search_response = invoke_with_cleaning(llm_adapter, search_prompt, filepath=filepath, use_cache=True, stage="chapter_prompt/search_keywords")
         keyword_groups = parse_search_keywords(search_response)
 
         # 执行向量检索
@@ -425,7 +428,7 @@ def build_chapter_prompt(
         
         store = load_vector_store(embedding_adapter, filepath)
         if store:
-            collection_size = store._collection.count()
+            collection_size = vector_store_size(store)
             actual_k = min(embedding_retrieval_k, max(1, collection_size))
             
             for group in keyword_groups:
@@ -531,10 +534,14 @@ def generate_chapter_draft(
     interface_format: str = "openai",
     max_tokens: int = 2048,
     timeout: int = 600,
-    custom_prompt_text: str = None
+    custom_prompt_text: str = None,
+    on_chunk=None,
+    on_reset=None
 ) -> str:
     """
-    生成章节草稿，支持自定义提示词
+    生成章节草稿，支持自定义提示词。
+    草稿以流式方式生成：增量文本边到达边写入临时文件，成功后替换 chapters/chapter_N.txt，
+    并回调 on_chunk(chunk)（如刷新界面）；重试丢弃半截内容时回调 on_reset()。
     """
     if custom_prompt_text is None:
         prompt_text = build_chapter_prompt(
@@ -575,11 +582,44 @@ def generate_chapter_draft(
         timeout=timeout
     )
 
-    chapter_content = invoke_with_cleaning(llm_adapter, prompt_text)
-    if not chapter_content.strip():
-        logging.warning("Generated chapter draft is empty.")
     chapter_file = os.path.join(chapters_dir, f"chapter_{novel_number}.txt")
-    clear_file_content(chapter_file)
-    save_string_to_txt(chapter_content, chapter_file)
+    # 草稿每次生成都应得到新的内容，不走响应缓存；流式写入临时文件，成功后再替换正式文件，
+    # 生成中途失败时保留原有草稿，不留下半截内容
+    partial_file = chapter_file + ".part"
+    try:
+        with open(partial_file, "w", encoding="utf-8") as f:
+            def write_chunk(chunk: str):
+                f.write(chunk)
+                f.flush()
+                if on_chunk:
+                    on_chunk(chunk)
+
+            def reset_output():
+                f.seek(0)
+                f.truncate()
+                if on_reset:
+                    on_reset()
+
+            chapter_content = stream_with_cleaning(
+                llm_adapter,
+                prompt_text,
+                on_chunk=write_chunk,
+                on_reset=reset_output,
+                filepath=filepath,
+                stage="chapter_draft"
+            )
+            # 用清理后的最终文本覆盖流式写入的原始内容
+            f.seek(0)
+            f.truncate()
+            f.write(chapter_content)
+    except Exception:
+        if os.path.exists(partial_file):
+            os.remove(partial_file)
+        raise
+    if not chapter_content.strip():
+        logging.warning("Generated chapter draft is empty, keeping the previous draft.")
+        os.remove(partial_file)
+        return chapter_content
+    os.replace(partial_file, chapter_file)
     logging.info(f"[Draft] Chapter {novel_number} generated as a draft.")
     return chapter_content
@@ -3,75 +3,208 @@
 """
 通用重试、清洗、日志工具
 """
+import asyncio
 import logging
 import re
-import time
+import threading
 import traceback
+from retry_policy import RetryPolicy, is_retryable_error
+from novel_generator.response_cache import get_response_cache
+from usage_ledger import usage_context
+from llm_logging import log_llm_exchange
 
-def call_with_retry(func, max_retries=3, sleep_time=2, fallback_return=None, **kwargs):
+# invoke_with_cleaning 等默认使用的重试策略：1s 起步、翻倍、全抖动、单次等待不超过 30s
+DEFAULT_RETRY_POLICY = RetryPolicy(max_retries=3, base_delay=1.0, max_delay=30.0)
+
+# 同步流程中的异步调用共用一个后台事件循环：各 SDK 的异步客户端在客户端池中复用，
+# 其连接绑定在首次使用时的事件循环上，每次 asyncio.run 新建循环会使池中的客户端失效
+_async_loop = None
+_async_loop_lock = threading.Lock()
+
+def run_async(coro):
+    """在共享的后台事件循环中运行协程，阻塞等待并返回结果（供工作线程中的同步流程调用）。"""
+    global _async_loop
+    with _async_loop_lock:
+        if _async_loop is None:
+            _async_loop = asyncio.new_event_loop()
+            threading.Thread(target=_async_loop.run_forever, daemon=True, name="llm-async-loop").start()
+    return asyncio.run_coroutine_threadsafe(coro, _async_loop).result()
+
+def call_with_retry(func, max_retries=3, sleep_time=2, fallback_return=None, deadline=None, **kwargs):
     """
     通用的重试机制封装。
     :param func: 要执行的函数
     :param max_retries: 最大重试次数
-    :param sleep_time: 重试前的等待秒数
+    :param sleep_time: 首次重试前的基础等待秒数，之后按带抖动的指数退避增长
     :param fallback_return: 如果多次重试仍失败时的返回值
+    :param deadline: 包含等待在内的总时限（秒），None 表示不限
     :param kwargs: 传给func的命名参数
     :return: func的结果，若失败则返回 fallback_return
     """
+    policy = RetryPolicy(max_retries=max_retries, base_delay=sleep_time, deadline=deadline)
+    started_at = policy.start()
     for attempt in range(1, max_retries + 1):
         try:
             return func(**kwargs)
         except Exception as e:
             logging.warning(f"[call_with_retry] Attempt {attempt} failed with error: {e}")
             traceback.print_exc()
-            if attempt < max_retries:
-                time.sleep(sleep_time)
-            else:
-                logging.error("Max retries reached, returning fallback_return.")
+            delay = policy.next_delay(attempt, started_at, e)
+            if delay is None:
+                if not is_retryable_error(e):
+                    logging.error("Non-retryable error, returning fallback_return.")
+                else:
+                    logging.error("Max retries or deadline reached, returning fallback_return.")
                 return fallback_return
+            policy.sleep(delay)
 
 def remove_think_tags(text: str) -> str:
     """移除 <think>...</think> 包裹的内容"""
     return re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL)
 
 def debug_log(prompt: str, response_content: str):
-    logging.info(
-        f"\n[#########################################  Prompt  #########################################]\n{prompt}\n"
-    )
-    logging.info(
-        f"\n[######################################### Response #########################################]\n{response_content}\n"
-    )
+    log_llm_exchange("debug_log", prompt, response_content)
 
-def invoke_with_cleaning(llm_adapter, prompt: str, max_retries: int = 3) -> str:
-    """调用 LLM 并清理返回结果"""
-    print("\n" + "="*50)
-    print("发送到 LLM 的提示词:")
-    print("-"*50)
-    print(prompt)
-    print("="*50 + "\n")
-    
+def _lookup_response_cache(llm_adapter, prompt: str, filepath: str, use_cache: bool, refresh_cache: bool):
+    """返回 (cache, cache_key, cached_text)；未开启缓存时 cache 为 None。"""
+    cache = get_response_cache(filepath) if use_cache else None
+    if cache is None:
+        return None, None, None
+    try:
+        cache_key = llm_adapter.cache_key(prompt)
+    except Exception as e:
+        logging.debug(f"Response cache disabled for this adapter: {e}")
+        return None, None, None
+    cached = None if refresh_cache else cache.get(cache_key)
+    return cache, cache_key, cached
+
+def invoke_with_cleaning(llm_adapter, prompt: str, max_retries: int = 3, filepath: str = None, use_cache: bool = False, refresh_cache: bool = False, deadline: float = None, stage: str = None) -> str:
+    """
+    调用 LLM 并清理返回结果
+    失败或返回为空时按 DEFAULT_RETRY_POLICY 退避重试；鉴权失败、模型不存在、上下文超长等致命错误立即抛出。
+    :param filepath: 项目目录；开启响应缓存时，缓存文件存放于此
+    :param use_cache: True 时读写响应缓存；默认关闭，只用于结果可复用的辅助步骤（摘要、检索关键词等），
+                      需要每次得到新内容的生成阶段（架构、目录、定稿）不应开启
+    :param refresh_cache: True 时忽略已有缓存、重新请求并覆盖
+    :param deadline: 包含重试等待在内的总时限（秒），None 表示不限
+    :param stage: 调用阶段名，与 filepath 一起记入项目的用量台账 llm_usage.jsonl
+    """
+    cache, cache_key, cached = _lookup_response_cache(llm_adapter, prompt, filepath, use_cache, refresh_cache)
+    if cached:
+        logging.info("[invoke_with_cleaning] Response cache hit.")
+        return cached
+
+    policy = _retry_policy(max_retries, deadline)
+    started_at = policy.start()
     result = ""
-    retry_count = 0
     
-    while retry_count < max_retries:
+    for attempt in range(1, max_retries + 1):
+        error = None
         try:
-            result = llm_adapter.invoke(prompt)
-            print("\n" + "="*50)
-            print("LLM 返回的内容:")
-            print("-"*50)
-            print(result)
-            print("="*50 + "\n")
-            
+            with usage_context(project=filepath, stage=stage):
+                result = llm_adapter.invoke(prompt)
+                log_llm_exchange("invoke_with_cleaning", prompt, result, attempt=attempt)
+
             # 清理结果中的特殊格式标记
             result = result.replace("```", "").strip()
             if result:
+                if cache is not None:
+                    cache.put(cache_key, result)
                 return result
-            retry_count += 1
         except Exception as e:
-            print(f"调用失败 ({retry_count + 1}/{max_retries}): {str(e)}")
-            retry_count += 1
-            if retry_count >= max_retries:
-                raise e
+            logging.warning(f"调用失败 ({attempt}/{max_retries}): {str(e)}")
+            error = e
+        delay = policy.next_delay(attempt, started_at, error)
+        if delay is None:
+            if error is not None:
+                raise error
+            break
+        policy.sleep(delay)
     
     return result
 
+async def ainvoke_with_cleaning(llm_adapter, prompt: str, max_retries: int = 3, filepath: str = None, use_cache: bool = False, refresh_cache: bool = False, deadline: float = None, stage: str = None) -> str:
+    """
+    invoke_with_cleaning 的异步版本，基于 llm_adapter.ainvoke，
+    可在同一事件循环中用 asyncio.gather 并发等待多个阶段的请求。
+    """
+    cache, cache_key, cached = _lookup_response_cache(llm_adapter, prompt, filepath, use_cache, refresh_cache)
+    if cached:
+        logging.info("[ainvoke_with_cleaning] Response cache hit.")
+        return cached
+
+    policy = _retry_policy(max_retries, deadline)
+    started_at = policy.start()
+    result = ""
+
+    for attempt in range(1, max_retries + 1):
+        error = None
+        try:
+            with usage_context(project=filepath, stage=stage):
+                result = await llm_adapter.ainvoke(prompt)
+                log_llm_exchange("ainvoke_with_cleaning", prompt, result, attempt=attempt)
+            result = result.replace("```", "").strip()
+            if result:
+                if cache is not None:
+                    cache.put(cache_key, result)
+                return result
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning(f"异步调用失败 ({attempt}/{max_retries}): {str(e)}")
+            error = e
+        delay = policy.next_delay(attempt, started_at, error)
+        if delay is None:
+            if error is not None:
+                raise error
+            break
+        await policy.asleep(delay)
+
+    return result
+
+def _retry_policy(max_retries: int, deadline: float = None) -> RetryPolicy:
+    """在默认退避参数基础上套用本次调用的重试次数与时限。"""
+    return RetryPolicy(
+        max_retries=max_retries,
+        base_delay=DEFAULT_RETRY_POLICY.base_delay,
+        max_delay=DEFAULT_RETRY_POLICY.max_delay,
+        multiplier=DEFAULT_RETRY_POLICY.multiplier,
+        deadline=deadline if deadline is not None else DEFAULT_RETRY_POLICY.deadline
+    )
+
+def stream_with_cleaning(llm_adapter, prompt: str, on_chunk=None, on_reset=None, max_retries: int = 3, deadline: float = None, filepath: str = None, stage: str = None) -> str:
+    """
+    流式调用 LLM：每收到一段增量文本就交给 on_chunk，最终返回清理后的完整结果。
+    若某次尝试失败或结果为空，重试前会先调用 on_reset，让写入端丢弃已收到的半截内容。
+    filepath / stage 用于记入项目的用量台账。
+    """
+    policy = _retry_policy(max_retries, deadline)
+    started_at = policy.start()
+    result = ""
+
+    for attempt in range(1, max_retries + 1):
+        parts = []
+        error = None
+        try:
+            with usage_context(project=filepath, stage=stage):
+                for chunk in llm_adapter.invoke_stream(prompt):
+                    parts.append(chunk)
+                    if on_chunk:
+                        on_chunk(chunk)
+                log_llm_exchange("stream_with_cleaning", prompt, "".join(parts), attempt=attempt)
+            result = "".join(parts).replace("```", "").strip()
+            if result:
+                return result
+        except Exception as e:
+            logging.warning(f"流式调用失败 ({attempt}/{max_retries}): {str(e)}")
+            error = e
+        delay = policy.next_delay(attempt, started_at, error)
+        if delay is None:
+            if error is not None:
+                raise error
+            break
+        if parts and on_reset:
+            on_reset()
+        policy.sleep(delay)
+
+    return result
@@ -4,11 +4,12 @@
 定稿章节和扩写章节（finalize_chapter、enrich_chapter_text）
 """
 import os
+import asyncio
 import logging
 from llm_adapters import create_llm_adapter
 from embedding_adapters import create_embedding_adapter
 from prompt_definitions import summary_prompt, update_character_state_prompt
-from novel_generator.common import invoke_with_cleaning
+from novel_generator.common import invoke_with_cleaning, ainvoke_with_cleaning, run_async
 from utils import read_file, clear_file_content, save_string_to_txt
 from novel_generator.vectorstore_utils import update_vector_store
 
@@ -58,15 +59,21 @@ def finalize_chapter(
         chapter_text=chapter_text,
         global_summary=old_global_summary
     )
-    new_global_summary = invoke_with_cleaning(llm_adapter, prompt_summary)
-    if not new_global_summary.strip():
-        new_global_summary = old_global_summary
-
     prompt_char_state = update_character_state_prompt.format(
         chapter_text=chapter_text,
         old_state=old_character_state
     )
-    new_char_state = invoke_with_cleaning(llm_adapter, prompt_char_state)
+
+    # 前文摘要与角色状态都只依赖本章正文和各自的旧内容，两个请求并发等待
+    async def update_summary_and_state():
+        return await asyncio.gather(
+            ainvoke_with_cleaning(llm_adapter, prompt_summary, filepath=filepath, stage="finalize/global_summary"),
+            ainvoke_with_cleaning(llm_adapter, prompt_char_state, filepath=filepath, stage="finalize/character_state")
+        )
+
+    new_global_summary, new_char_state = run_async(update_summary_and_state())
+    if not new_global_summary.strip():
+        new_global_summary = old_global_summary
     if not new_char_state.strip():
         new_char_state = old_character_state
 
@@ -115,5 +122,5 @@ def enrich_chapter_text(
 原内容：
 {chapter_text}
 """
-    enriched_text = invoke_with_cleaning(llm_adapter, prompt)
+    enriched_text = invoke_with_cleaning(llm_adapter, prompt, stage="enrich_chapter")
     return enriched_text if enriched_text else chapter_text
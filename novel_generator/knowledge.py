@@ -4,14 +4,14 @@
 知识文件导入至向量库（advanced_split_content、import_knowledge_file）
 """
 import os
+import hashlib
+import json
 import logging
 import re
 import traceback
-import nltk
 import warnings
 from utils import read_file
-from novel_generator.vectorstore_utils import load_vector_store, init_vector_store
-from langchain.docstore.document import Document
+from novel_generator.vectorstore_utils import embed_into_vector_store, get_vectorstore_dir
 
 # 禁用特定的Torch警告
 warnings.filterwarnings('ignore', message='.*Torch was not compiled with flash attention.*')
@@ -19,6 +19,7 @@ os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
 def advanced_split_content(content: str, similarity_threshold: float = 0.7, max_length: int = 500) -> list:
     """使用基本分段策略"""
+    import nltk
     nltk.download('punkt', quiet=True)
     nltk.download('punkt_tab', quiet=True)
     sentences = nltk.sent_tokenize(content)
@@ -45,6 +46,30 @@ def advanced_split_content(content: str, similarity_threshold: float = 0.7, max_
     
     return final_segments
 
+# 导入断点：放在向量库目录中，清空向量库时一并删除。
+# 格式为 {文件内容哈希: {"file": 路径, "segments": 总段数, "committed": 已写入段数}}
+CHECKPOINT_FILE = "import_checkpoints.json"
+
+def _load_checkpoints(filepath: str) -> dict:
+    path = os.path.join(get_vectorstore_dir(filepath), CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"导入断点文件损坏，将从头导入: {e}")
+        return {}
+
+def _save_checkpoints(filepath: str, checkpoints: dict):
+    """先写临时文件再替换，写入中途崩溃不会留下损坏的断点文件。"""
+    store_dir = get_vectorstore_dir(filepath)
+    os.makedirs(store_dir, exist_ok=True)
+    path = os.path.join(store_dir, CHECKPOINT_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(checkpoints, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
 def import_knowledge_file(
     embedding_api_key: str,
     embedding_url: str,
@@ -62,6 +87,15 @@ def import_knowledge_file(
         logging.warning("知识库文件内容为空。")
         return
     paragraphs = advanced_split_content(content)
+    # 分段方式固定，同一文件内容总是得到相同的分段序列，可按内容哈希续传
+    source_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    checkpoints = _load_checkpoints(filepath)
+    committed = min(checkpoints.get(source_hash, {}).get("committed", 0), len(paragraphs))
+    if committed >= len(paragraphs):
+        logging.info(f"知识库文件已导入过（共 {len(paragraphs)} 段），跳过。")
+        return
+    if committed:
+        logging.info(f"从断点继续导入知识库：已完成 {committed}/{len(paragraphs)} 段。")
     from embedding_adapters import create_embedding_adapter
     embedding_adapter = create_embedding_adapter(
         embedding_interface_format,
@@ -69,19 +103,20 @@ def import_knowledge_file(
         embedding_url if embedding_url else "http://localhost:11434/api",
         embedding_model_name
     )
-    store = load_vector_store(embedding_adapter, filepath)
-    if not store:
-        logging.info("Vector store does not exist or load failed. Initializing a new one for knowledge import...")
-        store = init_vector_store(embedding_adapter, paragraphs, filepath)
-        if store:
-            logging.info("知识库文件已成功导入至向量库(新初始化)。")
+
+    def record(written):
+        checkpoints[source_hash] = {"file": file_path, "segments": len(paragraphs), "committed": committed + written}
+        _save_checkpoints(filepath, checkpoints)
+
+    try:
+        # 固定的分段 ID 保证写入后、记录断点前崩溃时，续传只会覆盖而不会重复插入
+        ids = [f"knowledge-{source_hash[:16]}-{i}" for i in range(committed, len(paragraphs))]
+        written = embed_into_vector_store(embedding_adapter, paragraphs[committed:], filepath, ids=ids, on_commit=record)
+        done = committed + written
+        if done == len(paragraphs):
+            logging.info(f"知识库文件已成功导入至向量库，共 {done} 段。")
         else:
-            logging.warning("知识库导入失败，跳过。")
-    else:
-        try:
-            docs = [Document(page_content=str(p)) for p in paragraphs]
-            store.add_documents(docs)
-            logging.info("知识库文件已成功导入至向量库(追加模式)。")
-        except Exception as e:
-            logging.warning(f"知识库导入失败: {e}")
-            traceback.print_exc()
+            logging.warning(f"知识库导入在第 {done + 1}/{len(paragraphs)} 段嵌入失败，已保存断点，重新导入同一文件将从此处继续。")
+    except Exception as e:
+        logging.warning(f"知识库导入失败: {e}")
+        traceback.print_exc()
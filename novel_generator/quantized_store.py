@@ -0,0 +1,274 @@
+#novel_generator/quantized_store.py
+# -*- coding: utf-8 -*-
+"""
+紧凑的量化向量库：常驻内存的只有 float16 或 int8（每个向量一个缩放系数）编码，
+原始 float32 向量以追加写的方式留在磁盘上，检索时先用量化编码粗排，再从磁盘读出前若干名候选按 float32 精排。
+与 Chroma 向量库提供相同的 similarity_search / add_documents 用法，供 vectorstore_utils 按配置选用。
+"""
+import json
+import logging
+import os
+import threading
+from typing import List
+
+META_FILE = "quantized_meta.json"
+CODES_FILE = "codes.bin"
+SCALES_FILE = "scales.bin"
+VECTORS_FILE = "vectors.f32"
+DOCUMENTS_FILE = "documents.jsonl"
+IDS_FILE = "ids.jsonl"
+
+# 粗排时每次解码并参与矩阵乘法的行数：解码缓冲区（384 维时约 1.5 MB）能留在 CPU 缓存中，
+# 解码与乘法之间不必回到主存
+_SCAN_ROWS = 1024
+
+def is_quantized_store(store_dir: str) -> bool:
+    return os.path.exists(os.path.join(store_dir, META_FILE))
+
+def quantize(vectors, dtype: str):
+    """把已归一化的 float32 向量编码为 (codes, scales)；float16 不需要缩放系数，scales 全为 1。"""
+    import numpy as np
+    if dtype == "float16":
+        return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+    if dtype != "int8":
+        raise ValueError(f"Unknown quantized dtype: {dtype}")
+    peaks = np.abs(vectors).max(axis=1)
+    scales = np.where(peaks > 0, peaks / 127.0, 1.0).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+def normalize(vectors):
+    import numpy as np
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+class QuantizedVectorStore:
+    """
+    按余弦相似度检索。文件布局（均为追加写，meta 中的 count 之后的残留行视为未提交）：
+    codes.bin / scales.bin 量化编码与缩放系数；vectors.f32 精排用的原始向量（rescore 为 0 时不写）；
+    documents.jsonl 每行一个分段文本；ids.jsonl 每行一个分段 ID（未指定时为 null）。
+    写入时 ID 已存在的行原地覆盖而不是追加，与 Chroma 的 upsert 语义一致。
+    """
+    def __init__(self, store_dir: str, embedding_adapter=None, dtype: str = "int8", rescore: int = 4):
+        import numpy as np
+        self.store_dir = store_dir
+        self.embedding_adapter = embedding_adapter
+        self._lock = threading.RLock()
+        os.makedirs(store_dir, exist_ok=True)
+        meta_path = os.path.join(store_dir, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        else:
+            meta = {"dtype": dtype, "dim": 0, "count": 0, "float32": rescore > 0}
+        self.dtype = meta["dtype"]
+        self.dim = meta["dim"]
+        self.size = meta["count"]
+        self.has_float32 = meta["float32"]
+        self.rescore = rescore if self.has_float32 else 0
+        code_type = np.int8 if self.dtype == "int8" else np.float16
+        if self.size:
+            self.codes = np.fromfile(self._path(CODES_FILE), dtype=code_type, count=self.size * self.dim).reshape(self.size, self.dim)
+            self.scales = np.fromfile(self._path(SCALES_FILE), dtype=np.float32, count=self.size)
+        else:
+            self.codes = np.zeros((0, self.dim), dtype=code_type)
+            self.scales = np.zeros(0, dtype=np.float32)
+        lines = self._read_lines(DOCUMENTS_FILE)
+        self.documents = [json.loads(line) for line in lines[:self.size]]
+        id_lines = self._read_lines(IDS_FILE)
+        # 旧版本的库没有 ids.jsonl，缺少的行按无 ID 处理
+        self.ids = [json.loads(line) for line in id_lines[:self.size]]
+        self.ids += [None] * (self.size - len(self.ids))
+        self._rows = {segment_id: row for row, segment_id in enumerate(self.ids) if segment_id is not None}
+        # 新写入的编码先攒在列表里，检索前一次性合并，避免每批都复制整个数组
+        self._pending = []
+        self._truncate_uncommitted(len(lines) > self.size, len(id_lines) != self.size)
+        if not os.path.exists(meta_path):
+            self._write_meta()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.store_dir, name)
+
+    def _read_lines(self, name: str) -> List[str]:
+        if not os.path.exists(self._path(name)):
+            return []
+        with open(self._path(name), "r", encoding="utf-8") as f:
+            return f.readlines()
+
+    def _truncate_uncommitted(self, extra_documents: bool, mismatched_ids: bool):
+        """丢弃上次写入中断时留在文件末尾、但未记入 meta 的行。"""
+        sizes = {
+            CODES_FILE: self.codes.nbytes,
+            SCALES_FILE: self.scales.nbytes,
+            VECTORS_FILE: self.size * self.dim * 4,
+        }
+        for name, size in sizes.items():
+            path = self._path(name)
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+        if extra_documents:
+            with open(self._path(DOCUMENTS_FILE), "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(text, ensure_ascii=False) + "\n" for text in self.documents)
+        if mismatched_ids:
+            self._rewrite_lines(IDS_FILE, self.ids)
+
+    def _rewrite_lines(self, name: str, values):
+        tmp_path = self._path(name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(value, ensure_ascii=False) + "\n" for value in values)
+        os.replace(tmp_path, self._path(name))
+
+    def count(self) -> int:
+        return self.size
+
+    def memory_bytes(self) -> int:
+        """常驻内存的向量数据大小（不含文本）。"""
+        self._merge_pending()
+        return self.codes.nbytes + self.scales.nbytes
+
+    def _merge_pending(self):
+        import numpy as np
+        with self._lock:
+            if self._pending:
+                self.codes = np.concatenate([self.codes] + [codes for codes, _ in self._pending])
+                self.scales = np.concatenate([self.scales] + [scales for _, scales in self._pending])
+                self._pending = []
+            return self.codes, self.scales, self.size
+
+    def add_embeddings(self, texts: List[str], vectors: List[List[float]], ids: List[str] = None):
+        """
+        写入已算好的向量；新行先追加数据文件，最后原子替换 meta 提交。
+        ids 中已存在的 ID 覆盖原有的行（定长的编码 / 向量原地改写，文本文件整体替换）。
+        """
+        if not texts:
+            return
+        vectors = normalize(vectors)
+        ids = list(ids) if ids is not None else [None] * len(texts)
+        with self._lock:
+            if not self.dim:
+                self.dim = int(vectors.shape[1])
+                self.codes = self.codes.reshape(0, self.dim)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match store dimension {self.dim}.")
+            # 同一批内重复的 ID 以最后一次为准
+            last = {segment_id: i for i, segment_id in enumerate(ids) if segment_id is not None}
+            keep = [i for i, segment_id in enumerate(ids) if segment_id is None or last[segment_id] == i]
+            replaced = [i for i in keep if ids[i] in self._rows]
+            appended = [i for i in keep if ids[i] not in self._rows]
+            if replaced:
+                self._replace_rows([self._rows[ids[i]] for i in replaced], [texts[i] for i in replaced],
+                                   vectors[replaced])
+            if appended:
+                self._append_rows([texts[i] for i in appended], vectors[appended], [ids[i] for i in appended])
+
+    def _append_rows(self, texts: List[str], vectors, ids: List[str]):
+        codes, scales = quantize(vectors, self.dtype)
+        with open(self._path(CODES_FILE), "ab") as f:
+            f.write(codes.tobytes())
+        with open(self._path(SCALES_FILE), "ab") as f:
+            f.write(scales.tobytes())
+        if self.has_float32:
+            with open(self._path(VECTORS_FILE), "ab") as f:
+                f.write(vectors.tobytes())
+        with open(self._path(DOCUMENTS_FILE), "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(str(t), ensure_ascii=False) + "\n" for t in texts)
+        with open(self._path(IDS_FILE), "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(segment_id, ensure_ascii=False) + "\n" for segment_id in ids)
+        self._pending.append((codes, scales))
+        self.documents.extend(str(t) for t in texts)
+        for segment_id in ids:
+            if segment_id is not None:
+                self._rows[segment_id] = self.size
+            self.ids.append(segment_id)
+            self.size += 1
+        self._write_meta()
+
+    def _replace_rows(self, rows: List[int], texts: List[str], vectors):
+        """原地覆盖已提交的行；行数不变，meta 无需更新。"""
+        codes, scales = quantize(vectors, self.dtype)
+        self._merge_pending()
+        files = [(CODES_FILE, codes, codes.itemsize * self.dim), (SCALES_FILE, scales, 4)]
+        if self.has_float32:
+            files.append((VECTORS_FILE, vectors, 4 * self.dim))
+        for name, values, row_bytes in files:
+            with open(self._path(name), "r+b") as f:
+                for row, value in zip(rows, values):
+                    f.seek(row * row_bytes)
+                    f.write(value.tobytes())
+        for row, text, code, scale in zip(rows, texts, codes, scales):
+            self.codes[row] = code
+            self.scales[row] = scale
+            self.documents[row] = str(text)
+        self._rewrite_lines(DOCUMENTS_FILE, self.documents)
+
+    def _write_meta(self):
+        meta = {"dtype": self.dtype, "dim": self.dim, "count": self.size, "float32": self.has_float32}
+        tmp_path = self._path(META_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._path(META_FILE))
+
+    def destroy(self):
+        """删除本库的数据文件（目录中的其他文件保留），子目录为空时一并删除。"""
+        with self._lock:
+            for name in (META_FILE, META_FILE + ".tmp", CODES_FILE, SCALES_FILE, VECTORS_FILE, DOCUMENTS_FILE,
+                         DOCUMENTS_FILE + ".tmp", IDS_FILE, IDS_FILE + ".tmp"):
+                path = self._path(name)
+                if os.path.exists(path):
+                    os.remove(path)
+            self._pending = []
+            self.size = 0
+            self.documents = []
+            self.ids = []
+            self._rows = {}
+        try:
+            os.rmdir(self.store_dir)
+        except OSError:
+            pass
+
+    def add_documents(self, documents):
+        """与 Chroma 相同的入口：用 embedding_adapter 嵌入后写入，嵌入失败的分段跳过。"""
+        texts = [d.page_content for d in documents]
+        vectors = self.embedding_adapter.embed_documents(texts)
+        pairs = [(t, v) for t, v in zip(texts, vectors) if v]
+        self.add_embeddings([t for t, _ in pairs], [v for _, v in pairs])
+
+    def search_vectors(self, query_vector, k: int) -> List[tuple]:
+        """返回 [(行号, 相似度)]，按相似度降序。"""
+        import numpy as np
+        codes, scales, count = self._merge_pending()
+        if not count or k <= 0:
+            return []
+        query = normalize(query_vector).reshape(-1)
+        candidates = min(count, k * self.rescore if self.rescore > 0 else k)
+        scores = np.empty(count, dtype=np.float32)
+        # numpy 的 float16 / int8 矩阵乘法没有 BLAS 加速（float16 直接相乘比先转换还慢），
+        # 因此逐块解码到复用的 float32 缓冲区后再乘；float16 的解码本身比 int8 慢得多，检索耗时高于 int8
+        buffer = np.empty((min(count, _SCAN_ROWS), self.dim), dtype=np.float32)
+        for start in range(0, count, _SCAN_ROWS):
+            end = min(start + _SCAN_ROWS, count)
+            block = buffer[:end - start]
+            np.copyto(block, codes[start:end], casting="unsafe")
+            np.dot(block, query, out=scores[start:end])
+        scores *= scales[:count]
+        top = np.argpartition(-scores, candidates - 1)[:candidates] if candidates < count else np.arange(count)
+        if self.rescore > 0:
+            # 精排只从磁盘读取候选行，float32 向量本身不常驻内存
+            stored = np.memmap(self._path(VECTORS_FILE), dtype=np.float32, mode="r", shape=(count, self.dim))
+            top = np.sort(top)
+            exact = np.asarray(stored[top]) @ query
+            del stored
+            order = np.argsort(-exact)[:k]
+            return [(int(top[i]), float(exact[i])) for i in order]
+        order = top[np.argsort(-scores[top])][:k]
+        return [(int(i), float(scores[i])) for i in order]
+
+    def similarity_search(self, query: str, k: int = 4):
+        from langchain.docstore.document import Document
+        vector = self.embedding_adapter.embed_query(query)
+        if not vector:
+            logging.warning("Query embedding failed, returning no documents.")
+            return []
+        return [Document(page_content=self.documents[i]) for i, _ in self.search_vectors(vector, k)]
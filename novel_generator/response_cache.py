@@ -0,0 +1,139 @@
+#novel_generator/response_cache.py
+# -*- coding: utf-8 -*-
+"""
+LLM 响应持久化缓存（可选开启），位于项目目录下的 SQLite 文件中。
+键由适配器身份、模型、temperature、max_tokens 与提示词哈希组成，见 BaseLLMAdapter.cache_key。
+"""
+import os
+import time
+import logging
+import sqlite3
+import threading
+
+CACHE_FILE_NAME = "llm_response_cache.sqlite3"
+
+# 进程级缓存设置，由 configure_response_cache 根据 config.json 的 "response_cache" 段落更新
+_settings = {
+    "enabled": False,
+    "max_entries": 5000,
+    "max_size_mb": 200,
+    "max_age_days": 30
+}
+_caches = {}
+_caches_lock = threading.Lock()
+
+def configure_response_cache(enabled: bool = False, max_entries: int = 5000, max_size_mb: float = 200, max_age_days: float = 30):
+    """更新缓存设置；已打开的缓存实例会同步新的淘汰阈值。"""
+    _settings.update(
+        enabled=bool(enabled),
+        max_entries=int(max_entries),
+        max_size_mb=float(max_size_mb),
+        max_age_days=float(max_age_days)
+    )
+    with _caches_lock:
+        for cache in _caches.values():
+            cache.max_entries = _settings["max_entries"]
+            cache.max_bytes = int(_settings["max_size_mb"] * 1024 * 1024)
+            cache.max_age = _settings["max_age_days"] * 86400
+
+def get_response_cache(filepath: str):
+    """
+    返回 filepath 对应项目的缓存实例；未开启缓存或 filepath 为空时返回 None。
+    """
+    if not _settings["enabled"] or not filepath:
+        return None
+    db_path = os.path.abspath(os.path.join(filepath, CACHE_FILE_NAME))
+    with _caches_lock:
+        cache = _caches.get(db_path)
+        if cache is None:
+            try:
+                cache = ResponseCache(
+                    db_path,
+                    max_entries=_settings["max_entries"],
+                    max_size_mb=_settings["max_size_mb"],
+                    max_age_days=_settings["max_age_days"]
+                )
+            except Exception as e:
+                logging.warning(f"Failed to open response cache {db_path}: {e}")
+                return None
+            _caches[db_path] = cache
+        return cache
+
+class ResponseCache:
+    """
+    基于 SQLite 的 prompt→response 缓存，带条目数、总大小、存活时间三种淘汰策略（LRU 顺序）。
+    """
+    def __init__(self, db_path: str, max_entries: int = 5000, max_size_mb: float = 200, max_age_days: float = 30):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self.max_age = max_age_days * 86400
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at)")
+        self._conn.commit()
+        self._evict()
+
+    def get(self, key: str):
+        """命中返回缓存文本，未命中或已过期返回 None。"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            response, created_at = row
+            if self.max_age > 0 and now - created_at > self.max_age:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return response
+
+    def put(self, key: str, response: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, response, len(response.encode("utf-8")), now, now)
+            )
+            self._conn.commit()
+        self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def _evict(self):
+        """按存活时间、条目数、总大小依次淘汰，后两者按最近访问时间从旧到新删除。"""
+        with self._lock:
+            if self.max_age > 0:
+                self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age,))
+            if self.max_entries > 0:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+            if self.max_bytes > 0:
+                total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                if total > self.max_bytes:
+                    rows = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at ASC").fetchall()
+                    stale = []
+                    for key, size in rows:
+                        if total <= self.max_bytes:
+                            break
+                        stale.append((key,))
+                        total -= size
+                    self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+            self._conn.commit()
@@ -4,24 +4,58 @@
 向量库相关操作（初始化、更新、检索、清空、文本切分等）
 """
 import os
+import hashlib
+import json
 import logging
+import threading
+import time
 import traceback
-import nltk
-import numpy as np
 import re
-import ssl
-import requests
 import warnings
-from langchain_chroma import Chroma
 
 # 禁用特定的Torch警告
 warnings.filterwarnings('ignore', message='.*Torch was not compiled with flash attention.*')
 os.environ["TOKENIZERS_PARALLELISM"] = "false"  # 禁用tokenizer并行警告
 
-from chromadb.config import Settings
-from langchain.docstore.document import Document
-from sklearn.metrics.pairwise import cosine_similarity
+# chromadb / langchain / nltk 较重，在首次用到向量库的函数内再导入，不拖慢界面启动
 from .common import call_with_retry
+from .quantized_store import QuantizedVectorStore, is_quantized_store
+
+# 新建向量库时的存储方式，由 configure_vector_store 根据 config.json 的 "vector_store" 段落更新；
+# 已存在的向量库始终按其实际格式打开
+_store_settings = {
+    "mode": "chroma",
+    "dtype": "int8",
+    "rescore": 4,
+}
+
+# 向量库目录中的模型指纹：记录生成向量的 embedding 模型、维度、存储格式与当前使用的 collection。
+# 切换模型后旧 collection 继续用旧模型检索，后台任务用新模型重新嵌入全部分段，完成后原子替换指纹切换过去。
+FINGERPRINT_FILE = "embedding_fingerprint.json"
+DEFAULT_COLLECTION = "novel_collection"
+# 迁移失败后，这段时间内不再自动重试（秒）
+MIGRATION_RETRY_SECONDS = 600
+# 写入前等待迁移完成的最长时间（秒），超时后放弃本次写入而不是一直阻塞调用线程
+MIGRATION_WAIT_SECONDS = 300
+
+_migrations = {}
+_migration_failures = {}
+_migrations_lock = threading.Lock()
+
+# 进程内共享的向量库句柄，键为 (向量库目录, 格式, collection, 模型标识)。每次检索复用同一个 Chroma 客户端，
+# 只在清空向量库或迁移切换 collection 时失效
+_store_handles = {}
+_store_handles_lock = threading.RLock()
+
+def configure_vector_store(mode: str = "chroma", dtype: str = "int8", rescore: int = 4):
+    """mode 为 "chroma" 或 "quantized"；dtype 为 "int8" 或 "float16"；rescore 为精排候选倍数，0 表示不保留 float32 向量。"""
+    _store_settings.update(mode=mode.strip().lower(), dtype=dtype.strip().lower(), rescore=max(0, int(rescore)))
+
+def vector_store_size(store) -> int:
+    """向量库中的分段数。"""
+    if isinstance(store, QuantizedVectorStore):
+        return store.count()
+    return store._collection.count()
 
 def get_vectorstore_dir(filepath: str) -> str:
     """获取 vectorstore 路径"""
@@ -31,6 +65,7 @@ def clear_vector_store(filepath: str) -> bool:
     """清空 清空向量库"""
     import shutil
     store_dir = get_vectorstore_dir(filepath)
+    _invalidate_store_handles(store_dir)
     if not os.path.exists(store_dir):
         logging.info("No vector store found to clear.")
         return False
@@ -43,44 +78,137 @@ def clear_vector_store(filepath: str) -> bool:
         traceback.print_exc()
         return False
 
-def init_vector_store(embedding_adapter, texts, filepath: str):
+def _read_fingerprint(store_dir: str):
+    path = os.path.join(store_dir, FINGERPRINT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _write_fingerprint(store_dir: str, fingerprint: dict):
+    """先写临时文件再替换，切换 collection 是一次原子操作。"""
+    path = os.path.join(store_dir, FINGERPRINT_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(fingerprint, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+def _adapter_fingerprint(embedding_adapter) -> dict:
+    """适配器的模型指纹；未经 create_embedding_adapter 创建的适配器没有指纹，视为与任何向量库一致。"""
+    return dict(getattr(embedding_adapter, "fingerprint", None) or {})
+
+def _new_fingerprint(embedding_adapter, store_format: str, collection: str, dim=None) -> dict:
+    fingerprint = _adapter_fingerprint(embedding_adapter)
+    fingerprint.setdefault("identity", "unknown")
+    fingerprint.update(format=store_format, collection=collection, dim=dim)
+    return fingerprint
+
+def _quantized_dir(store_dir: str, collection: str) -> str:
+    """默认 collection 的量化文件直接放在向量库目录下，迁移产生的 collection 放在同名子目录中。"""
+    return store_dir if collection == DEFAULT_COLLECTION else os.path.join(store_dir, collection)
+
+def _open_store(embedding_adapter, store_dir: str, fingerprint: dict):
+    """按指纹中的格式与 collection 打开向量库，检索时用 embedding_adapter 嵌入查询。"""
+    collection = fingerprint.get("collection", DEFAULT_COLLECTION)
+    if fingerprint.get("format") == "quantized":
+        return QuantizedVectorStore(_quantized_dir(store_dir, collection), embedding_adapter,
+                                    _store_settings["dtype"], _store_settings["rescore"])
+
+    from langchain_chroma import Chroma
+    from chromadb.config import Settings
+    from langchain.embeddings.base import Embeddings as LCEmbeddings
+
+    class LCEmbeddingWrapper(LCEmbeddings):
+        # 缓存的句柄会换成调用方最新的适配器（模型相同，密钥等可能已更新），见 _get_store
+        adapter = embedding_adapter
+
+        def embed_documents(self, texts):
+            return call_with_retry(
+                func=self.adapter.embed_documents,
+                max_retries=3,
+                fallback_return=[],
+                texts=texts
+            )
+        def embed_query(self, query: str):
+            res = call_with_retry(
+                func=self.adapter.embed_query,
+                max_retries=3,
+                fallback_return=[],
+                query=query
+            )
+            return res
+
+    chroma_embedding = LCEmbeddingWrapper()
+    return Chroma(
+        persist_directory=store_dir,
+        embedding_function=chroma_embedding,
+        client_settings=Settings(anonymized_telemetry=False),
+        collection_name=collection
+    )
+
+def _get_store(store_dir: str, fingerprint: dict, embedding_adapter=None, create_adapter=None):
     """
-    在 filepath 下创建/加载一个 Chroma 向量库并插入 texts。
-    如果Embedding失败，则返回 None，不中断任务。
+    返回共享的向量库句柄，不存在时打开并缓存。传入 embedding_adapter 时句柄改用它嵌入查询；
+    只有需要新打开时才调用 create_adapter（例如重建旧模型的适配器）。
     """
-    from langchain.embeddings.base import Embeddings as LCEmbeddings
+    key = (os.path.abspath(store_dir), fingerprint.get("format"), fingerprint.get("collection"), fingerprint["identity"])
+    with _store_handles_lock:
+        store = _store_handles.get(key)
+        if store is None:
+            store = _open_store(embedding_adapter or create_adapter(), store_dir, fingerprint)
+            _store_handles[key] = store
+        elif embedding_adapter is not None:
+            if isinstance(store, QuantizedVectorStore):
+                store.embedding_adapter = embedding_adapter
+            else:
+                store.embeddings.adapter = embedding_adapter
+        return store
 
-    store_dir = get_vectorstore_dir(filepath)
-    os.makedirs(store_dir, exist_ok=True)
-    documents = [Document(page_content=str(t)) for t in texts]
+def _invalidate_store_handles(store_dir: str):
+    """丢弃该向量库目录的全部缓存句柄（清空、迁移切换后）。"""
+    store_dir = os.path.abspath(store_dir)
+    with _store_handles_lock:
+        for key in [key for key in _store_handles if key[0] == store_dir]:
+            del _store_handles[key]
+
+def _stored_dimension(store):
+    if isinstance(store, QuantizedVectorStore):
+        return store.dim or None
+    result = store._collection.get(limit=1, include=["embeddings"])
+    embeddings = result.get("embeddings")
+    return len(embeddings[0]) if embeddings is not None and len(embeddings) else None
+
+def _adopt_legacy_store(embedding_adapter, store_dir: str):
+    """
+    为没有模型指纹的旧向量库补写指纹。无法得知旧库由哪个模型生成，按当前模型记录；
+    但若当前模型的向量维度与库中不同，则记为未知模型，触发重新嵌入。目录为空时返回 None。
+    """
+    if is_quantized_store(store_dir):
+        store_format = "quantized"
+    elif os.path.exists(os.path.join(store_dir, "chroma.sqlite3")):
+        store_format = "chroma"
+    else:
+        return None
+    fingerprint = _new_fingerprint(embedding_adapter, store_format, DEFAULT_COLLECTION)
+    dim = _stored_dimension(_open_store(embedding_adapter, store_dir, fingerprint))
+    if dim:
+        probe = embedding_adapter.embed_query("维度检测")
+        if probe and len(probe) != dim:
+            logging.warning(f"Vector store dimension {dim} differs from the current embedding model ({len(probe)}); "
+                            f"it will be re-embedded.")
+            fingerprint.update(identity="unknown", interface="", base_url="", model="")
+    fingerprint["dim"] = dim
+    _write_fingerprint(store_dir, fingerprint)
+    return fingerprint
 
+def init_vector_store(embedding_adapter, texts, filepath: str):
+    """
+    在 filepath 下创建/加载一个向量库并插入 texts。
+    如果Embedding失败，则返回 None，不中断任务。
+    """
     try:
-        class LCEmbeddingWrapper(LCEmbeddings):
-            def embed_documents(self, texts):
-                return call_with_retry(
-                    func=embedding_adapter.embed_documents,
-                    max_retries=3,
-                    fallback_return=[],
-                    texts=texts
-                )
-            def embed_query(self, query: str):
-                res = call_with_retry(
-                    func=embedding_adapter.embed_query,
-                    max_retries=3,
-                    fallback_return=[],
-                    query=query
-                )
-                return res
-
-        chroma_embedding = LCEmbeddingWrapper()
-        vectorstore = Chroma.from_documents(
-            documents,
-            embedding=chroma_embedding,
-            persist_directory=store_dir,
-            client_settings=Settings(anonymized_telemetry=False),
-            collection_name="novel_collection"
-        )
-        return vectorstore
+        if not embed_into_vector_store(embedding_adapter, texts, filepath):
+            return None
+        return load_vector_store(embedding_adapter, filepath)
     except Exception as e:
         logging.warning(f"Init vector store failed: {e}")
         traceback.print_exc()
@@ -88,45 +216,203 @@ def init_vector_store(embedding_adapter, texts, filepath: str):
 
 def load_vector_store(embedding_adapter, filepath: str):
     """
-    读取已存在的 Chroma 向量库。若不存在则返回 None。
+    读取已存在的向量库。若不存在则返回 None。
     如果加载失败（embedding 或IO问题），则返回 None。
+    库中的模型指纹与 embedding_adapter 不一致时启动后台重新嵌入，迁移完成前返回用旧模型检索的旧库；
+    旧模型的适配器无法重建时返回 None。
     """
-    from langchain.embeddings.base import Embeddings as LCEmbeddings
     store_dir = get_vectorstore_dir(filepath)
     if not os.path.exists(store_dir):
+        _invalidate_store_handles(store_dir)
         logging.info("Vector store not found. Will return None.")
         return None
 
     try:
-        class LCEmbeddingWrapper(LCEmbeddings):
-            def embed_documents(self, texts):
-                return call_with_retry(
-                    func=embedding_adapter.embed_documents,
-                    max_retries=3,
-                    fallback_return=[],
-                    texts=texts
-                )
-            def embed_query(self, query: str):
-                res = call_with_retry(
-                    func=embedding_adapter.embed_query,
-                    max_retries=3,
-                    fallback_return=[],
-                    query=query
-                )
-                return res
-
-        chroma_embedding = LCEmbeddingWrapper()
-        return Chroma(
-            persist_directory=store_dir,
-            embedding_function=chroma_embedding,
-            client_settings=Settings(anonymized_telemetry=False),
-            collection_name="novel_collection"
-        )
+        fingerprint = _read_fingerprint(store_dir) or _adopt_legacy_store(embedding_adapter, store_dir)
+        if fingerprint is None:
+            logging.info("Vector store is empty. Will return None.")
+            return None
+        current = _adapter_fingerprint(embedding_adapter)
+        if not current or current["identity"] == fingerprint["identity"]:
+            return _get_store(store_dir, fingerprint, embedding_adapter)
+
+        _start_migration(filepath, embedding_adapter)
+        if fingerprint["identity"] == "unknown":
+            logging.warning("Vector store was built by an unknown embedding model; retrieval is unavailable until re-embedding finishes.")
+            return None
+        from embedding_adapters import recreate_embedding_adapter
+        logging.debug(f"Vector store was built by {fingerprint['identity']}, serving it with that model while re-embedding "
+                      f"for {current['identity']}.")
+        return _get_store(store_dir, fingerprint, create_adapter=lambda: recreate_embedding_adapter(fingerprint))
     except Exception as e:
         logging.warning(f"Failed to load vector store: {e}")
         traceback.print_exc()
         return None
 
+def _write_rows(store, rows, ids=None):
+    """写入 [(下标, 文本, 向量)]，向量已算好，不再经过 embedding。"""
+    import uuid
+    if isinstance(store, QuantizedVectorStore):
+        store.add_embeddings([t for _, t, _ in rows], [v for _, _, v in rows],
+                             ids=[ids[i] if ids else None for i, _, _ in rows])
+        return
+    # 直接写入底层 collection，避免 add_documents 再嵌入一遍
+    store._collection.upsert(
+        ids=[ids[i] if ids and ids[i] else str(uuid.uuid4()) for i, _, _ in rows],
+        documents=[t for _, t, _ in rows],
+        embeddings=[v for _, _, v in rows]
+    )
+
+def embed_into_vector_store(embedding_adapter, texts, filepath: str, ids=None, on_commit=None) -> int:
+    """
+    用 EmbeddingScheduler 并发、分批嵌入 texts，并按输入顺序把成功的分段写入向量库（不存在时创建），
+    返回写入的分段数。嵌入失败的分段会被跳过，不会以空向量写入。
+    ids 为各分段的固定 ID（Chroma 与量化库都按 ID 覆盖，重复写入不会重复插入）。
+    传入 on_commit 时按可续传的方式写入：遇到第一个嵌入失败的分段即停止，之后的分段不再写入；
+    每批写入后调用 on_commit(已连续写入的分段数)，供调用方记录断点。
+    向量库正在迁移到新模型时，先等待迁移完成再写入；等待超过 MIGRATION_WAIT_SECONDS 时抛出 TimeoutError，
+    不写入旧库（迁移完成后旧库会被删除，写入的内容会丢失）。
+    """
+    from embedding_scheduler import EmbeddingScheduler
+    store_dir = get_vectorstore_dir(filepath)
+    os.makedirs(store_dir, exist_ok=True)
+    store = load_vector_store(embedding_adapter, filepath)
+    if wait_for_migration(filepath, MIGRATION_WAIT_SECONDS):
+        store = load_vector_store(embedding_adapter, filepath)
+    fingerprint = _read_fingerprint(store_dir)
+    if fingerprint is None:
+        store_format = "quantized" if _store_settings["mode"] == "quantized" else "chroma"
+        fingerprint = _new_fingerprint(embedding_adapter, store_format, DEFAULT_COLLECTION)
+        _write_fingerprint(store_dir, fingerprint)
+        store = _get_store(store_dir, fingerprint, embedding_adapter)
+    current = _adapter_fingerprint(embedding_adapter)
+    if current and current["identity"] != fingerprint["identity"]:
+        logging.error("Vector store still belongs to another embedding model (re-embedding failed), skip writing. "
+                      "Clear the vector store to rebuild it with the current model.")
+        return 0
+    if not store:
+        return 0
+    written = 0
+
+    def write_batch(start, batch_texts, vectors):
+        nonlocal written
+        rows = [(start + i, str(t), v) for i, (t, v) in enumerate(zip(batch_texts, vectors))]
+        if on_commit is not None:
+            failed = next((i for i, v in enumerate(vectors) if not v), None)
+            rows = rows[:failed] if failed is not None else rows
+        else:
+            failed = None
+            rows = [row for row in rows if row[2]]
+        if rows:
+            if not fingerprint.get("dim"):
+                fingerprint["dim"] = len(rows[0][2])
+                _write_fingerprint(store_dir, fingerprint)
+            _write_rows(store, rows, ids)
+            written += len(rows)
+        if on_commit is not None:
+            on_commit(written)
+            return failed is None
+
+    EmbeddingScheduler(embedding_adapter).run([str(t) for t in texts], write_batch)
+    return written
+
+def _read_segments(store):
+    """读出库中全部分段的 (ID, 文本)；量化库中未指定 ID 的分段为 None。"""
+    if isinstance(store, QuantizedVectorStore):
+        return list(zip(store.ids, store.documents))
+    segments = []
+    while True:
+        page = store._collection.get(limit=1000, offset=len(segments), include=["documents"])
+        if not page["ids"]:
+            return segments
+        segments.extend(zip(page["ids"], page["documents"]))
+
+def _drop_store(store):
+    if isinstance(store, QuantizedVectorStore):
+        store.destroy()
+    else:
+        store.delete_collection()
+
+def _start_migration(filepath: str, embedding_adapter):
+    """在后台线程中把向量库重新嵌入到当前模型；同一向量库同时只有一个迁移任务。"""
+    store_dir = get_vectorstore_dir(filepath)
+    with _migrations_lock:
+        running = _migrations.get(store_dir)
+        if running is not None and running.is_alive():
+            return
+        if time.monotonic() - _migration_failures.get(store_dir, -MIGRATION_RETRY_SECONDS) < MIGRATION_RETRY_SECONDS:
+            return
+        thread = threading.Thread(target=_migrate, args=(store_dir, embedding_adapter), daemon=True,
+                                  name="vectorstore-migration")
+        _migrations[store_dir] = thread
+        thread.start()
+
+def wait_for_migration(filepath: str, timeout=None) -> bool:
+    """
+    等待该向量库正在进行的迁移结束；有迁移在进行时返回 True。
+    超过 timeout 秒仍未结束时抛出 TimeoutError。
+    """
+    with _migrations_lock:
+        thread = _migrations.get(get_vectorstore_dir(filepath))
+    if thread is None or not thread.is_alive():
+        return False
+    logging.info("Waiting for the vector store re-embedding to finish...")
+    thread.join(timeout)
+    if thread.is_alive():
+        raise TimeoutError(f"Vector store re-embedding is still running after {timeout}s; "
+                           f"retry once it has finished.")
+    return True
+
+def _migrate(store_dir: str, embedding_adapter):
+    """
+    用新模型把旧 collection 的全部分段（按保存的原文）嵌入到新 collection，全部成功后原子替换指纹切换过去，
+    再删除旧 collection；有分段失败时放弃新 collection，继续使用旧库。
+    """
+    from embedding_scheduler import EmbeddingScheduler
+    new_store = None
+    try:
+        old_fingerprint = _read_fingerprint(store_dir)
+        old_store = _open_store(embedding_adapter, store_dir, old_fingerprint)
+        segments = _read_segments(old_store)
+        current = _adapter_fingerprint(embedding_adapter)
+        collection = f"{DEFAULT_COLLECTION}_{hashlib.sha256(current['identity'].encode('utf-8')).hexdigest()[:8]}"
+        new_fingerprint = _new_fingerprint(embedding_adapter, old_fingerprint.get("format", "chroma"), collection)
+        logging.info(f"Re-embedding {len(segments)} vector store segments with {current['identity']}...")
+        # 上次中断留下的同名 collection 先清掉
+        _drop_store(_open_store(embedding_adapter, store_dir, new_fingerprint))
+        new_store = _open_store(embedding_adapter, store_dir, new_fingerprint)
+        ids = [segment_id for segment_id, _ in segments]
+        failed = []
+
+        def write_batch(start, batch_texts, vectors):
+            rows = [(start + i, t, v) for i, (t, v) in enumerate(zip(batch_texts, vectors))]
+            if any(not v for _, _, v in rows):
+                failed.append(start)
+                return False
+            _write_rows(new_store, rows, ids)
+
+        EmbeddingScheduler(embedding_adapter).run([text for _, text in segments], write_batch)
+        if failed:
+            raise RuntimeError(f"embedding failed at segment {failed[0]}")
+        new_fingerprint["dim"] = _stored_dimension(new_store)
+        _write_fingerprint(store_dir, new_fingerprint)
+        _invalidate_store_handles(store_dir)
+        logging.info(f"Vector store switched to {current['identity']} ({len(segments)} segments).")
+        try:
+            _drop_store(old_store)
+        except Exception as e:
+            logging.warning(f"Failed to remove the old vector store collection: {e}")
+    except Exception as e:
+        logging.warning(f"Vector store re-embedding failed, keeping the old index: {e}")
+        traceback.print_exc()
+        with _migrations_lock:
+            _migration_failures[store_dir] = time.monotonic()
+        if new_store is not None:
+            try:
+                _drop_store(new_store)
+            except Exception:
+                pass
+
 def split_by_length(text: str, max_length: int = 500):
     """按照 max_length 切分文本"""
     segments = []
@@ -143,6 +429,7 @@ def split_text_for_vectorstore(chapter_text: str, max_length: int = 500, similar
     对新的章节文本进行分段后,再用于存入向量库。
     使用 embedding 进行文本相似度计算。
     """
+    import nltk
     if not chapter_text.strip():
         return []
     
@@ -178,26 +465,17 @@ def update_vector_store(embedding_adapter, new_chapter: str, filepath: str):
     将最新章节文本插入到向量库中。
     若库不存在则初始化；若初始化/更新失败，则跳过。
     """
-    from utils import read_file, clear_file_content, save_string_to_txt
     splitted_texts = split_text_for_vectorstore(new_chapter)
     if not splitted_texts:
         logging.warning("No valid text to insert into vector store. Skipping.")
         return
 
-    store = load_vector_store(embedding_adapter, filepath)
-    if not store:
-        logging.info("Vector store does not exist or failed to load. Initializing a new one for new chapter...")
-        store = init_vector_store(embedding_adapter, splitted_texts, filepath)
-        if not store:
-            logging.warning("Init vector store failed, skip embedding.")
-        else:
-            logging.info("New vector store created successfully.")
-        return
-
     try:
-        docs = [Document(page_content=str(t)) for t in splitted_texts]
-        store.add_documents(docs)
-        logging.info("Vector store updated with the new chapter splitted segments.")
+        written = embed_into_vector_store(embedding_adapter, splitted_texts, filepath)
+        if written:
+            logging.info(f"Vector store updated with {written}/{len(splitted_texts)} new chapter segments.")
+        else:
+            logging.warning("Embedding the new chapter failed, vector store not updated.")
     except Exception as e:
         logging.warning(f"Failed to update vector store: {e}")
         traceback.print_exc()
@@ -226,19 +504,3 @@ def get_relevant_context_from_vector_store(embedding_adapter, query: str, filepa
         logging.warning(f"Similarity search failed: {e}")
         traceback.print_exc()
         return ""
-
-def _get_sentence_transformer(model_name: str = 'paraphrase-MiniLM-L6-v2'):
-    """获取sentence transformer模型，处理SSL问题"""
-    try:
-        # 设置torch环境变量
-        os.environ["TORCH_ALLOW_TF32_CUBLAS_OVERRIDE"] = "0"
-        os.environ["TORCH_CUDNN_V8_API_ENABLED"] = "0"
-        
-        # 禁用SSL验证
-        ssl._create_default_https_context = ssl._create_unverified_context
-        
-        # ...existing code...
-    except Exception as e:
-        logging.error(f"Failed to load sentence transformer model: {e}")
-        traceback.print_exc()
-        return None
@@ -0,0 +1,143 @@
+# rate_limiter.py
+# -*- coding: utf-8 -*-
+"""
+按端点共享的令牌桶限流器：请求数/分钟、token 数/分钟、最大并发，
+并在服务端返回 429 / 503 时遵循 Retry-After。
+"""
+import asyncio
+import email.utils
+import threading
+import time
+from typing import Optional
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算 token 数：按 UTF-8 字节数 / 3 计算，
+    中文约 1 字 1 token，英文约 3 字符 1 token，偏保守。
+    """
+    if not text:
+        return 0
+    return max(1, len(text.encode("utf-8")) // 3)
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """
+    从 openai / httpx / requests / azure 等 SDK 抛出的异常中提取 429、503 响应的 Retry-After 秒数。
+    非 429/503 或没有该响应头时返回 None。
+    """
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    if status not in (429, 503):
+        return None
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        parsed = email.utils.parsedate_to_datetime(value)
+        if parsed is None:
+            return None
+        return max(0.0, parsed.timestamp() - time.time())
+
+class RateLimiter:
+    """
+    线程安全的令牌桶。0 表示对应维度不限制。
+    token 维度允许“先借后还”：请求前按提示词估算扣除，请求后再按实际输出补扣，
+    因此余额可能短暂为负，此时后续请求会等待到余额恢复。
+    """
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0, max_concurrency: int = 0):
+        self.requests_per_minute = float(requests_per_minute or 0)
+        self.tokens_per_minute = float(tokens_per_minute or 0)
+        self.max_concurrency = int(max_concurrency or 0)
+        self._request_budget = self.requests_per_minute
+        self._token_budget = self.tokens_per_minute
+        self._in_flight = 0
+        self._blocked_until = 0.0
+        self._updated_at = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        if self.requests_per_minute:
+            self._request_budget = min(self.requests_per_minute, self._request_budget + elapsed * self.requests_per_minute / 60.0)
+        if self.tokens_per_minute:
+            self._token_budget = min(self.tokens_per_minute, self._token_budget + elapsed * self.tokens_per_minute / 60.0)
+
+    def _try_acquire(self, tokens: int) -> Optional[float]:
+        """成功时返回 None；否则返回建议等待的秒数。调用方需持有 self._cond。"""
+        now = time.monotonic()
+        self._refill(now)
+        if self._blocked_until > now:
+            return self._blocked_until - now
+        if self.max_concurrency and self._in_flight >= self.max_concurrency:
+            return 0.5
+        if self.requests_per_minute and self._request_budget < 1:
+            return (1 - self._request_budget) * 60.0 / self.requests_per_minute
+        if self.tokens_per_minute:
+            needed = min(tokens, self.tokens_per_minute)
+            if self._token_budget < needed:
+                return (needed - self._token_budget) * 60.0 / self.tokens_per_minute
+        if self.requests_per_minute:
+            self._request_budget -= 1
+        if self.tokens_per_minute:
+            self._token_budget -= tokens
+        self._in_flight += 1
+        return None
+
+    def acquire(self, tokens: int = 0):
+        """阻塞直到取得一个请求名额。"""
+        with self._cond:
+            while True:
+                wait = self._try_acquire(tokens)
+                if wait is None:
+                    return
+                self._cond.wait(wait)
+
+    async def aacquire(self, tokens: int = 0):
+        """acquire 的异步版本，等待期间不占用事件循环。"""
+        while True:
+            with self._cond:
+                wait = self._try_acquire(tokens)
+            if wait is None:
+                return
+            await asyncio.sleep(min(wait, 1.0))
+
+    def release(self, extra_tokens: int = 0):
+        """归还并发名额，并补扣请求完成后才知道的 token（例如输出长度）。"""
+        with self._cond:
+            self._in_flight = max(0, self._in_flight - 1)
+            if self.tokens_per_minute and extra_tokens:
+                self._token_budget -= extra_tokens
+            self._cond.notify_all()
+
+    def block_for(self, seconds: float):
+        """服务端要求退避时，让所有共享该限流器的调用方在 seconds 秒内暂停发送。"""
+        with self._cond:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(key: tuple, requests_per_minute: float = 0, tokens_per_minute: float = 0, max_concurrency: int = 0) -> Optional[RateLimiter]:
+    """
+    返回 key（端点 + 密钥）对应的共享限流器；所有维度都不限制时返回 None。
+    配置变化时替换为新的限流器。
+    """
+    settings = (float(requests_per_minute or 0), float(tokens_per_minute or 0), int(max_concurrency or 0))
+    if not any(settings):
+        return None
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None or (limiter.requests_per_minute, limiter.tokens_per_minute, limiter.max_concurrency) != settings:
+            limiter = RateLimiter(*settings)
+            _limiters[key] = limiter
+        return limiter
@@ -0,0 +1,114 @@
+# retry_policy.py
+# -*- coding: utf-8 -*-
+"""
+共享的重试策略：异常分类（可重试 / 致命）、带抖动的指数退避、单次调用总时限。
+"""
+import asyncio
+import random
+import time
+from typing import Optional
+from rate_limiter import retry_after_seconds
+
+# 永远不会因重试而成功的状态码：参数错误、鉴权失败、无权限、模型不存在、请求体无法处理
+FATAL_STATUS_CODES = {400, 401, 403, 404, 405, 413, 422}
+# 限流、超时、冲突及服务端错误，值得重试
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504, 520, 522, 524, 529}
+
+FATAL_ERROR_NAMES = (
+    "AuthenticationError",
+    "PermissionDeniedError",
+    "NotFoundError",
+    "BadRequestError",
+    "UnprocessableEntityError",
+    "ClientAuthenticationError",
+    "ResourceNotFoundError",
+    # 端点熔断期间重试只会再次立即失败（见 circuit_breaker.py）
+    "CircuitOpenError",
+)
+FATAL_MESSAGE_MARKERS = (
+    "context_length_exceeded",
+    "maximum context length",
+    "context length",
+    "invalid_api_key",
+    "incorrect api key",
+    "model_not_found",
+    "does not exist",
+    "insufficient_quota",
+)
+
+def error_status_code(error: Exception) -> Optional[int]:
+    """尽量从各 SDK 的异常中取出 HTTP 状态码。"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    判断异常是否值得重试。鉴权失败、模型不存在、上下文超长、额度耗尽、
+    以及本地参数/编程错误属于致命错误，应立即失败；超时、连接错误、限流和 5xx 可重试。
+    未能识别的异常默认视为可重试。
+    """
+    if isinstance(error, (ValueError, TypeError, KeyError, AttributeError, NotImplementedError)):
+        return False
+    status = error_status_code(error)
+    if status in RETRYABLE_STATUS_CODES:
+        return True
+    message = str(error).lower()
+    if any(marker in message for marker in FATAL_MESSAGE_MARKERS):
+        return False
+    if status in FATAL_STATUS_CODES:
+        return False
+    if type(error).__name__ in FATAL_ERROR_NAMES:
+        return False
+    return True
+
+class RetryPolicy:
+    """
+    带全抖动的指数退避：第 n 次重试前等待 uniform(0, min(max_delay, base_delay * multiplier^(n-1)))，
+    服务端给出 Retry-After 时至少等待该时长；deadline（秒）限制包含等待在内的总耗时。
+    """
+    def __init__(self, max_retries: int = 3, base_delay: float = 1.0, max_delay: float = 30.0,
+                 multiplier: float = 2.0, deadline: Optional[float] = None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.deadline = deadline
+
+    def backoff(self, attempt: int, error: Optional[Exception] = None) -> float:
+        """第 attempt 次失败后、下一次尝试前的等待秒数。"""
+        ceiling = min(self.max_delay, self.base_delay * (self.multiplier ** max(0, attempt - 1)))
+        delay = random.uniform(0, ceiling)
+        if error is not None:
+            retry_after = retry_after_seconds(error)
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+        return delay
+
+    def start(self) -> float:
+        return time.monotonic()
+
+    def next_delay(self, attempt: int, started_at: float, error: Optional[Exception] = None) -> Optional[float]:
+        """
+        返回下一次重试前应等待的秒数；不应再重试（次数用尽、致命错误、超出时限）时返回 None。
+        """
+        if attempt >= self.max_retries:
+            return None
+        if error is not None and not is_retryable_error(error):
+            return None
+        delay = self.backoff(attempt, error)
+        if self.deadline is not None and time.monotonic() - started_at + delay > self.deadline:
+            return None
+        return delay
+
+    def sleep(self, delay: float):
+        if delay > 0:
+            time.sleep(delay)
+
+    async def asleep(self, delay: float):
+        if delay > 0:
+            await asyncio.sleep(delay)
@@ -0,0 +1,86 @@
+# startup_benchmark.py
+# -*- coding: utf-8 -*-
+"""
+冷启动基准：在全新的解释器中分别导入各入口模块，统计导入耗时，并检查是否提前加载了
+服务商 SDK 或向量库依赖（它们应当在选中对应接口、首次用到向量库时才导入）。
+用法：python startup_benchmark.py [--repeat 5] [--max-seconds 1.5] [模块 ...]
+有模块提前加载了重依赖或超过 --max-seconds 时退出码为 1，可作为启动耗时的回归检查。
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+DEFAULT_MODULES = ["llm_adapters", "embedding_adapters", "novel_generator", "config_manager", "ui"]
+
+# 不应在导入入口模块时被加载的重依赖
+HEAVY_MODULES = [
+    "langchain_openai",
+    "openai",
+    "google.generativeai",
+    "azure.ai.inference",
+    "requests",
+    "chromadb",
+    "langchain_chroma",
+    "langchain",
+    "nltk",
+    "sklearn",
+    "numpy",
+    "onnxruntime",
+    "sentence_transformers",
+    "torch",
+]
+
+_CHILD_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+try:
+    __import__({module!r})
+    error = ""
+except Exception as e:
+    error = f"{{type(e).__name__}}: {{e}}"
+elapsed = time.perf_counter() - started
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{"seconds": elapsed, "heavy": heavy, "error": error}}))
+"""
+
+def measure(module: str, repeat: int) -> dict:
+    """在 repeat 个全新的子进程中导入 module，返回最短耗时、提前加载的重依赖与导入错误。"""
+    root = os.path.dirname(os.path.abspath(__file__))
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", _CHILD_SCRIPT.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=root, capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()[-1]
+        runs.append(json.loads(output))
+    return {
+        "seconds": min(run["seconds"] for run in runs),
+        "heavy": runs[0]["heavy"],
+        "error": runs[0]["error"],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="入口模块冷启动导入耗时基准")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--repeat", type=int, default=5, help="每个模块重复的次数，取最短耗时")
+    parser.add_argument("--max-seconds", type=float, default=None, help="单个模块导入耗时上限")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'module':<24}{'seconds':>10}  heavy dependencies loaded")
+    for module in args.modules:
+        result = measure(module, max(1, args.repeat))
+        if result["error"]:
+            # 例如缺少 customtkinter 的环境里无法导入 ui，只提示不计失败
+            print(f"{module:<24}{'-':>10}  skipped ({result['error']})")
+            continue
+        heavy = ", ".join(result["heavy"]) or "none"
+        print(f"{module:<24}{result['seconds']:>10.3f}  {heavy}")
+        if result["heavy"] or (args.max_seconds is not None and result["seconds"] > args.max_seconds):
+            failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
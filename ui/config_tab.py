@@ -5,6 +5,8 @@ from tkinter import messagebox
 import customtkinter as ctk
 
 from config_manager import load_config, save_config
+from llm_adapters import configure_llm_adapters
+from embedding_adapters import configure_embedding_adapters
 from tooltips import tooltips
 
 
@@ -95,6 +97,9 @@ def build_ai_config_tab(self):
             elif new_value == "硅基流动":
                 self.base_url_var.set("https://api.siliconflow.cn/v1")
                 self.model_name_var.set("deepseek-ai/DeepSeek-V3")
+            elif new_value == "Mock":
+                self.base_url_var.set("")
+                self.model_name_var.set("mock-model")
 
     for i in range(7):
         self.ai_config_tab.grid_rowconfigure(i, weight=0)
@@ -115,7 +120,7 @@ def build_ai_config_tab(self):
     # 3) 接口格式
     create_label_with_help(self, parent=self.ai_config_tab, label_text="LLM 接口格式:", tooltip_key="interface_format", row=2, column=0, font=("Microsoft YaHei", 12))
     # 在这里的接口选项列表中添加 "硅基流动"
-    interface_options = ["DeepSeek", "阿里云百炼", "OpenAI", "Azure OpenAI", "Azure AI", "Ollama", "ML Studio", "Gemini", "火山引擎", "硅基流动"]
+    interface_options = ["DeepSeek", "阿里云百炼", "OpenAI", "Azure OpenAI", "Azure AI", "Ollama", "ML Studio", "Gemini", "火山引擎", "硅基流动", "Mock"]
     interface_dropdown = ctk.CTkOptionMenu(self.ai_config_tab, values=interface_options, variable=self.interface_format_var, command=on_interface_format_changed, font=("Microsoft YaHei", 12))
     interface_dropdown.grid(row=2, column=1, padx=5, pady=5, columnspan=2, sticky="nsew")
 
@@ -187,6 +192,12 @@ def build_embeddings_config_tab(self):
             elif new_value == "SiliconFlow":
                 self.embedding_url_var.set("https://api.siliconflow.cn/v1/embeddings")
                 self.embedding_model_name_var.set("BAAI/bge-m3")
+            elif new_value == "Local":
+                self.embedding_url_var.set("")
+                self.embedding_model_name_var.set("all-MiniLM-L6-v2")
+            elif new_value == "Mock":
+                self.embedding_url_var.set("")
+                self.embedding_model_name_var.set("mock-embedding")
 
     for i in range(5):
         self.embeddings_config_tab.grid_rowconfigure(i, weight=0)
@@ -202,7 +213,7 @@ def build_embeddings_config_tab(self):
     # 2) Embedding 接口格式
     create_label_with_help(self, parent=self.embeddings_config_tab, label_text="Embedding 接口格式:", tooltip_key="embedding_interface_format", row=1, column=0, font=("Microsoft YaHei", 12))
 
-    emb_interface_options = ["DeepSeek", "OpenAI", "Azure OpenAI", "Gemini", "Ollama", "ML Studio","SiliconFlow"]
+    emb_interface_options = ["DeepSeek", "OpenAI", "Azure OpenAI", "Gemini", "Ollama", "ML Studio","SiliconFlow", "Local", "Mock"]
 
     emb_interface_dropdown = ctk.CTkOptionMenu(self.embeddings_config_tab, values=emb_interface_options, variable=self.embedding_interface_format_var, command=on_embedding_interface_changed, font=("Microsoft YaHei", 12))
     emb_interface_dropdown.grid(row=1, column=1, padx=5, pady=5, sticky="nsew")
@@ -234,6 +245,7 @@ def load_config_btn(self):
         self.interface_format_var.set(last_llm)
         self.embedding_interface_format_var.set(last_embedding)
         llm_configs = cfg.get("llm_configs", {})
+        configure_llm_adapters(llm_configs)
         if last_llm in llm_configs:
             llm_conf = llm_configs[last_llm]
             self.api_key_var.set(llm_conf.get("api_key", ""))
@@ -243,6 +255,7 @@ def load_config_btn(self):
             self.max_tokens_var.set(llm_conf.get("max_tokens", 8192))
             self.timeout_var.set(llm_conf.get("timeout", 600))
         embedding_configs = cfg.get("embedding_configs", {})
+        configure_embedding_adapters(embedding_configs)
         if last_embedding in embedding_configs:
             emb_conf = embedding_configs[last_embedding]
             self.embedding_api_key_var.set(emb_conf.get("api_key", ""))
@@ -304,14 +317,18 @@ def save_config_btn(self):
     existing_config["last_embedding_interface_format"] = current_embedding_interface
     if "llm_configs" not in existing_config:
         existing_config["llm_configs"] = {}
-    existing_config["llm_configs"][current_llm_interface] = llm_config
+    # 合并而非覆盖，保留手动写入 config.json 的附加设置（如 rate_limit）
+    existing_config["llm_configs"].setdefault(current_llm_interface, {}).update(llm_config)
 
     if "embedding_configs" not in existing_config:
         existing_config["embedding_configs"] = {}
-    existing_config["embedding_configs"][current_embedding_interface] = embedding_config
+    existing_config["embedding_configs"].setdefault(current_embedding_interface, {}).update(embedding_config)
 
     existing_config["other_params"] = other_params
 
+    configure_llm_adapters(existing_config["llm_configs"])
+    configure_embedding_adapters(existing_config["embedding_configs"])
+
     if save_config(existing_config, self.config_file):
         messagebox.showinfo("提示", "配置已保存至 config.json")
         self.log("配置已保存。")
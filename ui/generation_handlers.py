@@ -17,6 +17,8 @@ from novel_generator import (
     enrich_chapter_text
 )
 from consistency_checker import check_consistency
+from usage_ledger import usage_context
+from ui.helpers import BatchedTextSink
 
 def generate_novel_architecture_ui(self):
     filepath = self.filepath_var.get().strip()
@@ -120,6 +122,14 @@ def generate_chapter_draft_ui(self):
 
     def task():
         self.disable_button_safe(self.btn_generate_chapter)
+        stream_sink = None
+
+        def restore_saved_draft():
+            """生成失败或无内容时，丢弃文本框中的半截流式内容，重新显示磁盘上保留的草稿，避免定稿时用到残缺文本。"""
+            stream_sink.close()
+            chapter_file = os.path.join(filepath, "chapters", f"chapter_{chap_num}.txt")
+            self.show_chapter_in_textbox(read_file(chapter_file) if os.path.exists(chapter_file) else "")
+
         try:
             interface_format = self.interface_format_var.get().strip()
             api_key = self.api_key_var.get().strip()
@@ -264,6 +274,9 @@ def generate_chapter_draft_ui(self):
                 return
 
             self.safe_log("开始生成章节草稿...")
+            # 草稿内容边生成边显示在左侧文本框中
+            stream_sink = BatchedTextSink(self.master, self.chapter_result)
+            self.master.after(0, lambda: self.chapter_result.delete("0.0", "end"))
             from novel_generator.chapter import generate_chapter_draft
             draft_text = generate_chapter_draft(
                 api_key=api_key,
@@ -286,14 +299,22 @@ def generate_chapter_draft_ui(self):
                 interface_format=interface_format,
                 max_tokens=max_tokens,
                 timeout=timeout_val,
-                custom_prompt_text=edited_prompt  # 使用用户编辑后的提示词
+                custom_prompt_text=edited_prompt,  # 使用用户编辑后的提示词
+                on_chunk=stream_sink.write,
+                on_reset=stream_sink.reset
             )
             if draft_text:
                 self.safe_log(f"✅ 第{chap_num}章草稿生成完成。请在左侧查看或编辑。")
-                self.master.after(0, lambda: self.show_chapter_in_textbox(draft_text))
+                def show_draft():
+                    stream_sink.close()
+                    self.show_chapter_in_textbox(draft_text)
+                self.master.after(0, show_draft)
             else:
+                self.master.after(0, restore_saved_draft)
                 self.safe_log("⚠️ 本章草稿生成失败或无内容。")
         except Exception:
+            if stream_sink is not None:
+                self.master.after(0, restore_saved_draft)
             self.handle_exception("生成章节草稿时出错")
         finally:
             self.enable_button_safe(self.btn_generate_chapter)
@@ -340,17 +361,18 @@ def finalize_chapter_ui(self):
                 ask = messagebox.askyesno("字数不足", f"当前章节字数 ({len(edited_text)}) 低于目标字数({word_number})的70%，是否要尝试扩写？")
                 if ask:
                     self.safe_log("正在扩写章节内容...")
-                    enriched = enrich_chapter_text(
-                        chapter_text=edited_text,
-                        word_number=word_number,
-                        api_key=api_key,
-                        base_url=base_url,
-                        model_name=model_name,
-                        temperature=temperature,
-                        interface_format=interface_format,
-                        max_tokens=max_tokens,
-                        timeout=timeout_val
-                    )
+                    with usage_context(project=filepath):
+                        enriched = enrich_chapter_text(
+                            chapter_text=edited_text,
+                            word_number=word_number,
+                            api_key=api_key,
+                            base_url=base_url,
+                            model_name=model_name,
+                            temperature=temperature,
+                            interface_format=interface_format,
+                            max_tokens=max_tokens,
+                            timeout=timeout_val
+                        )
                     edited_text = enriched
                     self.master.after(0, lambda: self.chapter_result.delete("0.0", "end"))
                     self.master.after(0, lambda: self.chapter_result.insert("0.0", edited_text))
@@ -409,20 +431,21 @@ def do_consistency_check(self):
                 return
 
             self.safe_log("开始一致性审校...")
-            result = check_consistency(
-                novel_setting="",
-                character_state=read_file(os.path.join(filepath, "character_state.txt")),
-                global_summary=read_file(os.path.join(filepath, "global_summary.txt")),
-                chapter_text=chapter_text,
-                api_key=api_key,
-                base_url=base_url,
-                model_name=model_name,
-                temperature=temperature,
-                interface_format=interface_format,
-                max_tokens=max_tokens,
-                timeout=timeout,
-                plot_arcs=""
-            )
+            with usage_context(project=filepath, stage="consistency_check"):
+                result = check_consistency(
+                    novel_setting="",
+                    character_state=read_file(os.path.join(filepath, "character_state.txt")),
+                    global_summary=read_file(os.path.join(filepath, "global_summary.txt")),
+                    chapter_text=chapter_text,
+                    api_key=api_key,
+                    base_url=base_url,
+                    model_name=model_name,
+                    temperature=temperature,
+                    interface_format=interface_format,
+                    max_tokens=max_tokens,
+                    timeout=timeout,
+                    plot_arcs=""
+                )
             self.safe_log("审校结果：")
             self.safe_log(result)
         except Exception:
@@ -1,7 +1,63 @@
 # ui/helpers.py
 # -*- coding: utf-8 -*-
 import logging
+import threading
 import traceback
 
 def log_error(message: str):
     logging.error(f"{message}\n{traceback.format_exc()}")
+
+class BatchedTextSink:
+    """
+    把后台线程产生的流式文本片段合并后，按固定间隔在 Tk 主线程中追加到文本框，
+    避免每个 token 都触发一次界面刷新。
+    """
+    def __init__(self, master, textbox, interval_ms: int = 100):
+        self.master = master
+        self.textbox = textbox
+        self.interval_ms = interval_ms
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._scheduled = False
+        self._after_id = None
+        self._closed = False
+
+    def write(self, chunk: str):
+        with self._lock:
+            if self._closed:
+                return
+            self._buffer.append(chunk)
+            if self._scheduled:
+                return
+            self._scheduled = True
+            self._after_id = self.master.after(self.interval_ms, self._flush)
+
+    def close(self):
+        """
+        在 Tk 主线程中调用：取消尚未触发的定时刷新，并立即写出缓冲区剩余内容。
+        之后的 write 被忽略，避免显示最终文本后再被迟到的刷新追加一遍。
+        """
+        with self._lock:
+            self._closed = True
+            after_id, self._after_id = self._after_id, None
+        if after_id is not None:
+            try:
+                self.master.after_cancel(after_id)
+            except Exception:
+                pass
+        self._flush()
+
+    def reset(self):
+        with self._lock:
+            self._buffer.clear()
+        self.master.after(0, lambda: self.textbox.delete("0.0", "end"))
+
+    def _flush(self):
+        with self._lock:
+            text = "".join(self._buffer)
+            self._buffer.clear()
+            self._scheduled = False
+            self._after_id = None
+        if text:
+            self.textbox.insert("end", text)
+            self.textbox.see("end")
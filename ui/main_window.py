@@ -8,7 +8,14 @@ import customtkinter as ctk
 import tkinter as tk
 from tkinter import filedialog, messagebox
 from .role_library import RoleLibrary
-from llm_adapters import create_llm_adapter
+from llm_adapters import create_llm_adapter, configure_llm_adapters
+from embedding_adapters import configure_embedding_adapters
+from embedding_cache import configure_embedding_cache
+from circuit_breaker import add_state_listener, OPEN, CLOSED
+from novel_generator.response_cache import configure_response_cache
+from novel_generator.vectorstore_utils import configure_vector_store
+from llm_logging import configure_llm_logging
+from mock_llm import configure_mock_backend
 
 from config_manager import load_config, save_config, test_llm_config, test_embedding_config
 from utils import read_file, save_string_to_txt, clear_file_content
@@ -52,6 +59,22 @@ class NovelGeneratorGUI:
         self.config_file = "config.json"
         self.loaded_config = load_config(self.config_file)
 
+        # LLM 提示词/返回内容的日志（config.json 中的 "llm_logging" 段落）
+        configure_llm_logging(**(self.loaded_config or {}).get("llm_logging", {}))
+        # 可选的 LLM 响应缓存（config.json 中的 "response_cache" 段落，默认关闭）
+        configure_response_cache(**(self.loaded_config or {}).get("response_cache", {}))
+        # Embedding 磁盘缓存（config.json 中的 "embedding_cache" 段落，默认关闭）
+        configure_embedding_cache(**(self.loaded_config or {}).get("embedding_cache", {}))
+        # 新建向量库的存储方式（config.json 中的 "vector_store" 段落）
+        configure_vector_store(**(self.loaded_config or {}).get("vector_store", {}))
+        # 离线模拟接口 "Mock" 的延迟分布与错误注入（config.json 中的 "mock_backend" 段落）
+        configure_mock_backend(**(self.loaded_config or {}).get("mock_backend", {}))
+        # 各接口的附加设置（限流等），来自 config.json 的 llm_configs
+        configure_llm_adapters((self.loaded_config or {}).get("llm_configs", {}))
+        configure_embedding_adapters((self.loaded_config or {}).get("embedding_configs", {}))
+        # 端点熔断状态变化显示在界面日志中
+        add_state_listener(self.on_circuit_state_change)
+
         if self.loaded_config:
             last_llm = self.loaded_config.get("last_interface_format", "OpenAI")
             last_embedding = self.loaded_config.get("last_embedding_interface_format", "OpenAI")
@@ -161,6 +184,14 @@ class NovelGeneratorGUI:
     def safe_log(self, message: str):
         self.master.after(0, lambda: self.log(message))
 
+    def on_circuit_state_change(self, name: str, old_state: str, new_state: str):
+        if new_state == OPEN:
+            self.safe_log(f"⚠️ {name} 连续失败，已熔断：冷却期内的请求将立即失败或转到其他端点。")
+        elif new_state == CLOSED:
+            self.safe_log(f"✅ {name} 已恢复（熔断关闭）。")
+        else:
+            self.safe_log(f"{name} 熔断冷却结束，正在发送探测请求...")
+
     def disable_button_safe(self, btn):
         self.master.after(0, lambda: btn.configure(state="disabled"))
 
@@ -10,6 +10,7 @@ from customtkinter import CTkScrollableFrame, CTkTextbox, END
 from utils import read_file, save_string_to_txt  # 导入 utils 中的函数
 from novel_generator.common import invoke_with_cleaning  # 新增导入
 from prompt_definitions import Character_Import_Prompt
+from usage_ledger import usage_context
 
 DEFAULT_FONT = ("Microsoft YaHei", 12)
 
@@ -375,10 +376,11 @@ class RoleLibrary:
 
             # 调用LLM进行分析
             prompt = f"{Character_Import_Prompt}\n<<待分析小说文本开始>>\n{content}\n<<待分析小说文本结束>>"
-            response = invoke_with_cleaning(
-                self.llm_adapter,
-                prompt
-            )
+            with usage_context(project=os.path.dirname(self.save_path), stage="role_import"):
+                response = invoke_with_cleaning(
+                    self.llm_adapter,
+                    prompt
+                )
             
             # 解析LLM响应
             roles = self._parse_llm_response(response)
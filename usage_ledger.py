@@ -0,0 +1,164 @@
+# usage_ledger.py
+# -*- coding: utf-8 -*-
+"""
+LLM 调用台账：每次调用的 prompt / completion / 缓存命中 token 数、总耗时、首字节耗时、
+模型与调用阶段，追加写入项目目录下的 llm_usage.jsonl，用于估算容量、找出花费最多的阶段。
+用法：python usage_ledger.py <项目目录>  按阶段汇总台账。
+"""
+import contextlib
+import contextvars
+import datetime
+import json
+import logging
+import os
+import sys
+import threading
+from typing import Optional
+
+LEDGER_FILE_NAME = "llm_usage.jsonl"
+
+# 当前调用所属的项目目录与阶段，由 usage_context 设置；线程内新开的子线程需用 contextvars.copy_context 传递
+_usage_context = contextvars.ContextVar("llm_usage_context", default={})
+# 正在进行中的单次调用的用量，由适配器在拿到响应后填入
+_current_usage = contextvars.ContextVar("llm_current_usage", default=None)
+_write_lock = threading.Lock()
+
+@contextlib.contextmanager
+def usage_context(project: Optional[str] = None, stage: Optional[str] = None):
+    """
+    在 with 块内发出的 LLM 调用会记入 project 目录的台账，并标注 stage。
+    嵌套使用时阶段名以 "/" 连接，例如 "chapter_draft/summarize_recent"。
+    """
+    current = dict(_usage_context.get())
+    if project:
+        current["project"] = project
+    if stage:
+        current["stage"] = f"{current['stage']}/{stage}" if current.get("stage") else stage
+    token = _usage_context.set(current)
+    try:
+        yield
+    finally:
+        _usage_context.reset(token)
+
+def current_usage_context() -> dict:
+    """返回当前的 {"project", "stage"}，供日志等标注调用来源。"""
+    return dict(_usage_context.get())
+
+def begin_call() -> tuple:
+    """开始记录一次调用，返回 (用量字典, 用于 end_call 的 token)。"""
+    usage = {}
+    return usage, _current_usage.set(usage)
+
+def end_call(token):
+    _current_usage.reset(token)
+
+def _field(obj, *names):
+    """依次尝试属性名/字典键，返回第一个非空值。"""
+    for name in names:
+        value = obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+        if value is not None:
+            return value
+    return None
+
+def extract_usage(response) -> Optional[dict]:
+    """
+    从各 SDK 的响应（或流式分片）中取出用量：
+    - langchain 消息：usage_metadata {input_tokens, output_tokens, input_token_details.cache_read}
+    - openai / azure-ai-inference：usage {prompt_tokens, completion_tokens, prompt_tokens_details.cached_tokens}
+    - Gemini：usage_metadata {prompt_token_count, candidates_token_count, cached_content_token_count}
+    """
+    if response is None:
+        return None
+    usage = _field(response, "usage_metadata", "usage")
+    if usage is None:
+        metadata = _field(response, "response_metadata") or {}
+        usage = _field(metadata, "token_usage", "usage")
+    if not usage:
+        return None
+    prompt_tokens = _field(usage, "input_tokens", "prompt_tokens", "prompt_token_count")
+    completion_tokens = _field(usage, "output_tokens", "completion_tokens", "candidates_token_count")
+    details = _field(usage, "input_token_details", "prompt_tokens_details") or {}
+    cached_tokens = _field(details, "cache_read", "cached_tokens")
+    if cached_tokens is None:
+        cached_tokens = _field(usage, "cached_content_token_count", "prompt_cache_hit_tokens")
+    if prompt_tokens is None and completion_tokens is None:
+        return None
+    return {
+        "prompt_tokens": int(prompt_tokens or 0),
+        "completion_tokens": int(completion_tokens or 0),
+        "cached_tokens": int(cached_tokens or 0),
+    }
+
+def report_usage(response):
+    """适配器拿到响应或流式分片后调用；流式场景下以最后一次非空的用量为准。"""
+    usage = _current_usage.get()
+    if usage is None:
+        return
+    extracted = extract_usage(response)
+    if extracted:
+        usage.update(extracted)
+
+def record_call(adapter, usage: dict, prompt_tokens_estimate: int, completion_tokens_estimate: int,
+                wall_time: float, first_byte: Optional[float], streaming: bool, status: str, error: str = ""):
+    """把一次调用追加到当前项目的台账；不在任何项目上下文中时只记调试日志。"""
+    context = _usage_context.get()
+    entry = {
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "stage": context.get("stage", ""),
+        "interface": getattr(adapter, "interface_format", ""),
+        "model": getattr(adapter, "model_name", ""),
+        "base_url": getattr(adapter, "base_url", ""),
+        "prompt_tokens": usage.get("prompt_tokens", prompt_tokens_estimate),
+        "completion_tokens": usage.get("completion_tokens", completion_tokens_estimate),
+        "cached_tokens": usage.get("cached_tokens", 0),
+        "usage_source": "provider" if usage else "estimate",
+        "wall_time": round(wall_time, 3),
+        "first_byte": round(first_byte, 3) if first_byte is not None else None,
+        "streaming": streaming,
+        "status": status,
+    }
+    if error:
+        entry["error"] = error[:200]
+    project = context.get("project")
+    if not project:
+        logging.debug(f"LLM usage (no project): {entry}")
+        return
+    try:
+        line = json.dumps(entry, ensure_ascii=False)
+        with _write_lock:
+            os.makedirs(project, exist_ok=True)
+            with open(os.path.join(project, LEDGER_FILE_NAME), "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+    except OSError as e:
+        logging.warning(f"Failed to write LLM usage ledger: {e}")
+
+def summarize_usage(project: str) -> dict:
+    """按阶段汇总台账：{stage: {"calls", "prompt_tokens", "completion_tokens", "cached_tokens", "wall_time"}}。"""
+    summary = {}
+    path = os.path.join(project, LEDGER_FILE_NAME)
+    if not os.path.exists(path):
+        return summary
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            item = summary.setdefault(entry.get("stage") or "(unknown)", {
+                "calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "wall_time": 0.0
+            })
+            item["calls"] += 1
+            item["prompt_tokens"] += entry.get("prompt_tokens") or 0
+            item["completion_tokens"] += entry.get("completion_tokens") or 0
+            item["cached_tokens"] += entry.get("cached_tokens") or 0
+            item["wall_time"] += entry.get("wall_time") or 0.0
+    return summary
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("用法: python usage_ledger.py <项目目录>")
+        sys.exit(1)
+    rows = sorted(summarize_usage(sys.argv[1]).items(), key=lambda kv: -(kv[1]["prompt_tokens"] + kv[1]["completion_tokens"]))
+    print(f"{'stage':<40}{'calls':>8}{'prompt':>12}{'completion':>12}{'cached':>10}{'seconds':>10}")
+    for stage, item in rows:
+        print(f"{stage:<40}{item['calls']:>8}{item['prompt_tokens']:>12}{item['completion_tokens']:>12}{item['cached_tokens']:>10}{item['wall_time']:>10.1f}")
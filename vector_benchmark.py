@@ -0,0 +1,82 @@
+# vector_benchmark.py
+# -*- coding: utf-8 -*-
+"""
+量化向量库基准：对比 float32 精确检索与 float16 / int8 量化存储（有无 float32 精排）的召回率、常驻内存、磁盘占用与检索耗时。
+用法：python vector_benchmark.py [--count 100000] [--dim 384] [--queries 200] [--k 4] [--vectors 向量.npy]
+不指定 --vectors 时使用带聚类结构的合成向量；指定时用其中的真实向量（随机抽取一部分加噪声作为查询）。
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from novel_generator.quantized_store import QuantizedVectorStore, normalize
+
+CONFIGS = [
+    ("float16", 0),
+    ("float16", 4),
+    ("int8", 0),
+    ("int8", 4),
+]
+
+def synthetic_vectors(count: int, dim: int, seed: int = 0):
+    """围绕若干中心的高斯簇，近似真实文本向量彼此相近、分布不均匀的特点。"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, count // 200), dim)).astype(np.float32)
+    labels = rng.integers(0, len(centers), count)
+    return normalize(centers[labels] + 0.6 * rng.standard_normal((count, dim)).astype(np.float32))
+
+def make_queries(vectors, count: int, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(vectors), size=min(count, len(vectors)), replace=False)
+    return normalize(vectors[picks] + 0.3 * rng.standard_normal((len(picks), vectors.shape[1])).astype(np.float32))
+
+def exact_top_k(vectors, queries, k: int):
+    scores = queries @ vectors.T
+    return [set(np.argpartition(-row, k - 1)[:k].tolist()) for row in scores]
+
+def disk_bytes(directory: str) -> int:
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+def main():
+    parser = argparse.ArgumentParser(description="量化向量库的召回率 / 体积基准")
+    parser.add_argument("--count", type=int, default=100000, help="合成向量条数")
+    parser.add_argument("--dim", type=int, default=384, help="合成向量维度")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--vectors", default=None, help="真实向量的 .npy 文件（二维数组）")
+    args = parser.parse_args()
+
+    vectors = normalize(np.load(args.vectors)) if args.vectors else synthetic_vectors(args.count, args.dim)
+    queries = make_queries(vectors, args.queries)
+    truth = exact_top_k(vectors, queries, args.k)
+    texts = [str(i) for i in range(len(vectors))]
+    print(f"{len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries, k={args.k}")
+    print(f"{'storage':<22}{'recall@k':>10}{'memory MB':>12}{'disk MB':>10}{'query ms':>10}")
+    started = time.perf_counter()
+    for query in queries:
+        np.argpartition(-(vectors @ query), args.k - 1)[:args.k]
+    elapsed = (time.perf_counter() - started) / len(queries) * 1000
+    size_mb = vectors.nbytes / 1024 / 1024
+    print(f"{'float32 exact':<22}{1.0:>10.4f}{size_mb:>12.1f}{size_mb:>10.1f}{elapsed:>10.2f}")
+
+    for dtype, rescore in CONFIGS:
+        with tempfile.TemporaryDirectory() as directory:
+            store = QuantizedVectorStore(directory, dtype=dtype, rescore=rescore)
+            for start in range(0, len(vectors), 10000):
+                store.add_embeddings(texts[start:start + 10000], vectors[start:start + 10000])
+            store.memory_bytes()  # 合并待写入的编码，不计入检索耗时
+            hits = 0
+            started = time.perf_counter()
+            for query, expected in zip(queries, truth):
+                found = {index for index, _ in store.search_vectors(query, args.k)}
+                hits += len(found & expected)
+            elapsed = (time.perf_counter() - started) / len(queries) * 1000
+            label = f"{dtype}" + (f" +rescore x{rescore}" if rescore else "")
+            print(f"{label:<22}{hits / (len(queries) * args.k):>10.4f}{store.memory_bytes() / 1024 / 1024:>12.1f}"
+                  f"{disk_bytes(directory) / 1024 / 1024:>10.1f}{elapsed:>10.2f}")
+
+if __name__ == "__main__":
+    main()